@@ -13,6 +13,7 @@ from datetime import datetime
 
 # Import your existing calling agent functionality
 from thecallagent.make_calls import make_call
+from thecallagent.livekit_client import close_livekit_api
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +26,11 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the shared LiveKit client"""
+    await close_livekit_api()
+
 # Add CORS middleware to allow Flutter app to connect
 app.add_middleware(
     CORSMiddleware,
@@ -221,12 +227,18 @@ async def make_call_endpoint(request: CallRequest):
             )
         
         # Call your existing make_call function
-        await make_call(phone_number)
+        call = await make_call(phone_number)
+        if call is None:
+            return CallResponse(
+                status="error",
+                message=f"Failed to initiate call to {phone_number}",
+                call_id=None
+            )
         
         return CallResponse(
             status="success",
-            message=f"Call initiated to {phone_number}",
-            call_id=f"call_{datetime.now().timestamp()}"
+            message=f"Call initiated to {phone_number} in room {call.room_name}",
+            call_id=call.call_id
         )
         
     except Exception as e:
@@ -3,11 +3,11 @@ Unified API Server for Office Assistant
 Integrates FastAPI with LangChain Agent and MCP Servers
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import asyncio
 import logging
 from datetime import datetime
@@ -19,14 +19,29 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from backend.main import create_agent_for_user
+from metrics import (AGENT_POOL_EVENTS, AGENT_POOL_SIZE, PrometheusMiddleware, compact_metrics_dir,
+                     metrics_response)
+from chat_socket import ChatSocket
+from cluster import Cluster, ClusterRoutingMiddleware
+from coalescing import TurnCoalescer
+from scheduler import TurnRejected, TurnScheduler, turn_rejected_handler
+from tracing import TracingMiddleware, setup_tracing
 
 # Import calling agent
-from thecallagent.make_calls import make_call
+from thecallagent.call_registry import CallRegistry
+from thecallagent.make_calls import outbound_trunk_id
+from thecallagent.livekit_client import close_livekit_api
+from thecallagent.campaigns import (DEFAULT_CONCURRENCY, DEFAULT_MAX_ATTEMPTS, DEFAULT_PACE_SECONDS,
+                                    DEFAULT_RETRY_DELAY_SECONDS, get_store as get_campaign_store,
+                                    run_campaign)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Export traces when TRACING_EXPORTER is set (file or otlp)
+setup_tracing("office-assistant-api")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Office Assistant Unified API",
@@ -42,6 +57,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Replicas that share users by consistent hashing (CLUSTER_REPLICAS); a no-op on a single server
+cluster = Cluster()
+app.add_middleware(ClusterRoutingMiddleware, cluster=cluster)
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_exception_handler(TurnRejected, turn_rejected_handler)
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -49,6 +70,8 @@ class ChatRequest(BaseModel):
     user_id: str
     access_token: str
     context: Optional[Dict[str, Any]] = None
+    # Chosen by the client per message and reused when it retries; retries are answered from the finished turn
+    request_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -64,43 +87,103 @@ class CallResponse(BaseModel):
     message: str
     call_id: Optional[str] = None
 
+class CampaignCall(BaseModel):
+    phone_number: str
+    context: Optional[Dict[str, Any]] = None
+
+class CampaignRequest(BaseModel):
+    calls: List[CampaignCall]
+    name: Optional[str] = None
+    concurrency: int = DEFAULT_CONCURRENCY
+    pace_seconds: float = DEFAULT_PACE_SECONDS
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    retry_delay_seconds: float = DEFAULT_RETRY_DELAY_SECONDS
+
 # Agent Pool for caching (reduces latency)
 class AgentPool:
     def __init__(self):
         self.agents = {}
         self.last_used = {}
+        # Timezone each cached agent was built with
+        self.timezones = {}
+        # Open WebSocket connections per user; pinned agents are never evicted
+        self.pinned = {}
         self.lock = asyncio.Lock()
     
-    async def get_agent(self, user_id: str, access_token: str):
-        """Get or create agent for user"""
+    async def get_agent(self, user_id: str, access_token: str, timezone: Optional[str] = None):
+        """Get or create agent for user
+
+        The agent is rebuilt when a request names a different timezone than the
+        cached agent was built with; requests without one reuse the cached agent.
+        """
         async with self.lock:
-            if user_id in self.agents:
+            cached_timezone = self.timezones.get(user_id)
+            if user_id in self.agents and (not timezone or timezone == cached_timezone):
                 logger.info(f"Reusing cached agent for user: {user_id}")
+                AGENT_POOL_EVENTS.labels(event="hit").inc()
                 self.last_used[user_id] = time.time()
                 return self.agents[user_id]
             
-            logger.info(f"Creating new agent for user: {user_id}")
-            agent = await create_agent_for_user(access_token, user_id)
+            if user_id in self.agents:
+                logger.info(f"Rebuilding agent for user {user_id}: timezone changed from {cached_timezone} to {timezone}")
+            else:
+                logger.info(f"Creating new agent for user: {user_id}")
+            AGENT_POOL_EVENTS.labels(event="miss").inc()
+            agent = await create_agent_for_user(access_token, user_id, timezone)
             self.agents[user_id] = agent
+            self.timezones[user_id] = timezone
             self.last_used[user_id] = time.time()
+            AGENT_POOL_SIZE.set(len(self.agents))
             return agent
     
+    async def pin_agent(self, user_id: str, access_token: str, timezone: Optional[str] = None):
+        """Get or create agent for user and keep it cached until unpin_agent()"""
+        agent = await self.get_agent(user_id, access_token, timezone)
+        self.pinned[user_id] = self.pinned.get(user_id, 0) + 1
+        return agent
+    
+    def unpin_agent(self, user_id: str):
+        """Release a pin; the agent then ages out like any other"""
+        remaining = self.pinned.get(user_id, 0) - 1
+        if remaining > 0:
+            self.pinned[user_id] = remaining
+        else:
+            self.pinned.pop(user_id, None)
+        if user_id in self.agents:
+            self.last_used[user_id] = time.time()
+    
     async def cleanup_old_agents(self):
         """Remove agents not used in 30 minutes"""
         cutoff = time.time() - 1800  # 30 minutes
         async with self.lock:
             to_remove = [
                 uid for uid, last_time in self.last_used.items()
-                if last_time < cutoff
+                if last_time < cutoff and uid not in self.pinned
             ]
             for uid in to_remove:
                 logger.info(f"Removing inactive agent for user: {uid}")
                 del self.agents[uid]
                 del self.last_used[uid]
+                self.timezones.pop(uid, None)
+            AGENT_POOL_EVENTS.labels(event="eviction").inc(len(to_remove))
+            AGENT_POOL_SIZE.set(len(self.agents))
 
 # Global agent pool
 agent_pool = AgentPool()
 
+# Serializes turns per thread and caps concurrent agent runs across users
+turn_scheduler = TurnScheduler()
+
+# Retries and double-taps of a turn share one execution
+turn_coalescer = TurnCoalescer()
+
+async def warm_agent(user_id: str, access_token: str, timezone: Optional[str] = None):
+    """Build a user's agent ahead of their next request (after a cluster rebalance)"""
+    try:
+        await agent_pool.get_agent(user_id, access_token, timezone)
+    except Exception as e:
+        logger.warning(f"Could not warm agent for user {user_id}: {str(e)}")
+
 # Background task for cleanup
 async def cleanup_task():
     """Periodically cleanup old agents"""
@@ -111,10 +194,24 @@ async def cleanup_task():
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks"""
+    # Fold in the metrics files of processes from a previous run
+    compact_metrics_dir()
     asyncio.create_task(cleanup_task())
+    await cluster.start(warm_agent)
+    # Pick up campaigns whose runner went away with a previous process
+    store = get_campaign_store()
+    for campaign_id in store.resumable_campaigns():
+        logger.info(f"Resuming campaign {campaign_id}")
+        start_campaign_task(campaign_id, store)
     logger.info("✅ Unified API Server started")
     logger.info("📊 Agent pool initialized")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared clients"""
+    await close_livekit_api()
+    await cluster.close()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -142,14 +239,34 @@ async def health_check():
         "agent_pool": {
             "active_agents": len(agent_pool.agents),
             "cached_users": list(agent_pool.agents.keys())
-        }
+        },
+        "turns": turn_scheduler.stats(),
+        "cluster": cluster.status()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for the API and the MCP tool servers it starts"""
+    return metrics_response()
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """
     Main chat endpoint - uses LangChain agent with MCP tools
     """
+    user_id = request.user_id
+    execution = turn_coalescer.get("chat", user_id, user_id, request.message, request.request_id)
+    if execution is None:
+        # Refuse early (429/503 with Retry-After) when the queues are full
+        turn = turn_scheduler.admit(user_id, user_id)
+        execution = turn_coalescer.start("chat", user_id, user_id, request.message, run_chat_turn(request, turn),
+                                         request.request_id)
+        # Frees the turn's queue slot if it ends before reaching the queue
+        execution.task.add_done_callback(lambda _: turn.discard())
+    return await execution.result()
+
+async def run_chat_turn(request: ChatRequest, turn) -> ChatResponse:
+    """Run one chat turn through the agent once the scheduler grants it a slot"""
     try:
         user_message = request.message.strip()
         user_id = request.user_id
@@ -157,40 +274,43 @@ async def chat_endpoint(request: ChatRequest):
         
         logger.info(f"Chat request from user {user_id}: {user_message[:50]}...")
         
-        # Get or create agent for user
-        agent = await agent_pool.get_agent(user_id, access_token)
+        # Wait for this thread's earlier turns and a free slot
+        async with turn:
+            # Get or create agent for user
+            timezone = (request.context or {}).get("timezone")
+            agent = await agent_pool.get_agent(user_id, access_token, timezone)
         
-        # Configure agent with thread ID
-        config = {"configurable": {"thread_id": user_id}}
+            # Configure agent with thread ID
+            config = {"configurable": {"thread_id": user_id}}
         
-        # Process message with agent
-        response_text = ""
-        tool_calls = []
+            # Process message with agent
+            response_text = ""
+            tool_calls = []
         
-        async for chunk in agent.astream(
-            {"messages": {"role": "user", "content": user_message}},
-            config
-        ):
-            # Extract agent messages
-            if "agent" in chunk:
-                for message in chunk["agent"].get("messages", []):
-                    if hasattr(message, 'content') and isinstance(message.content, str):
-                        response_text += message.content
+            async for chunk in agent.astream(
+                {"messages": {"role": "user", "content": user_message}},
+                config
+            ):
+                # Extract agent messages
+                if "agent" in chunk:
+                    for message in chunk["agent"].get("messages", []):
+                        if hasattr(message, 'content') and isinstance(message.content, str):
+                            response_text += message.content
                     
-                    # Track tool calls
-                    if hasattr(message, 'tool_calls') and message.tool_calls:
-                        for tool_call in message.tool_calls:
-                            tool_calls.append({
-                                "name": tool_call.get('name', 'unknown'),
-                                "args": tool_call.get('args', {})
-                            })
+                        # Track tool calls
+                        if hasattr(message, 'tool_calls') and message.tool_calls:
+                            for tool_call in message.tool_calls:
+                                tool_calls.append({
+                                    "name": tool_call.get('name', 'unknown'),
+                                    "args": tool_call.get('args', {})
+                                })
             
-            # Extract tool results
-            elif "tools" in chunk:
-                for msg in chunk["tools"].get("messages", []):
-                    if hasattr(msg, 'content'):
-                        # Tool results are included in final response
-                        pass
+                # Extract tool results
+                elif "tools" in chunk:
+                    for msg in chunk["tools"].get("messages", []):
+                        if hasattr(msg, 'content'):
+                            # Tool results are included in final response
+                            pass
         
         # If no response, provide default
         if not response_text:
@@ -217,36 +337,21 @@ async def chat_stream_endpoint(request: ChatRequest):
     """
     Streaming chat endpoint - sends responses as they're generated
     """
+    user_id = request.user_id
+    execution = turn_coalescer.get("stream", user_id, user_id, request.message, request.request_id)
+    if execution is None:
+        # Admission is checked before the stream starts so a rejection is a plain 429/503
+        turn = turn_scheduler.admit(user_id, user_id)
+        execution = turn_coalescer.start_stream("stream", user_id, user_id, request.message,
+                                                stream_chat_turn(request, turn), request.request_id)
+        # Frees the turn's queue slot if it ends before reaching the queue
+        execution.task.add_done_callback(lambda _: turn.discard())
+    
     async def generate():
         try:
-            user_message = request.message.strip()
-            user_id = request.user_id
-            access_token = request.access_token
-            
-            logger.info(f"Stream request from user {user_id}: {user_message[:50]}...")
-            
-            # Get or create agent
-            agent = await agent_pool.get_agent(user_id, access_token)
-            config = {"configurable": {"thread_id": user_id}}
-            
-            # Stream chunks
-            async for chunk in agent.astream(
-                {"messages": {"role": "user", "content": user_message}},
-                config
-            ):
-                # Send agent messages as SSE
-                if "agent" in chunk:
-                    for message in chunk["agent"].get("messages", []):
-                        if hasattr(message, 'content') and isinstance(message.content, str):
-                            # Send as Server-Sent Event
-                            yield f"data: {json.dumps({'type': 'message', 'content': message.content})}\n\n"
-                
-                # Send tool call notifications
-                if "agent" in chunk:
-                    for message in chunk["agent"].get("messages", []):
-                        if hasattr(message, 'tool_calls') and message.tool_calls:
-                            for tool_call in message.tool_calls:
-                                yield f"data: {json.dumps({'type': 'tool_call', 'name': tool_call.get('name')})}\n\n"
+            # A duplicate request gets the events sent so far, then follows along
+            async for event in execution.stream():
+                yield event
             
             # Send completion event
             yield f"data: {json.dumps({'type': 'done'})}\n\n"
@@ -257,38 +362,172 @@ async def chat_stream_endpoint(request: ChatRequest):
     
     return StreamingResponse(generate(), media_type="text/event-stream")
 
+async def stream_chat_turn(request: ChatRequest, turn):
+    """Run one chat turn through the agent, yielding its Server-Sent Events"""
+    user_message = request.message.strip()
+    user_id = request.user_id
+    access_token = request.access_token
+    
+    logger.info(f"Stream request from user {user_id}: {user_message[:50]}...")
+    
+    # Wait for this thread's earlier turns and a free slot
+    async with turn:
+        # Get or create agent
+        timezone = (request.context or {}).get("timezone")
+        agent = await agent_pool.get_agent(user_id, access_token, timezone)
+        config = {"configurable": {"thread_id": user_id}}
+    
+        # Stream chunks
+        async for chunk in agent.astream(
+            {"messages": {"role": "user", "content": user_message}},
+            config
+        ):
+            # Send agent messages as SSE
+            if "agent" in chunk:
+                for message in chunk["agent"].get("messages", []):
+                    if hasattr(message, 'content') and isinstance(message.content, str):
+                        # Send as Server-Sent Event
+                        yield f"data: {json.dumps({'type': 'message', 'content': message.content})}\n\n"
+        
+            # Send tool call notifications
+            if "agent" in chunk:
+                for message in chunk["agent"].get("messages", []):
+                    if hasattr(message, 'tool_calls') and message.tool_calls:
+                        for tool_call in message.tool_calls:
+                            yield f"data: {json.dumps({'type': 'tool_call', 'name': tool_call.get('name')})}\n\n"
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Persistent chat connection - authenticate once, then stream turns over the socket.
+    The frame protocol is described in backend/chat_socket.py.
+    """
+    await ChatSocket(websocket, agent_pool, turn_scheduler, relay=cluster.relay_socket).run()
+
+class WarmRequest(BaseModel):
+    user_id: str
+    access_token: str
+    timezone: Optional[str] = None
+
+if cluster.enabled:
+    @app.post("/internal/cluster/warm", status_code=202, include_in_schema=False)
+    async def cluster_warm(request: WarmRequest, x_office_cluster_secret: Optional[str] = Header(None)):
+        """
+        Build a user's agent in the background; sent by other replicas after a rebalance
+        """
+        if not cluster.from_peer(x_office_cluster_secret):
+            raise HTTPException(status_code=403, detail="Not a cluster replica")
+        if not cluster.schedule_warm(request.user_id, request.access_token, request.timezone):
+            raise HTTPException(status_code=429, detail="Too many agent warm-ups pending")
+        return {"status": "accepted"}
+
+# Registry of calls placed through this server
+call_registry = CallRegistry()
+
 @app.post("/api/make-call", response_model=CallResponse)
 async def make_call_endpoint(request: CallRequest):
     """
-    Endpoint to initiate phone calls using LiveKit
+    Endpoint to initiate phone calls using LiveKit.
+    
+    Returns as soon as the call is registered; follow it with
+    GET /api/calls/{call_id} or the /api/calls/{call_id}/events stream.
     """
-    try:
-        phone_number = request.phone_number.strip()
-        logger.info(f"Initiating call to: {phone_number}")
-        
-        # Validate phone number format
-        if not phone_number.startswith('+'):
-            raise HTTPException(
-                status_code=400,
-                detail="Phone number must be in international format (e.g., +1234567890)"
-            )
-        
-        # Call the make_call function
-        await make_call(phone_number)
-        
-        return CallResponse(
-            status="success",
-            message=f"Call initiated to {phone_number}",
-            call_id=f"call_{datetime.now().timestamp()}"
+    phone_number = request.phone_number.strip()
+    logger.info(f"Initiating call to: {phone_number}")
+    
+    # Validate phone number format
+    if not phone_number.startswith('+'):
+        raise HTTPException(
+            status_code=400,
+            detail="Phone number must be in international format (e.g., +1234567890)"
         )
-        
-    except Exception as e:
-        logger.error(f"Error making call: {str(e)}")
+    
+    if not outbound_trunk_id or not outbound_trunk_id.startswith("ST_"):
+        logger.error("SIP_OUTBOUND_TRUNK_ID is not set or invalid")
         return CallResponse(
             status="error",
-            message=f"Failed to initiate call: {str(e)}",
+            message="Failed to initiate call: SIP_OUTBOUND_TRUNK_ID is not set or invalid",
             call_id=None
         )
+    
+    call_id = call_registry.start_call(phone_number, outbound_trunk_id)
+    return CallResponse(
+        status="dialing",
+        message=f"Dialing {phone_number}",
+        call_id=call_id
+    )
+
+@app.get("/api/calls/{call_id}")
+async def get_call_status(call_id: str):
+    """Current state and durations of a call (by call, dispatch or SIP participant ID)"""
+    record = call_registry.get(call_id)
+    if not record:
+        raise HTTPException(status_code=404, detail=f"Call {call_id} not found")
+    return record
+
+@app.get("/api/calls/{call_id}/events")
+async def stream_call_status(call_id: str):
+    """Server-Sent Events stream of call state changes, closed when the call ends"""
+    if not call_registry.get(call_id):
+        raise HTTPException(status_code=404, detail=f"Call {call_id} not found")
+    
+    async def generate():
+        async for record in call_registry.watch(call_id):
+            if record is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(record)}\n\n"
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+# Running campaign tasks, kept referenced until they finish
+campaign_tasks = set()
+
+def start_campaign_task(campaign_id: str, store) -> None:
+    task = asyncio.create_task(run_campaign(campaign_id, store))
+    campaign_tasks.add(task)
+    task.add_done_callback(campaign_tasks.discard)
+
+@app.post("/api/campaigns")
+async def create_campaign(request: CampaignRequest):
+    """
+    Enqueue a list of numbers and start dialing them in the background
+    """
+    store = get_campaign_store()
+    try:
+        campaign_id = store.create_campaign(
+            [call.dict() for call in request.calls],
+            request.name,
+            request.concurrency,
+            request.pace_seconds,
+            request.max_attempts,
+            request.retry_delay_seconds,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    start_campaign_task(campaign_id, store)
+    
+    return store.progress(campaign_id)
+
+@app.get("/api/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, include_calls: bool = False):
+    """Poll campaign progress"""
+    progress = get_campaign_store().progress(campaign_id, include_calls)
+    if not progress:
+        raise HTTPException(status_code=404, detail=f"Campaign {campaign_id} not found")
+    return progress
+
+@app.post("/api/campaigns/{campaign_id}/cancel")
+async def cancel_campaign(campaign_id: str):
+    """Stop dialing new numbers for a campaign"""
+    store = get_campaign_store()
+    campaign = store.get_campaign(campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail=f"Campaign {campaign_id} not found")
+    if campaign["status"] not in ("completed", "failed", "cancelled"):
+        store.set_campaign_status(campaign_id, "cancelled")
+    return store.progress(campaign_id)
 
 @app.get("/api/agent-status/{user_id}")
 async def get_agent_status(user_id: str):
@@ -307,6 +546,9 @@ async def clear_agent_cache(user_id: str):
         if user_id in agent_pool.agents:
             del agent_pool.agents[user_id]
             del agent_pool.last_used[user_id]
+            agent_pool.timezones.pop(user_id, None)
+            AGENT_POOL_EVENTS.labels(event="eviction").inc()
+            AGENT_POOL_SIZE.set(len(agent_pool.agents))
             return {"status": "success", "message": f"Agent cache cleared for {user_id}"}
         else:
             return {"status": "not_found", "message": f"No cached agent for {user_id}"}
@@ -322,6 +564,6 @@ if __name__ == "__main__":
     uvicorn.run(
         app,
         host="0.0.0.0",
-        port=8000,
+        port=int(os.getenv("PORT", "8000")),
         log_level="info"
     )
@@ -5,6 +5,13 @@ Production-ready API with proper OAuth token handling.
 Supports both development (token.json) and production (OAuth credentials from Flutter).
 """
 
+# Imported first so prometheus_client starts in multiprocess mode
+from metrics import PrometheusMiddleware, compact_metrics_dir, metrics_response
+from coalescing import TurnCoalescer
+from credential_store import CredentialStore
+from scheduler import TurnRejected, TurnScheduler, turn_rejected_handler
+from tracing import TracingMiddleware, setup_tracing
+
 from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -22,6 +29,9 @@ load_dotenv()
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
+# Export traces when TRACING_EXPORTER is set (file or otlp)
+setup_tracing("office-agent-api")
+
 app = FastAPI(
     title="Office Agent API",
     description="Multi-user AI assistant for office automation",
@@ -37,6 +47,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_exception_handler(TurnRejected, turn_rejected_handler)
+
+# OAuth credentials saved from requests, encrypted at rest
+credential_store = CredentialStore()
+
+@app.on_event("startup")
+async def startup_event():
+    """Open the credential store and fold in metrics files left by a previous run"""
+    compact_metrics_dir()
+    await credential_store.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write pending credential updates before exiting"""
+    await credential_store.close()
+
+# Serializes turns per thread and caps concurrent agent runs across users
+turn_scheduler = TurnScheduler()
+
+# Retries and double-taps of a turn share one execution
+turn_coalescer = TurnCoalescer()
 
 # Request/Response Models
 class ChatRequest(BaseModel):
@@ -48,6 +81,8 @@ class ChatRequest(BaseModel):
     token_uri: Optional[str] = None
     client_id: Optional[str] = None
     client_secret: Optional[str] = None
+    # Chosen by the client per message and reused when it retries; retries are answered from the finished turn
+    request_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -74,20 +109,6 @@ def get_dev_token():
             return json.load(f)
     return None
 
-def save_user_credentials(user_id: str, token_data: dict):
-    """
-    Save user's OAuth credentials to a JSON file.
-    In production, you'd save this to a database instead.
-    """
-    creds_dir = Path(__file__).parent / "user_credentials"
-    creds_dir.mkdir(exist_ok=True)
-    
-    creds_file = creds_dir / f"{user_id}.json"
-    with open(creds_file, "w") as f:
-        json.dump(token_data, f)
-    
-    logger.info(f"Saved credentials for user: {user_id}")
-
 # Endpoints
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -98,6 +119,11 @@ async def health_check():
         environment=os.getenv("ENVIRONMENT", "development")
     )
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for the API and the MCP tool servers it starts"""
+    return metrics_response()
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
@@ -109,6 +135,19 @@ async def chat(
     DEVELOPMENT mode: Auto-loads from token.json if no credentials provided
     PRODUCTION mode: Requires OAuth credentials from Flutter
     """
+    user_id = request.user_id
+    execution = turn_coalescer.get("chat", user_id, user_id, request.message, request.request_id)
+    if execution is None:
+        # Refuse early (429/503 with Retry-After) when the queues are full
+        turn = turn_scheduler.admit(user_id, user_id)
+        execution = turn_coalescer.start("chat", user_id, user_id, request.message,
+                                         run_chat_turn(request, authorization, turn), request.request_id)
+        # Frees the turn's queue slot if credentials fail before it reaches the queue
+        execution.task.add_done_callback(lambda _: turn.discard())
+    return await execution.result()
+
+async def run_chat_turn(request: ChatRequest, authorization: Optional[str], turn) -> ChatResponse:
+    """Resolve credentials and run one chat turn once the scheduler grants it a slot"""
     try:
         # Determine token source
         token_data = None
@@ -127,8 +166,8 @@ async def chat(
                     "https://www.googleapis.com/auth/calendar"
                 ]
             }
-            # Save for future requests (in production, save to database)
-            save_user_credentials(request.user_id, token_data)
+            # Save for future requests; unchanged credentials are not rewritten
+            await credential_store.put(request.user_id, token_data)
         
         # Priority 2: Authorization header (Production - access token only)
         elif authorization and authorization.startswith("Bearer "):
@@ -136,11 +175,9 @@ async def chat(
             logger.info("Using access token from Authorization header")
             
             # Try to load saved credentials for this user
-            creds_file = Path(__file__).parent / "user_credentials" / f"{request.user_id}.json"
-            if creds_file.exists():
-                with open(creds_file) as f:
-                    token_data = json.load(f)
-                    token_data["token"] = access_token  # Update with fresh token
+            token_data = await credential_store.get(request.user_id)
+            if token_data:
+                token_data["token"] = access_token  # Update with fresh token
             else:
                 # No saved credentials - use access token only (may fail)
                 token_data = {"token": access_token}
@@ -166,19 +203,21 @@ async def chat(
         
         logger.info(f"Processing chat request for user: {request.user_id}")
         
-        # Create agent instance with user's credentials
-        # Pass the access token to the agent
-        agent = await create_agent_for_user(
-            access_token=token_data.get("token"),
-            user_id=request.user_id
-        )
-        
-        # Process message
-        config = {"configurable": {"thread_id": request.user_id}}
-        result = await agent.ainvoke(
-            {"messages": [{"role": "user", "content": request.message}]},
-            config
-        )
+        # Wait for this thread's earlier turns and a free slot
+        async with turn:
+            # Create agent instance with user's credentials
+            # Pass the access token to the agent
+            agent = await create_agent_for_user(
+                access_token=token_data.get("token"),
+                user_id=request.user_id
+            )
+            
+            # Process message
+            config = {"configurable": {"thread_id": request.user_id}}
+            result = await agent.ainvoke(
+                {"messages": [{"role": "user", "content": request.message}]},
+                config
+            )
         
         # Extract response - handle different content formats
         response_content = "No response"
@@ -0,0 +1,242 @@
+# mypy: ignore-errors
+
+"""
+Chat over a WebSocket (/ws/chat on api_server_v2.py).
+
+The connection authenticates once and keeps the user's agent pinned in the
+pool while it is open, so each turn skips the per-request HTTP, credential and
+agent lookup work of /api/chat.
+
+Frames are JSON objects with a "type".
+
+Client to server:
+    auth      {"user_id", "access_token", "context"}  must be the first frame
+    message   {"id", "message"}                        start a turn; id is chosen by the client
+    cancel    {"id"}                                   stop the running turn
+    ping / pong
+
+Server to client:
+    ready         {"user_id"}                          agent is ready for turns
+    token         {"id", "content"}                    piece of the agent's reply
+    tool_call     {"id", "name", "args"}
+    tool_result   {"id", "name", "status"}
+    done          {"id", "response", "tool_calls"}
+    cancelled     {"id"}
+    error         {"id", "message", "retry_after"?}
+    ping / pong
+
+The server pings every WS_HEARTBEAT_SECONDS (default 20) and closes the
+connection when nothing has been received for two intervals.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from metrics import WS_CONNECTIONS
+from scheduler import TurnRejected
+
+logger = logging.getLogger(__name__)
+
+AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "20"))
+# Application close code for a peer that stopped answering heartbeats
+CLOSE_HEARTBEAT_TIMEOUT = 4408
+
+
+def _text(content: Any) -> str:
+    """Text of message content, which is a string or a list of content blocks."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else block.get("text", "")
+            for block in content
+            if isinstance(block, str) or (isinstance(block, dict) and block.get("type") == "text")
+        )
+    return ""
+
+
+async def close_cancelled_tool_calls(agent, config: dict) -> None:
+    """Answer tool calls a cancelled turn left open, so the next turn starts from a valid history."""
+    state = await agent.aget_state(config)
+    messages = state.values.get("messages", [])
+    if messages and isinstance(messages[-1], AIMessage) and messages[-1].tool_calls:
+        results = [
+            ToolMessage(content="Cancelled by the user before the tool finished.",
+                        tool_call_id=call["id"], name=call["name"])
+            for call in messages[-1].tool_calls
+        ]
+        await agent.aupdate_state(config, {"messages": results}, as_node="tools")
+
+
+class ChatSocket:
+    """One /ws/chat connection: authentication, heartbeats and at most one running turn."""
+
+    def __init__(self, websocket: WebSocket, agent_pool, turn_scheduler, relay=None) -> None:
+        self.websocket = websocket
+        self.agent_pool = agent_pool
+        self.turn_scheduler = turn_scheduler
+        # relay(websocket, auth_frame) -> True when it served the connection elsewhere
+        self.relay = relay
+        self.user_id: Optional[str] = None
+        self.agent = None
+        self.turn_id: Optional[str] = None
+        self.turn_task: Optional[asyncio.Task] = None
+        self.last_received = time.monotonic()
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, frame: dict) -> None:
+        # Turn, heartbeat and receive loop all send; keep frames whole
+        async with self.send_lock:
+            try:
+                await self.websocket.send_json(frame)
+            except (WebSocketDisconnect, RuntimeError):
+                # The connection is already gone; the receive loop will notice
+                pass
+
+    async def receive(self) -> dict:
+        frame = json.loads(await self.websocket.receive_text())
+        self.last_received = time.monotonic()
+        if not isinstance(frame, dict):
+            raise ValueError("frames must be JSON objects")
+        return frame
+
+    async def run(self) -> None:
+        await self.websocket.accept()
+        try:
+            frame = await asyncio.wait_for(self.receive(), AUTH_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+            await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="auth frame expected")
+            return
+        if frame.get("type") != "auth" or not frame.get("user_id") or not frame.get("access_token"):
+            await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="auth frame expected")
+            return
+
+        if self.relay is not None and await self.relay(self.websocket, frame):
+            return
+
+        self.user_id = frame["user_id"]
+        timezone = (frame.get("context") or {}).get("timezone")
+        try:
+            self.agent = await self.agent_pool.pin_agent(self.user_id, frame["access_token"], timezone)
+        except Exception as e:
+            logger.error(f"Could not create agent for WebSocket user {self.user_id}: {str(e)}", exc_info=True)
+            await self.websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="agent unavailable")
+            return
+
+        logger.info(f"WebSocket chat opened for user {self.user_id}")
+        WS_CONNECTIONS.inc()
+        heartbeat = asyncio.create_task(self.heartbeat())
+        try:
+            await self.send({"type": "ready", "user_id": self.user_id})
+            await self.receive_loop()
+        finally:
+            heartbeat.cancel()
+            if self.turn_task and not self.turn_task.done():
+                self.turn_task.cancel()
+            self.agent_pool.unpin_agent(self.user_id)
+            WS_CONNECTIONS.dec()
+            logger.info(f"WebSocket chat closed for user {self.user_id}")
+
+    async def receive_loop(self) -> None:
+        while True:
+            try:
+                frame = await self.receive()
+            except ValueError as e:
+                await self.send({"type": "error", "id": None, "message": f"Invalid frame: {e}"})
+                continue
+            except (WebSocketDisconnect, RuntimeError):
+                # RuntimeError: the heartbeat closed the socket under us
+                return
+
+            kind = frame.get("type")
+            if kind == "message":
+                await self.start_turn(str(frame.get("id", "")), str(frame.get("message", "")).strip())
+            elif kind == "cancel":
+                if self.turn_task and not self.turn_task.done() and frame.get("id") in (None, self.turn_id):
+                    self.turn_task.cancel()
+            elif kind == "ping":
+                await self.send({"type": "pong"})
+            elif kind != "pong":
+                await self.send({"type": "error", "id": frame.get("id"), "message": f"Unknown frame type: {kind}"})
+
+    async def heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            if time.monotonic() - self.last_received > 2 * HEARTBEAT_SECONDS:
+                logger.info(f"Closing WebSocket chat for user {self.user_id}: heartbeat timed out")
+                await self.websocket.close(code=CLOSE_HEARTBEAT_TIMEOUT, reason="heartbeat timeout")
+                return
+            await self.send({"type": "ping"})
+
+    async def start_turn(self, turn_id: str, message: str) -> None:
+        if not message:
+            await self.send({"type": "error", "id": turn_id, "message": "Empty message"})
+            return
+        if self.turn_task and not self.turn_task.done():
+            await self.send({"type": "error", "id": turn_id,
+                             "message": f"Turn {self.turn_id} is still running; cancel it first"})
+            return
+        try:
+            turn = self.turn_scheduler.admit(self.user_id, self.user_id)
+        except TurnRejected as e:
+            await self.send({"type": "error", "id": turn_id, "message": str(e), "retry_after": e.retry_after})
+            return
+
+        self.turn_id = turn_id
+        self.turn_task = asyncio.create_task(self.run_turn(turn_id, message, turn))
+        # Frees the turn's queue slot if it is cancelled before it starts
+        self.turn_task.add_done_callback(lambda _: turn.discard())
+
+    async def run_turn(self, turn_id: str, message: str, turn) -> None:
+        config = {"configurable": {"thread_id": self.user_id}}
+        response_text = ""
+        tool_calls = []
+        try:
+            # Wait for this thread's earlier turns and a free slot
+            async with turn:
+                async for mode, payload in self.agent.astream(
+                    {"messages": [{"role": "user", "content": message}]},
+                    config,
+                    stream_mode=["messages", "updates"],
+                ):
+                    if mode == "messages":
+                        chunk, metadata = payload
+                        if metadata.get("langgraph_node") == "agent" and isinstance(chunk, AIMessageChunk):
+                            text = _text(chunk.content)
+                            if text:
+                                response_text += text
+                                await self.send({"type": "token", "id": turn_id, "content": text})
+                        continue
+
+                    for node, update in payload.items():
+                        for msg in (update or {}).get("messages", []):
+                            if node == "agent" and getattr(msg, "tool_calls", None):
+                                for call in msg.tool_calls:
+                                    tool_calls.append({"name": call.get("name"), "args": call.get("args", {})})
+                                    await self.send({"type": "tool_call", "id": turn_id,
+                                                     "name": call.get("name"), "args": call.get("args", {})})
+                            elif node == "tools" and isinstance(msg, ToolMessage):
+                                await self.send({"type": "tool_result", "id": turn_id,
+                                                 "name": msg.name, "status": msg.status})
+
+            await self.send({"type": "done", "id": turn_id, "response": response_text, "tool_calls": tool_calls})
+
+        except asyncio.CancelledError:
+            logger.info(f"Turn {turn_id} cancelled for user {self.user_id}")
+            try:
+                await close_cancelled_tool_calls(self.agent, config)
+            except Exception as e:
+                logger.error(f"Could not close cancelled tool calls for user {self.user_id}: {str(e)}")
+            await self.send({"type": "cancelled", "id": turn_id})
+
+        except Exception as e:
+            logger.error(f"Error in WebSocket turn for user {self.user_id}: {str(e)}", exc_info=True)
+            await self.send({"type": "error", "id": turn_id, "message": str(e)})
@@ -0,0 +1,401 @@
+# mypy: ignore-errors
+
+"""
+User affinity across several api_server_v2 replicas.
+
+Agents and their conversation memory live in one process, so every request
+of a user should reach the same replica. Each replica knows the others and
+maps user_id to an owner with a consistent hash ring; a request that lands
+on the wrong replica (e.g. through a round-robin load balancer) is forwarded
+to its owner, and /ws/chat connections are relayed after their auth frame.
+
+- Replicas check each other's /health; a replica failing two checks in a row
+  leaves the ring and only its users move to other replicas. It rejoins on
+  the first successful check. A forward that cannot connect marks the owner
+  down and goes to the next owner (possibly this replica) instead of failing.
+- When ownership changes, users seen recently get their agent built on the
+  new owner ahead of their next request (warming). The conversation memory
+  of a dead replica is lost; its users continue in a fresh thread.
+- Forwarded requests carry X-Office-Replica and are always served where they
+  arrive, so replicas that briefly disagree about the ring cannot loop.
+- Requests between replicas also carry the shared CLUSTER_SECRET in
+  X-Office-Cluster-Secret. The receiving replica honours X-Office-Replica and
+  serves /internal/cluster/warm only when it matches.
+
+Warm-ups and forwarded requests carry users' access tokens, so use https://
+URLs when replicas run on different hosts.
+
+Configuration:
+    CLUSTER_REPLICAS          comma-separated name=url pairs, e.g. a=https://10.0.0.1:8000,b=https://10.0.0.2:8000
+    CLUSTER_SELF              this replica's name (one of CLUSTER_REPLICAS)
+    CLUSTER_SECRET            shared by all replicas; required in cluster mode
+    CLUSTER_HEALTH_SECONDS    interval between health checks (default 5)
+    CLUSTER_WARM_CONCURRENCY  agents built at once for warm-ups sent by peers (default 2)
+Without CLUSTER_REPLICAS the server runs as a single replica.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from fastapi import WebSocket
+
+from metrics import CLUSTER_EVENTS
+from tracing import inject_context
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "x-office-replica"
+SECRET_HEADER = "x-office-cluster-secret"
+VIRTUAL_NODES = 128
+FAILURES_BEFORE_DOWN = 2
+# Users remembered for warming, and for how long
+WARM_USERS_MAX = 1000
+WARM_USERS_SECONDS = 1800
+# Warm-ups from peers waiting or running before new ones are refused
+WARM_PENDING_MAX = 100
+
+# Routes whose JSON body carries user_id, and routes with user_id in the path
+BODY_ROUTES = ("/api/chat", "/api/chat/stream")
+PATH_ROUTES = re.compile(r"^/api/(?:agent-status|agent-cache)/([^/]+)$")
+# Hop-by-hop headers are not forwarded
+SKIP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "upgrade"}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes, so replicas own similar shares of users."""
+
+    def __init__(self, nodes: List[str], virtual_nodes: int = VIRTUAL_NODES) -> None:
+        self.points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{i}"), node) for node in nodes for i in range(virtual_nodes)
+        )
+        self.keys = [point for point, _ in self.points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self.points:
+            return None
+        index = bisect.bisect(self.keys, _hash(key)) % len(self.points)
+        return self.points[index][1]
+
+
+def _parse_replicas(value: str) -> Dict[str, str]:
+    replicas = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, url = item.partition("=")
+        replicas[name.strip()] = url.strip().rstrip("/")
+    return replicas
+
+
+class Cluster:
+    """Replica membership, user ownership and forwarding for one replica."""
+
+    def __init__(self, replicas: Optional[Dict[str, str]] = None, self_name: Optional[str] = None,
+                 health_seconds: Optional[float] = None, secret: Optional[str] = None) -> None:
+        self.replicas = replicas if replicas is not None else _parse_replicas(os.getenv("CLUSTER_REPLICAS", ""))
+        self.self_name = self_name or os.getenv("CLUSTER_SELF", "")
+        self.enabled = len(self.replicas) > 1
+        if self.enabled and self.self_name not in self.replicas:
+            raise ValueError(f"CLUSTER_SELF={self.self_name!r} is not one of CLUSTER_REPLICAS")
+        self.secret = secret if secret is not None else os.getenv("CLUSTER_SECRET", "")
+        if self.enabled and not self.secret:
+            raise ValueError("CLUSTER_SECRET must be set when CLUSTER_REPLICAS is")
+        self.health_seconds = health_seconds or float(os.getenv("CLUSTER_HEALTH_SECONDS", "5"))
+        self.warm_slots = asyncio.Semaphore(int(os.getenv("CLUSTER_WARM_CONCURRENCY", "2")))
+        self.warm_tasks: set = set()
+
+        # Peers start out healthy; the first failed forward or health check says otherwise
+        self.healthy = set(self.replicas)
+        self.failures: Dict[str, int] = {}
+        self.ring = HashRing(sorted(self.healthy))
+        # user_id -> (access_token, timezone, last seen)
+        self.recent_users: "OrderedDict[str, Tuple[str, Optional[str], float]]" = OrderedDict()
+        self.warm_local: Optional[Callable[[str, str, Optional[str]], Awaitable[None]]] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.health_task: Optional[asyncio.Task] = None
+
+    async def start(self, warm_local: Callable[[str, str, Optional[str]], Awaitable[None]]) -> None:
+        """Start health checks; warm_local(user_id, access_token, timezone) builds an agent here."""
+        self.warm_local = warm_local
+        if not self.enabled:
+            return
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=2))
+        self.health_task = asyncio.create_task(self._check_health())
+        logger.info(f"Cluster mode: replica {self.self_name} of {', '.join(sorted(self.replicas))}")
+
+    async def close(self) -> None:
+        if self.health_task is not None:
+            self.health_task.cancel()
+        for task in self.warm_tasks:
+            task.cancel()
+        if self.session is not None:
+            await self.session.close()
+
+    def owner(self, user_id: str) -> str:
+        if not self.enabled:
+            return self.self_name
+        return self.ring.owner(user_id) or self.self_name
+
+    def is_local(self, user_id: str) -> bool:
+        return self.owner(user_id) == self.self_name
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "replica": self.self_name,
+            "healthy_replicas": sorted(self.healthy),
+            "replicas": sorted(self.replicas),
+        }
+
+    def from_peer(self, secret: Optional[str]) -> bool:
+        """Whether a request's X-Office-Cluster-Secret value proves it comes from another replica."""
+        return self.enabled and bool(secret) and hmac.compare_digest(secret, self.secret)
+
+    def _peer_headers(self) -> Dict[str, str]:
+        return {FORWARDED_HEADER: self.self_name, SECRET_HEADER: self.secret}
+
+    def remember(self, user_id: str, access_token: Optional[str], timezone: Optional[str]) -> None:
+        """Note a user's credentials so their agent can be warmed after a rebalance."""
+        if not self.enabled or not access_token:
+            return
+        self.recent_users[user_id] = (access_token, timezone, time.time())
+        self.recent_users.move_to_end(user_id)
+        while len(self.recent_users) > WARM_USERS_MAX:
+            self.recent_users.popitem(last=False)
+
+    # Membership
+
+    def _set_health(self, name: str, ok: bool) -> None:
+        if name == self.self_name:
+            return
+        if ok:
+            self.failures.pop(name, None)
+            if name not in self.healthy:
+                logger.info(f"Replica {name} is back; rebalancing")
+                CLUSTER_EVENTS.labels(event="replica_up").inc()
+                self._rebuild(self.healthy | {name})
+            return
+        self.failures[name] = self.failures.get(name, 0) + 1
+        if name in self.healthy and self.failures[name] >= FAILURES_BEFORE_DOWN:
+            logger.warning(f"Replica {name} is down; rebalancing")
+            CLUSTER_EVENTS.labels(event="replica_down").inc()
+            self._rebuild(self.healthy - {name})
+
+    def _mark_down(self, name: str) -> None:
+        """A forward to the replica failed to connect: treat it as down right away."""
+        self.failures[name] = FAILURES_BEFORE_DOWN - 1
+        self._set_health(name, False)
+
+    def _rebuild(self, healthy: set) -> None:
+        old_ring = self.ring
+        self.healthy = healthy
+        self.ring = HashRing(sorted(healthy))
+        asyncio.get_running_loop().create_task(self._warm_moved_users(old_ring))
+
+    async def _check_health(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_seconds)
+            peers = [name for name in self.replicas if name != self.self_name]
+            results = await asyncio.gather(*(self._ping(name) for name in peers))
+            for name, ok in zip(peers, results):
+                self._set_health(name, ok)
+
+    async def _ping(self, name: str) -> bool:
+        try:
+            async with self.session.get(f"{self.replicas[name]}/health",
+                                        timeout=aiohttp.ClientTimeout(total=2)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def _warm_moved_users(self, old_ring: HashRing) -> None:
+        """Build agents on the new owners of recently seen users whose owner changed."""
+        cutoff = time.time() - WARM_USERS_SECONDS
+        for user_id, (access_token, timezone, seen) in list(self.recent_users.items()):
+            if seen < cutoff:
+                continue
+            owner = self.ring.owner(user_id)
+            if owner is None or owner == old_ring.owner(user_id):
+                continue
+            try:
+                if owner == self.self_name:
+                    await self.warm_local(user_id, access_token, timezone)
+                else:
+                    async with self.session.post(
+                        f"{self.replicas[owner]}/internal/cluster/warm",
+                        json={"user_id": user_id, "access_token": access_token, "timezone": timezone},
+                        headers=self._peer_headers(),
+                        timeout=aiohttp.ClientTimeout(total=5),
+                    ) as response:
+                        response.raise_for_status()
+                CLUSTER_EVENTS.labels(event="warmed").inc()
+            except Exception as e:
+                logger.warning(f"Could not warm agent for user {user_id} on replica {owner}: {str(e)}")
+
+    def schedule_warm(self, user_id: str, access_token: str, timezone: Optional[str]) -> bool:
+        """Build an agent here in the background for a peer; False when too many warm-ups are pending."""
+        if len(self.warm_tasks) >= WARM_PENDING_MAX:
+            return False
+        task = asyncio.create_task(self._warm_when_free(user_id, access_token, timezone))
+        self.warm_tasks.add(task)
+        task.add_done_callback(self.warm_tasks.discard)
+        return True
+
+    async def _warm_when_free(self, user_id: str, access_token: str, timezone: Optional[str]) -> None:
+        async with self.warm_slots:
+            await self.warm_local(user_id, access_token, timezone)
+
+    # Forwarding
+
+    async def forward_http(self, owner: str, scope, body: bytes, send) -> bool:
+        """Proxy an HTTP request to its owner and stream the answer back; False if the owner is unreachable.
+
+        An unreachable owner is taken out of the ring before returning.
+        """
+        url = f"{self.replicas[owner]}{scope['path']}"
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]
+                   if key.decode("latin-1").lower() not in SKIP_HEADERS}
+        headers.update(self._peer_headers())
+        # The owner continues this request's trace
+        headers.update(inject_context())
+
+        try:
+            response = await self.session.request(scope["method"], url, data=body, headers=headers)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            logger.warning(f"Replica {owner} unreachable ({str(e)}); rerouting request")
+            CLUSTER_EVENTS.labels(event="forward_failed").inc()
+            self._mark_down(owner)
+            return False
+
+        CLUSTER_EVENTS.labels(event="forwarded").inc()
+        async with response:
+            await send({
+                "type": "http.response.start",
+                "status": response.status,
+                "headers": [(key.lower().encode("latin-1"), value.encode("latin-1"))
+                            for key, value in response.headers.items() if key.lower() not in SKIP_HEADERS],
+            })
+            try:
+                # Chunks are passed on as they arrive so SSE streams stay live
+                async for chunk in response.content.iter_any():
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            except aiohttp.ClientError as e:
+                logger.warning(f"Forwarded response from replica {owner} broke off: {str(e)}")
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return True
+
+    async def relay_socket(self, websocket: WebSocket, auth_frame: dict) -> bool:
+        """Relay an authenticated /ws/chat connection to the user's owner; False to serve it here."""
+        user_id = auth_frame["user_id"]
+        self.remember(user_id, auth_frame.get("access_token"), (auth_frame.get("context") or {}).get("timezone"))
+        if not self.enabled or self.from_peer(websocket.headers.get(SECRET_HEADER)) or self.is_local(user_id):
+            return False
+
+        upstream = None
+        while upstream is None:
+            owner = self.owner(user_id)
+            if owner == self.self_name:
+                return False
+            url = self.replicas[owner].replace("http", "ws", 1) + websocket.url.path
+            try:
+                upstream = await self.session.ws_connect(url, headers=self._peer_headers())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Out of the ring now, so the next pass picks the next owner
+                logger.warning(f"Replica {owner} unreachable ({str(e)}); rerouting WebSocket")
+                CLUSTER_EVENTS.labels(event="forward_failed").inc()
+                self._mark_down(owner)
+
+        CLUSTER_EVENTS.labels(event="forwarded").inc()
+        await upstream.send_str(json.dumps(auth_frame))
+
+        async def client_to_upstream():
+            while True:
+                await upstream.send_str(await websocket.receive_text())
+
+        async def upstream_to_client():
+            async for message in upstream:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    await websocket.send_text(message.data)
+            await websocket.close(code=upstream.close_code or 1000)
+
+        tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+        # Whichever side goes away first ends the relay
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await upstream.close()
+        return True
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def _replay(body: bytes, receive):
+    """receive() that hands out the already read body once, then waits for the client as usual."""
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def replay():
+        if pending:
+            return pending.pop()
+        return await receive()
+    return replay
+
+
+class ClusterRoutingMiddleware:
+    """ASGI middleware sending per-user HTTP requests to the replica that owns the user."""
+
+    def __init__(self, app, cluster: Cluster) -> None:
+        self.app = app
+        self.cluster = cluster
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.cluster.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        user_id = None
+        body = b""
+        match = PATH_ROUTES.match(scope["path"])
+        if match:
+            user_id = match.group(1)
+        elif scope["path"] in BODY_ROUTES and scope["method"] == "POST":
+            body = await _read_body(receive)
+            try:
+                payload = json.loads(body)
+                user_id = payload.get("user_id")
+                self.cluster.remember(user_id, payload.get("access_token"),
+                                      (payload.get("context") or {}).get("timezone"))
+            except (ValueError, AttributeError):
+                # Let the endpoint reject the body
+                pass
+
+            receive = _replay(body, receive)
+
+        forwarded = self.cluster.from_peer(headers.get(SECRET_HEADER.encode(), b"").decode("latin-1"))
+        # A failed forward takes the owner out of the ring, so the next owner is tried
+        while user_id and not forwarded and not self.cluster.is_local(user_id):
+            if await self.cluster.forward_http(self.cluster.owner(user_id), scope, body, send):
+                return
+        await self.app(scope, receive, send)
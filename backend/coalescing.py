@@ -0,0 +1,199 @@
+# mypy: ignore-errors
+
+"""
+Coalescing of duplicate chat turns.
+
+The Flutter client retries on timeout and users double-tap send, so the same
+turn often arrives more than once. Turns are fingerprinted by endpoint, user,
+thread and message:
+
+- A duplicate that arrives while the first is still running attaches to that
+  execution and gets the same response (or the same event stream).
+- A retry that arrives after the turn finished is answered from a
+  short-lived cache when it carries the request_id of the original request.
+  The same message sent again with a new request_id is a new turn (a second
+  "yes" to a confirmation question must run).
+- Clients that send no request_id only get a completed turn replayed within
+  a few seconds, and only while the thread has not moved on. The thread state
+  version counts the turns completed on the thread, so once another turn has
+  run the same message is executed again. A thread's version is dropped with
+  its last replayable turn, so idle threads take no memory.
+
+Executions run as their own tasks: a client that disconnects does not cancel
+the turn, and its retry picks up the result. Failed turns are never replayed.
+
+Configuration (read when the coalescer is created):
+    CHAT_REPLAY_TTL_SECONDS     how long completed turns are replayed by request_id (default 60)
+    CHAT_REPLAY_WINDOW_SECONDS  how long they are replayed by message alone (default 5)
+    CHAT_REPLAY_MAX_ENTRIES     completed turns kept for replay (default 1024)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
+
+from metrics import CHAT_TURN_DEDUP
+
+logger = logging.getLogger(__name__)
+
+
+class Execution:
+    """One run of a chat turn, shared by every request with the same fingerprint."""
+
+    def __init__(self, kind: str, user_id: str, thread_id: str, message: str,
+                 request_id: Optional[str] = None) -> None:
+        self.kind = kind
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.message = message
+        # request_ids of every request answered by this execution
+        self.request_ids = {request_id} if request_id else set()
+        self.task: Optional[asyncio.Task] = None
+        # Stream executions record every event so late subscribers can replay them
+        self.events: List[Any] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _drive(self, events: AsyncIterator[Any]) -> None:
+        try:
+            async for event in events:
+                self.events.append(event)
+                self._notify()
+        finally:
+            self.done = True
+            self._notify()
+
+    async def result(self) -> Any:
+        """Result of the turn; waiting on it does not cancel the turn for the others."""
+        return await asyncio.shield(self.task)
+
+    async def stream(self) -> AsyncIterator[Any]:
+        """Every event of the turn from the start, then new ones as they arrive."""
+        index = 0
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.done:
+                break
+            await changed.wait()
+        # Re-raise the turn's error, if any
+        await asyncio.shield(self.task)
+
+
+class TurnCoalescer:
+    """In-flight and recently completed chat turns, by fingerprint."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None, window_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None) -> None:
+        self.ttl_seconds = ttl_seconds or float(os.getenv("CHAT_REPLAY_TTL_SECONDS", "60"))
+        self.window_seconds = window_seconds or float(os.getenv("CHAT_REPLAY_WINDOW_SECONDS", "5"))
+        self.max_entries = max_entries or int(os.getenv("CHAT_REPLAY_MAX_ENTRIES", "1024"))
+
+        self.inflight: Dict[str, Execution] = {}
+        # (kind, user, request_id) -> (expires at, execution), oldest first
+        self.completed: "OrderedDict[Tuple[str, str, str], Tuple[float, Execution]]" = OrderedDict()
+        # Turns sent without a request_id: (fingerprint, thread version after the turn) -> (expires at, execution)
+        self.recent: "OrderedDict[Tuple[str, int], Tuple[float, Execution]]" = OrderedDict()
+        # (user, thread) -> (expires at, thread version), oldest first; a version expires with the
+        # replay window of the thread's last turn, after which none of its recent entries can match
+        self.versions: "OrderedDict[Tuple[str, str], Tuple[float, int]]" = OrderedDict()
+
+    @staticmethod
+    def _fingerprint(kind: str, user_id: str, thread_id: str, message: str) -> str:
+        payload = json.dumps([kind, user_id, thread_id, message.strip()])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _purge_expired(entries: OrderedDict, now: float) -> None:
+        while entries:
+            key, (expires, _) = next(iter(entries.items()))
+            if expires > now:
+                break
+            del entries[key]
+
+    def _version(self, thread: Tuple[str, str]) -> int:
+        entry = self.versions.get(thread)
+        return entry[1] if entry else 0
+
+    def get(self, kind: str, user_id: str, thread_id: str, message: str,
+            request_id: Optional[str] = None) -> Optional[Execution]:
+        """The running or replayable execution of this turn, or None if it has to run."""
+        fingerprint = self._fingerprint(kind, user_id, thread_id, message)
+        execution = self.inflight.get(fingerprint)
+        if execution is not None:
+            if request_id:
+                execution.request_ids.add(request_id)
+            CHAT_TURN_DEDUP.labels(endpoint=kind, outcome="coalesced").inc()
+            logger.info(f"Attaching duplicate {kind} turn for user {user_id} to the running one")
+            return execution
+
+        now = time.monotonic()
+        if request_id:
+            self._purge_expired(self.completed, now)
+            entry = self.completed.get((kind, user_id, request_id))
+        else:
+            self._purge_expired(self.recent, now)
+            self._purge_expired(self.versions, now)
+            entry = self.recent.get((fingerprint, self._version((user_id, thread_id))))
+        if entry is not None:
+            CHAT_TURN_DEDUP.labels(endpoint=kind, outcome="replayed").inc()
+            logger.info(f"Replaying completed {kind} turn for user {user_id}")
+            return entry[1]
+        return None
+
+    def start(self, kind: str, user_id: str, thread_id: str, message: str, turn: Awaitable[Any],
+              request_id: Optional[str] = None) -> Execution:
+        """Run `turn` (a coroutine returning the response) as a shared execution."""
+        execution = Execution(kind, user_id, thread_id, message, request_id)
+        execution.task = asyncio.ensure_future(turn)
+        return self._track(execution)
+
+    def start_stream(self, kind: str, user_id: str, thread_id: str, message: str,
+                     events: AsyncIterator[Any], request_id: Optional[str] = None) -> Execution:
+        """Run `events` (an async generator of stream events) as a shared execution."""
+        execution = Execution(kind, user_id, thread_id, message, request_id)
+        execution.task = asyncio.ensure_future(execution._drive(events))
+        return self._track(execution)
+
+    def _track(self, execution: Execution) -> Execution:
+        CHAT_TURN_DEDUP.labels(endpoint=execution.kind, outcome="executed").inc()
+        fingerprint = self._fingerprint(execution.kind, execution.user_id, execution.thread_id, execution.message)
+        self.inflight[fingerprint] = execution
+        execution.task.add_done_callback(lambda task: self._finished(fingerprint, execution, task))
+        return execution
+
+    def _finished(self, fingerprint: str, execution: Execution, task: asyncio.Task) -> None:
+        self.inflight.pop(fingerprint, None)
+        thread = (execution.user_id, execution.thread_id)
+        now = time.monotonic()
+        self._purge_expired(self.versions, now)
+        # Even a failed turn may have changed the conversation
+        version = self._version(thread) + 1
+        self.versions[thread] = (now + self.window_seconds, version)
+        self.versions.move_to_end(thread)
+
+        # Retrieving the exception also keeps asyncio from reporting it as never retrieved
+        if task.cancelled() or task.exception() is not None:
+            return
+        for request_id in execution.request_ids:
+            self._remember(self.completed, (execution.kind, execution.user_id, request_id),
+                           now + self.ttl_seconds, execution)
+        if not execution.request_ids:
+            self._remember(self.recent, (fingerprint, version), now + self.window_seconds, execution)
+
+    def _remember(self, entries: OrderedDict, key: Tuple, expires: float, execution: Execution) -> None:
+        entries[key] = (expires, execution)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
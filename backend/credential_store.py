@@ -0,0 +1,261 @@
+# mypy: ignore-errors
+
+"""
+Encrypted store for the OAuth credentials users send with their requests.
+
+- Reads are served from memory after the first lookup of a user.
+- Writes update memory at once and are persisted in the background (write
+  behind), batched every CREDENTIAL_FLUSH_SECONDS, so request handlers never
+  wait on disk or the database.
+- Credentials that did not change are not written again: each record carries
+  an HMAC of its content, compared before anything is queued.
+- Records are encrypted at rest with Fernet. CREDENTIALS_ENCRYPTION_KEY holds
+  one or more comma-separated keys; the first encrypts, all decrypt, so keys
+  can be rotated. Outside production a key is generated into
+  backend/.credentials_key when none is set.
+
+CREDENTIAL_STORE_URL selects the database: a postgresql:// URL (docker-compose
+points it at the db service) or sqlite:///<path>, by default
+backend/user_credentials.db. Plaintext files left in backend/user_credentials/
+by earlier versions are imported on first use and deleted.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).parent
+DEFAULT_STORE_URL = f"sqlite:///{BACKEND_DIR / 'user_credentials.db'}"
+DEV_KEY_FILE = BACKEND_DIR / ".credentials_key"
+LEGACY_CREDENTIALS_DIR = BACKEND_DIR / "user_credentials"
+
+# (user_id, digest, encrypted credentials)
+Record = Tuple[str, str, bytes]
+
+
+def _load_keys() -> List[bytes]:
+    keys = os.getenv("CREDENTIALS_ENCRYPTION_KEY", "")
+    if keys:
+        return [key.strip().encode() for key in keys.split(",") if key.strip()]
+    if os.getenv("ENVIRONMENT") == "production":
+        raise RuntimeError("CREDENTIALS_ENCRYPTION_KEY must be set in production")
+
+    if not DEV_KEY_FILE.exists():
+        logger.warning(f"CREDENTIALS_ENCRYPTION_KEY not set; generating a development key in {DEV_KEY_FILE}")
+        DEV_KEY_FILE.write_bytes(Fernet.generate_key())
+        DEV_KEY_FILE.chmod(0o600)
+    return [DEV_KEY_FILE.read_bytes().strip()]
+
+
+class _SQLiteBackend:
+    """SQLite file; the blocking calls run in a worker thread."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.db: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def _open(self) -> None:
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS user_credentials ("
+            "user_id TEXT PRIMARY KEY, digest TEXT NOT NULL, secret BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    def _load(self, user_id: str) -> Optional[Tuple[str, bytes]]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT digest, secret FROM user_credentials WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def _save(self, records: List[Record]) -> None:
+        now = time.time()
+        with self.lock:
+            self.db.executemany(
+                "INSERT INTO user_credentials (user_id, digest, secret, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET digest = excluded.digest, secret = excluded.secret, "
+                "updated_at = excluded.updated_at",
+                [(user_id, digest, secret, now) for user_id, digest, secret in records],
+            )
+            self.db.commit()
+
+    async def open(self) -> None:
+        await asyncio.to_thread(self._open)
+
+    async def load(self, user_id: str) -> Optional[Tuple[str, bytes]]:
+        return await asyncio.to_thread(self._load, user_id)
+
+    async def save(self, records: List[Record]) -> None:
+        await asyncio.to_thread(self._save, records)
+
+    async def close(self) -> None:
+        if self.db is not None:
+            await asyncio.to_thread(self.db.close)
+
+
+class _PostgresBackend:
+    """PostgreSQL through an asyncpg connection pool."""
+
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self.pool = None
+
+    async def open(self) -> None:
+        import asyncpg
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        await self.pool.execute(
+            "CREATE TABLE IF NOT EXISTS user_credentials ("
+            "user_id TEXT PRIMARY KEY, digest TEXT NOT NULL, secret BYTEA NOT NULL, "
+            "updated_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        )
+
+    async def load(self, user_id: str) -> Optional[Tuple[str, bytes]]:
+        row = await self.pool.fetchrow("SELECT digest, secret FROM user_credentials WHERE user_id = $1", user_id)
+        return (row["digest"], bytes(row["secret"])) if row else None
+
+    async def save(self, records: List[Record]) -> None:
+        await self.pool.executemany(
+            "INSERT INTO user_credentials (user_id, digest, secret, updated_at) VALUES ($1, $2, $3, now()) "
+            "ON CONFLICT (user_id) DO UPDATE SET digest = EXCLUDED.digest, secret = EXCLUDED.secret, "
+            "updated_at = now()",
+            records,
+        )
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+
+
+def _backend_for(url: str):
+    if url.startswith(("postgres://", "postgresql://")):
+        return _PostgresBackend(url)
+    if url.startswith("sqlite:///"):
+        return _SQLiteBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported CREDENTIAL_STORE_URL: {url}")
+
+
+class CredentialStore:
+    """In-memory credential cache with encrypted write-behind persistence."""
+
+    def __init__(self, url: Optional[str] = None, keys: Optional[List[bytes]] = None,
+                 flush_seconds: Optional[float] = None) -> None:
+        self.backend = _backend_for(url or os.getenv("CREDENTIAL_STORE_URL") or DEFAULT_STORE_URL)
+        keys = keys or _load_keys()
+        self.fernet = MultiFernet([Fernet(key) for key in keys])
+        # Digests use their own key, derived from the encryption key
+        self.digest_key = hashlib.sha256(b"credential-digest:" + base64.urlsafe_b64decode(keys[0])).digest()
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(
+            os.getenv("CREDENTIAL_FLUSH_SECONDS", "1"))
+
+        # user_id -> (digest, credentials); None marks a user known to have nothing stored
+        self.cache: Dict[str, Optional[Tuple[str, dict]]] = {}
+        self.pending: Dict[str, Record] = {}
+        self.dirty = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+
+    def _digest(self, token_data: dict) -> str:
+        canonical = json.dumps(token_data, sort_keys=True, separators=(",", ":")).encode()
+        return hmac.new(self.digest_key, canonical, hashlib.sha256).hexdigest()
+
+    async def start(self) -> None:
+        await self.backend.open()
+        self.writer = asyncio.create_task(self._write_behind())
+
+    async def close(self) -> None:
+        """Stop the writer and persist whatever is still pending."""
+        if self.writer is not None:
+            self.writer.cancel()
+            try:
+                await self.writer
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await self.backend.close()
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """Stored credentials of a user, or None."""
+        if user_id not in self.cache:
+            row = await self.backend.load(user_id)
+            if row is not None:
+                digest, secret = row
+                try:
+                    self.cache[user_id] = (digest, json.loads(self.fernet.decrypt(secret)))
+                except InvalidToken:
+                    logger.error(f"Stored credentials for user {user_id} cannot be decrypted with the current keys")
+                    self.cache[user_id] = None
+            elif not await self._import_legacy_file(user_id):
+                self.cache[user_id] = None
+
+        entry = self.cache.get(user_id)
+        return dict(entry[1]) if entry else None
+
+    async def put(self, user_id: str, token_data: dict) -> bool:
+        """Save credentials for a user; False if they are unchanged and nothing was written."""
+        digest = self._digest(token_data)
+        if user_id not in self.cache:
+            await self.get(user_id)
+        entry = self.cache.get(user_id)
+        if entry is not None and entry[0] == digest:
+            return False
+
+        self.cache[user_id] = (digest, dict(token_data))
+        self.pending[user_id] = (user_id, digest, self.fernet.encrypt(json.dumps(token_data).encode()))
+        self.dirty.set()
+        logger.info(f"Queued credential update for user: {user_id}")
+        return True
+
+    async def flush(self) -> None:
+        """Write all pending updates now."""
+        if not self.pending:
+            return
+        records = list(self.pending.values())
+        self.pending.clear()
+        try:
+            await self.backend.save(records)
+        except Exception:
+            # Keep the batch unless a newer update for the same user arrived meanwhile
+            for record in records:
+                self.pending.setdefault(record[0], record)
+            raise
+
+    async def _write_behind(self) -> None:
+        while True:
+            await self.dirty.wait()
+            # Let a burst of updates collect into one batch
+            await asyncio.sleep(self.flush_seconds)
+            self.dirty.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to persist credentials, will retry: {str(e)}", exc_info=True)
+                self.dirty.set()
+
+    async def _import_legacy_file(self, user_id: str) -> bool:
+        """Move a plaintext credentials file from older versions into the store."""
+        legacy_file = LEGACY_CREDENTIALS_DIR / f"{user_id}.json"
+        # User IDs come from requests; never let one point outside the directory
+        if legacy_file.parent != LEGACY_CREDENTIALS_DIR or not await asyncio.to_thread(legacy_file.exists):
+            return False
+        token_data = json.loads(await asyncio.to_thread(legacy_file.read_text))
+        self.cache[user_id] = None
+        await self.put(user_id, token_data)
+        await self.flush()
+        await asyncio.to_thread(legacy_file.unlink)
+        logger.info(f"Imported plaintext credentials for user {user_id} into the encrypted store")
+        return True
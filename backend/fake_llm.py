@@ -0,0 +1,158 @@
+# mypy: ignore-errors
+
+"""
+Deterministic stand-in for the Gemini chat model, for benchmarks and load tests.
+
+FakeChatModel follows a script: the first keyword found in the user's message
+picks a list of steps, each step one or more tool calls made in parallel.
+After the last step's tool results come back the model answers with a fixed
+number of tokens. Messages that match no keyword are answered without tools.
+Tools the agent was not given are skipped, so any script works with any tool
+set.
+
+Latency is simulated per call (time to first token) and per streamed token,
+and usage metadata is reported so token metrics behave as with the real
+model. Enable it in backend/main.py with LLM_FAKE=1; LLM_FAKE_<FIELD>
+environment variables override FakeLLMConfig fields.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+# keyword -> steps; each step is a list of {"name", "args"} tool calls made together
+DEFAULT_SCRIPT: Dict[str, List[List[Dict[str, Any]]]] = {
+    "brief": [[{"name": "list_emails", "args": {"max_results": 5}},
+               {"name": "list_events", "args": {"max_results": 5}}]],
+    "email": [[{"name": "list_emails", "args": {"max_results": 5}}]],
+    "label": [[{"name": "list_emails", "args": {"max_results": 3}}],
+              [{"name": "modify_emails", "args": {"message_ids": "msg00000,msg00001", "add_labels": "Receipts"}}]],
+    "meeting": [[{"name": "list_events", "args": {"max_results": 10}}]],
+    "free": [[{"name": "find_free_slots", "args": {"time_min": "tomorrow 9am", "time_max": "tomorrow 5pm"}}]],
+    "schedule": [[{"name": "find_free_slots", "args": {"time_min": "tomorrow 9am", "time_max": "tomorrow 5pm"}}],
+                 [{"name": "create_event", "args": {"summary": "Sync", "start": "tomorrow 3pm",
+                                                     "end": "tomorrow 3:30pm"}}]],
+}
+
+
+@dataclass
+class FakeLLMConfig:
+    """Latencies are in seconds."""
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+    answer_tokens: int = 40
+    # Prompt tokens reported per message in the conversation
+    tokens_per_message: int = 50
+    script: Dict[str, List[List[Dict[str, Any]]]] = field(default_factory=lambda: dict(DEFAULT_SCRIPT))
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMConfig":
+        """Read overrides from LLM_FAKE_<FIELD> environment variables (the script as JSON)."""
+        config = cls()
+        for name, value in vars(config).items():
+            env_value = os.getenv(f"LLM_FAKE_{name.upper()}")
+            if env_value is not None:
+                if name == "script":
+                    cast = json.loads
+                elif isinstance(value, int):
+                    cast = int
+                else:
+                    cast = float
+                setattr(config, name, cast(env_value))
+        return config
+
+
+class FakeChatModel(BaseChatModel):
+    """Scripted chat model with tool calling and token streaming."""
+
+    config: FakeLLMConfig = Field(default_factory=FakeLLMConfig)
+    tool_names: Optional[List[str]] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": "fake"}
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(tool, "name", None) or tool.get("name") for tool in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        """Next message of the script for this conversation."""
+        turn_start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        human = messages[turn_start].content if turn_start >= 0 else ""
+        text = human if isinstance(human, str) else json.dumps(human)
+        # Each AI message with tool calls since the user's message completed one step
+        step = sum(1 for m in messages[turn_start + 1:] if isinstance(m, AIMessage) and m.tool_calls)
+        tool_results = sum(1 for m in messages[turn_start + 1:] if isinstance(m, ToolMessage))
+
+        steps = next((steps for keyword, steps in self.config.script.items() if keyword in text.lower()), [])
+        usage = {"input_tokens": self.config.tokens_per_message * len(messages),
+                 "output_tokens": 0, "total_tokens": 0}
+        digest = hashlib.sha256(f"{len(messages)}:{text}".encode()).hexdigest()[:12]
+
+        while step < len(steps):
+            calls = [call for call in steps[step]
+                     if self.tool_names is None or call["name"] in self.tool_names]
+            if calls:
+                tool_calls = [{"name": call["name"], "args": dict(call.get("args", {})), "id": f"call_{digest}_{i}",
+                               "type": "tool_call"} for i, call in enumerate(calls)]
+                usage["output_tokens"] = 10 * len(tool_calls)
+                usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+                return AIMessage(content="", tool_calls=tool_calls, usage_metadata=usage)
+            step += 1
+
+        words = " ".join(f"word{i}" for i in range(self.config.answer_tokens))
+        content = f"Done after {tool_results} tool result(s): {words}"
+        usage["output_tokens"] = self.config.answer_tokens
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return AIMessage(content=content, usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._reply(messages)
+        time.sleep(self.config.first_token_latency + self.config.token_latency * self._tokens(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._reply(messages)
+        await asyncio.sleep(self.config.first_token_latency + self.config.token_latency * self._tokens(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._reply(messages)
+        await asyncio.sleep(self.config.first_token_latency)
+        if message.tool_calls:
+            chunk = AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ], usage_metadata=message.usage_metadata)
+            if run_manager:
+                await run_manager.on_llm_new_token("", chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+            return
+
+        tokens = message.content.split(" ")
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.config.token_latency)
+            text = token if i == 0 else f" {token}"
+            chunk = AIMessageChunk(content=text, usage_metadata=message.usage_metadata if i == 0 else None)
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    @staticmethod
+    def _tokens(message: AIMessage) -> int:
+        return len(message.content.split()) if message.content else len(message.tool_calls)
@@ -2,6 +2,15 @@
 
 import asyncio
 import os
+import sys
+import time
+
+# Sibling modules are imported top-level, also when loaded as backend.main
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Imported first so prometheus_client starts in multiprocess mode
+from metrics import AGENT_BUILD_SECONDS, LLMMetricsCallback
+from tracing import AgentTracingCallback, load_traced_mcp_tools
+
 from langchain_google_genai import ChatGoogleGenerativeAI # type: ignore
 from dotenv import load_dotenv
 from langgraph.prebuilt import create_react_agent # type: ignore
@@ -13,29 +22,39 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Ensure API key is set via environment (load from .env)
-if not os.getenv("GOOGLE_API_KEY"):
-    raise EnvironmentError("GOOGLE_API_KEY not set in environment. Please add it to .env file.")
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    temperature=0.7,
-    max_output_tokens=512,
-)
+if os.getenv("LLM_FAKE") == "1":
+    # Scripted offline model for benchmarks (benchmarks/load_chat.py)
+    from fake_llm import FakeChatModel, FakeLLMConfig
+
+    llm = FakeChatModel(config=FakeLLMConfig.from_env(), callbacks=[LLMMetricsCallback("fake")])
+else:
+    # Ensure API key is set via environment (load from .env)
+    if not os.getenv("GOOGLE_API_KEY"):
+        raise EnvironmentError("GOOGLE_API_KEY not set in environment. Please add it to .env file.")
+
+    llm = ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0.7,
+        max_output_tokens=512,
+        callbacks=[LLMMetricsCallback("gemini-2.5-flash")],
+    )
 
-async def create_agent_for_user(access_token: str, user_id: str):
+async def create_agent_for_user(access_token: str, user_id: str, timezone: str = None):
     """
     Create an agent instance with user-specific credentials.
     
     Args:
         access_token: Google OAuth access token for the user
         user_id: Unique identifier for the user
+        timezone: Optional IANA timezone (e.g. "Europe/London") used by the
+            calendar tools to interpret dates like "tomorrow at 3pm"
         
     Returns:
         Configured LangGraph agent
     """
     logger.info(f"Creating agent for user: {user_id}")
+    started = time.perf_counter()
     
     # Determine base paths for MCP servers
     # In Docker: /app, Locally: parent of backend directory
@@ -63,13 +82,15 @@ async def create_agent_for_user(access_token: str, user_id: str):
             "env": {
                 "GOOGLE_ACCESS_TOKEN": access_token,
                 "USER_ID": user_id,
-                **dict(os.environ)
+                **dict(os.environ),
+                **({"USER_TIMEZONE": timezone} if timezone else {})
             }
         },
         "call_agent": {
             "transport": "stdio",
             "command": "uv",
-            "args": ["run", f"{base_path}/thecallagent/server.py"],
+            # Run as a module so thecallagent's package imports resolve
+            "args": ["run", "--directory", base_path, "python", "-m", "thecallagent.server"],
             "env": {
                 "GOOGLE_ACCESS_TOKEN": access_token,
                 "USER_ID": user_id,
@@ -78,7 +99,7 @@ async def create_agent_for_user(access_token: str, user_id: str):
         }
     })
 
-    tools = await client.get_tools()
+    tools = await load_traced_mcp_tools(client)
     logger.info(f"Loaded {len(tools)} tools for user {user_id}")
 
     model = llm
@@ -87,8 +108,9 @@ async def create_agent_for_user(access_token: str, user_id: str):
         model=model,
         tools=tools,
         checkpointer=MemorySaver()
-    )
+    ).with_config(callbacks=[AgentTracingCallback()])
 
+    AGENT_BUILD_SECONDS.observe(time.perf_counter() - started)
     return agent
 
 def print_stream_item(item):
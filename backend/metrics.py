@@ -0,0 +1,247 @@
+# mypy: ignore-errors
+
+"""
+Prometheus metrics for the API servers (backend/api.py and api_server_v2.py).
+
+prometheus_client runs in multiprocess mode: the directory is exported as
+PROMETHEUS_MULTIPROC_DIR before prometheus_client is imported, and the MCP
+server processes the agent spawns inherit it, so their tool metrics
+(common/tool_metrics.py) show up on the API's /metrics next to its own.
+Import this module before anything else that imports prometheus_client.
+
+Every process writes its own files, and the MCP servers run as a new process
+for each tool call, so compact_metrics_dir() merges the files of processes
+that have exited into one archive file per metric type. It runs at startup
+and before each scrape. The directory is never cleared here, since other API
+processes may share it: launchers clear it before starting the servers
+(start_cluster.sh does), otherwise totals carry over from the previous run.
+"""
+
+import fcntl
+import glob
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+from uuid import UUID
+
+METRICS_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "office-assistant-metrics")),
+)
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+from fastapi import Response  # noqa: E402
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+from langchain_core.outputs import LLMResult  # noqa: E402
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,  # noqa: E402
+                               generate_latest, multiprocess)
+from prometheus_client.mmap_dict import MmapedDict  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by endpoint",
+    ["method", "endpoint", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+AGENT_BUILD_SECONDS = Histogram(
+    "agent_build_seconds",
+    "Time to build an agent for a user (MCP tool discovery and graph setup)",
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0),
+)
+
+AGENT_POOL_EVENTS = Counter(
+    "agent_pool_events_total",
+    "Agent pool lookups and removals",
+    ["event"],
+)
+
+AGENT_POOL_SIZE = Gauge(
+    "agent_pool_size",
+    "Agents currently cached in the pool",
+    multiprocess_mode="livesum",
+)
+
+TURN_QUEUE_WAIT_SECONDS = Histogram(
+    "chat_turn_queue_wait_seconds",
+    "Time a chat turn waited for a scheduler slot",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+TURN_QUEUE_DEPTH = Gauge(
+    "chat_turn_queue_depth",
+    "Chat turns waiting for a scheduler slot",
+    multiprocess_mode="livesum",
+)
+
+TURNS_REJECTED = Counter(
+    "chat_turns_rejected_total",
+    "Chat turns refused by admission control",
+    ["reason"],
+)
+
+CHAT_TURN_DEDUP = Counter(
+    "chat_turn_dedup_total",
+    "Chat turns by whether they ran, joined a running duplicate or were replayed",
+    ["endpoint", "outcome"],
+)
+
+WS_CONNECTIONS = Gauge(
+    "chat_websocket_connections",
+    "Open /ws/chat connections",
+    multiprocess_mode="livesum",
+)
+
+CLUSTER_EVENTS = Counter(
+    "cluster_events_total",
+    "Requests forwarded to other replicas, replica health changes and agents warmed after a rebalance",
+    ["event"],
+)
+
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds",
+    "Duration of LLM calls made by the agent",
+    ["model", "status"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0),
+)
+
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens used by LLM calls",
+    ["model", "type"],
+)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """LangChain callback that records LLM call latency and token usage."""
+
+    # Run in the caller's event loop instead of a thread pool
+    run_inline = True
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs) -> None:
+        self.started[run_id] = time.perf_counter()
+
+    def _observe(self, run_id: UUID, status: str) -> None:
+        started = self.started.pop(run_id, None)
+        if started is not None:
+            LLM_LATENCY.labels(model=self.model, status=status).observe(time.perf_counter() - started)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        self._observe(run_id, "ok")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                LLM_TOKENS.labels(model=self.model, type="input").inc(usage.get("input_tokens", 0))
+                LLM_TOKENS.labels(model=self.model, type="output").inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._observe(run_id, "error")
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording latency and in-flight count of every HTTP request.
+
+    Requests are labelled with the route template (e.g. /api/calls/{call_id}),
+    so path parameters do not create new series.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.labels(method=method).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.labels(method=method).dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            endpoint: Optional[str] = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(method=method, endpoint=endpoint, status=str(status["code"])).observe(
+                time.perf_counter() - started
+            )
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def compact_metrics_dir(path: str = METRICS_DIR) -> int:
+    """Merge the files of exited processes into <type>_archive.db; returns how many files were removed.
+
+    Counter, histogram and summary values add up across processes, so they are
+    summed into the archive. Live gauges of exited processes no longer count
+    and their files are deleted; other gauge files are left alone.
+    """
+    removed = 0
+    with open(os.path.join(path, ".compact.lock"), "w") as lock:
+        # One compaction at a time per directory, also across API processes
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for file_path in glob.glob(os.path.join(path, "*.db")):
+            parts = os.path.basename(file_path)[:-len(".db")].split("_")
+            typ, pid = parts[0], parts[-1]
+            if not pid.isdigit() or _process_alive(int(pid)):
+                continue
+            if typ == "gauge":
+                if parts[1].startswith("live"):
+                    os.remove(file_path)
+                    removed += 1
+                continue
+            archive = MmapedDict(os.path.join(path, f"{typ}_archive.db"))
+            try:
+                for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(file_path):
+                    archived, _ = archive.read_value(key)
+                    archive.write_value(key, archived + value, timestamp)
+            finally:
+                archive.close()
+            os.remove(file_path)
+            removed += 1
+    return removed
+
+
+def metrics_response() -> Response:
+    """Render metrics from this process and every MCP server process in Prometheus text format."""
+    try:
+        compact_metrics_dir()
+    except OSError as e:
+        logger.warning(f"Could not compact metrics files: {e}")
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=METRICS_DIR)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
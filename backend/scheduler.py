@@ -0,0 +1,253 @@
+# mypy: ignore-errors
+
+"""
+Scheduler for agent turns across users and conversation threads.
+
+- Turns on the same thread run one at a time, in arrival order, so two
+  requests never drive the same checkpointed conversation concurrently.
+- At most `max_concurrent` turns run at once across all users.
+- When a slot frees up, it goes to the waiting user with the lowest virtual
+  pass (stride scheduling): each turn advances its user's pass by 1/weight,
+  so a user with weight 2 gets twice the turns of a weight-1 user while both
+  have work queued, and a user with one request is not stuck behind another
+  user's backlog.
+- Admission control: a user with too many waiting turns is refused with 429,
+  and a full global queue with 503. Both carry a Retry-After estimate.
+  admit() reserves the waiting slot right away, so a burst that arrives
+  before any of its turns runs is limited too; a turn that will not run after
+  all must give it back with turn.discard().
+
+Configuration (read when the scheduler is created):
+    CHAT_MAX_CONCURRENT_TURNS   turns running at once (default 8)
+    CHAT_MAX_QUEUED_TURNS       waiting turns across all users before 503 (default 64)
+    CHAT_MAX_QUEUED_PER_USER    waiting turns per user before 429 (default 4)
+    CHAT_USER_WEIGHTS           JSON object of user_id -> weight > 0 (default weight 1)
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from metrics import TURN_QUEUE_DEPTH, TURN_QUEUE_WAIT_SECONDS, TURNS_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Initial guess for the average turn duration, used by Retry-After until turns have completed
+INITIAL_TURN_SECONDS = 5.0
+# Weight of the newest sample in the turn duration moving average
+TURN_SECONDS_ALPHA = 0.2
+
+
+class TurnRejected(Exception):
+    """Raised by TurnScheduler.admit when a turn cannot be queued."""
+
+    def __init__(self, status_code: int, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+async def turn_rejected_handler(request: Request, exc: TurnRejected) -> JSONResponse:
+    """FastAPI exception handler: answer with the rejection status and Retry-After."""
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+class _UserState:
+    def __init__(self, weight: float, pass_value: float) -> None:
+        self.weight = weight
+        self.pass_value = pass_value
+        self.waiting = 0
+        self.running = 0
+
+
+class Turn:
+    """One admitted turn; `async with turn:` waits for its slot and holds it for the body."""
+
+    def __init__(self, scheduler: "TurnScheduler", user_id: str, thread_id: str) -> None:
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.thread_id = thread_id
+        # Holds a waiting slot from admit() until the turn is queued or discarded
+        self.reserved = True
+        self.arrived = 0.0
+        self.granted: Optional[asyncio.Future] = None
+        self.started = 0.0
+
+    def discard(self) -> None:
+        """Give back the waiting slot of a turn that will not run; a no-op once `async with turn` started."""
+        if self.reserved:
+            self.scheduler._unreserve(self)
+
+    async def __aenter__(self) -> "Turn":
+        await self.scheduler._acquire(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.scheduler._release(self)
+
+
+class TurnScheduler:
+    """Per-thread FIFO turn queues with a global concurrency cap and weighted fair sharing."""
+
+    def __init__(self, max_concurrent: Optional[int] = None, max_queued: Optional[int] = None,
+                 max_queued_per_user: Optional[int] = None, weights: Optional[Dict[str, float]] = None) -> None:
+        self.max_concurrent = max_concurrent or int(os.getenv("CHAT_MAX_CONCURRENT_TURNS", "8"))
+        self.max_queued = max_queued or int(os.getenv("CHAT_MAX_QUEUED_TURNS", "64"))
+        self.max_queued_per_user = max_queued_per_user or int(os.getenv("CHAT_MAX_QUEUED_PER_USER", "4"))
+        weights = weights if weights is not None else json.loads(os.getenv("CHAT_USER_WEIGHTS") or "{}")
+        self.weights = {user_id: float(weight) for user_id, weight in weights.items()}
+        for user_id, weight in self.weights.items():
+            if not weight > 0:
+                raise ValueError(f"CHAT_USER_WEIGHTS: weight of {user_id} must be greater than 0, got {weight}")
+
+        self.threads: Dict[Tuple[str, str], Deque[Turn]] = {}
+        self.running_threads: set = set()
+        self.users: Dict[str, _UserState] = {}
+        self.running = 0
+        self.waiting = 0
+        # Pass of the most recently scheduled user; users becoming active start here
+        self.virtual_time = 0.0
+        self.avg_turn_seconds = INITIAL_TURN_SECONDS
+
+    def _retry_after(self, queued_ahead: int, slots: int) -> int:
+        return max(1, math.ceil(self.avg_turn_seconds * (queued_ahead + 1) / max(slots, 1)))
+
+    def admit(self, user_id: str, thread_id: str) -> Turn:
+        """Check queue limits for a new turn; raises TurnRejected (429/503) if it would wait too long."""
+        user = self.users.get(user_id)
+        user_waiting = user.waiting if user else 0
+
+        if user_waiting >= self.max_queued_per_user:
+            TURNS_REJECTED.labels(reason="user_queue_full").inc()
+            logger.warning(f"Rejecting turn for user {user_id}: {user_waiting} turns already queued")
+            # The user's turns mostly queue behind each other on the same thread
+            raise TurnRejected(429, f"Too many requests queued for user {user_id}",
+                               self._retry_after(user_waiting, 1))
+        if self.waiting >= self.max_queued:
+            TURNS_REJECTED.labels(reason="server_busy").inc()
+            logger.warning(f"Rejecting turn for user {user_id}: global queue full ({self.waiting} waiting)")
+            raise TurnRejected(503, "Server is busy, please retry shortly",
+                               self._retry_after(self.waiting, self.max_concurrent))
+
+        if user is None:
+            user = self.users[user_id] = _UserState(self.weights.get(user_id, 1.0), self.virtual_time)
+        user.waiting += 1
+        self.waiting += 1
+        TURN_QUEUE_DEPTH.set(self.waiting)
+        return Turn(self, user_id, thread_id)
+
+    def stats(self) -> dict:
+        """Current load, for health checks."""
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "active_users": len(self.users),
+            "avg_turn_seconds": round(self.avg_turn_seconds, 2),
+        }
+
+    async def _acquire(self, turn: Turn) -> None:
+        if not turn.reserved:
+            raise RuntimeError("Turn was already used or discarded")
+        # The waiting slot reserved by admit() now belongs to the queued turn
+        turn.reserved = False
+        turn.arrived = time.monotonic()
+        turn.granted = asyncio.get_running_loop().create_future()
+        self.threads.setdefault((turn.user_id, turn.thread_id), deque()).append(turn)
+        self._dispatch()
+
+        try:
+            await turn.granted
+        except asyncio.CancelledError:
+            if turn.granted.done() and not turn.granted.cancelled():
+                # Granted just as the caller went away: hand the slot on
+                self._release(turn)
+            else:
+                self._withdraw(turn)
+            raise
+
+        turn.started = time.monotonic()
+        TURN_QUEUE_WAIT_SECONDS.observe(turn.started - turn.arrived)
+
+    def _unreserve(self, turn: Turn) -> None:
+        """Give back the waiting slot of an admitted turn that was never queued."""
+        turn.reserved = False
+        self.users[turn.user_id].waiting -= 1
+        self.waiting -= 1
+        TURN_QUEUE_DEPTH.set(self.waiting)
+        self._forget_if_idle(turn.user_id)
+
+    def _withdraw(self, turn: Turn) -> None:
+        """Remove a turn that was cancelled while still waiting."""
+        key = (turn.user_id, turn.thread_id)
+        queue = self.threads.get(key)
+        if queue is not None and turn in queue:
+            queue.remove(turn)
+            if not queue:
+                del self.threads[key]
+            self.users[turn.user_id].waiting -= 1
+            self.waiting -= 1
+            TURN_QUEUE_DEPTH.set(self.waiting)
+            self._forget_if_idle(turn.user_id)
+
+    def _release(self, turn: Turn) -> None:
+        if turn.started:
+            duration = time.monotonic() - turn.started
+            self.avg_turn_seconds += TURN_SECONDS_ALPHA * (duration - self.avg_turn_seconds)
+        self.running -= 1
+        self.running_threads.discard((turn.user_id, turn.thread_id))
+        self.users[turn.user_id].running -= 1
+        self._forget_if_idle(turn.user_id)
+        self._dispatch()
+
+    def _forget_if_idle(self, user_id: str) -> None:
+        user = self.users.get(user_id)
+        if user and not user.waiting and not user.running:
+            # An idle user rejoins at the current virtual time instead of with saved-up credit
+            del self.users[user_id]
+
+    def _dispatch(self) -> None:
+        """Start waiting turns while slots are free."""
+        while self.running < self.max_concurrent:
+            # Head of every thread queue whose thread is idle, grouped by user
+            best = None
+            for key, queue in self.threads.items():
+                if key in self.running_threads:
+                    continue
+                user = self.users[key[0]]
+                rank = (user.pass_value, queue[0].arrived)
+                if best is None or rank < best[0]:
+                    best = (rank, key)
+            if best is None:
+                return
+
+            key = best[1]
+            queue = self.threads[key]
+            turn = queue.popleft()
+            if not queue:
+                del self.threads[key]
+
+            user = self.users[turn.user_id]
+            user.waiting -= 1
+            self.waiting -= 1
+            TURN_QUEUE_DEPTH.set(self.waiting)
+            if turn.granted.cancelled():
+                # The caller went away and has not withdrawn the turn yet
+                self._forget_if_idle(turn.user_id)
+                continue
+
+            self.virtual_time = max(self.virtual_time, user.pass_value)
+            user.pass_value += 1.0 / user.weight
+            user.running += 1
+            self.running += 1
+            self.running_threads.add(key)
+            turn.granted.set_result(True)
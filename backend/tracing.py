@@ -0,0 +1,247 @@
+# mypy: ignore-errors
+
+"""
+OpenTelemetry spans for the API side of a chat turn.
+
+- TracingMiddleware: one server span per HTTP request
+- AgentTracingCallback: a span for each LangGraph node, LLM call and tool call
+- load_traced_mcp_tools: MCP tools that hand the trace context to the server
+
+Tool schemas are kept in the shared cache (common/cache.py), so building an
+agent does not start every MCP server just to list its tools once any worker
+on the host has done so.
+
+The exporter is configured by setup_tracing() in common/telemetry.py; spans
+are dropped unless TRACING_EXPORTER is set.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List
+from uuid import UUID
+
+# common/ sits next to gmail/ and calendar/ (the repo root locally, /app in Docker)
+BASE_PATH = "/app" if os.path.exists("/app/gmail") else os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_PATH, "common"))
+
+from langchain_core.callbacks import BaseCallbackHandler  # noqa: E402
+from langchain_core.runnables.config import var_child_runnable_config  # noqa: E402
+from langchain_core.tools import BaseTool  # noqa: E402
+from langchain_mcp_adapters.client import MultiServerMCPClient  # noqa: E402
+from langchain_mcp_adapters.sessions import create_session  # noqa: E402
+from langchain_mcp_adapters.tools import (_convert_call_tool_result, _list_all_tools,  # noqa: E402
+                                          convert_mcp_tool_to_langchain_tool)
+from mcp.types import Tool  # noqa: E402
+from opentelemetry import propagate, trace  # noqa: E402
+from opentelemetry.trace import SpanKind, Status, StatusCode  # noqa: E402
+
+from cache import shared_cache  # noqa: E402
+from telemetry import inject_context, setup_tracing, tracer  # noqa: E402,F401
+
+# Schemas are also keyed by the server script's modification time, so an edit shows up at once
+TOOL_SCHEMA_TTL = float(os.getenv("CACHE_TOOL_SCHEMA_TTL_SECONDS", "86400"))
+
+
+class TracingMiddleware:
+    """ASGI middleware that wraps every HTTP request in a server span.
+
+    An incoming traceparent header is continued; spans are named after the
+    route template once the router has matched the request.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            context=propagate.extract(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
+                span.set_attribute("http.response.status_code", status["code"])
+                if status["code"] >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+
+# Open spans by LangChain run ID, shared so tool coroutines can find their run's span
+_run_spans: Dict[UUID, trace.Span] = {}
+
+
+def _run_context():
+    """Trace context of the LangChain run the caller executes in, or None for the current context."""
+    config = var_child_runnable_config.get() or {}
+    run_id = getattr(config.get("callbacks"), "parent_run_id", None)
+    span = _run_spans.get(run_id)
+    return trace.set_span_in_context(span) if span is not None else None
+
+
+class AgentTracingCallback(BaseCallbackHandler):
+    """LangChain callback that opens a span for each graph node, LLM call and tool call.
+
+    Spans are parented by run ID rather than made current, since LangGraph may
+    end a run in a different asyncio context than it started it in. Runs that
+    get no span of their own (the runnables a node is built from) are skipped
+    over when looking up a parent.
+    """
+
+    # Run in the caller's task so the root span picks up the HTTP request span
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.parents: Dict[UUID, UUID] = {}
+
+    def _parent_context(self, parent_run_id: UUID):
+        while parent_run_id is not None:
+            if parent_run_id in _run_spans:
+                return trace.set_span_in_context(_run_spans[parent_run_id])
+            parent_run_id = self.parents.get(parent_run_id)
+        return None
+
+    def _start(self, run_id: UUID, parent_run_id: UUID, name: str, attributes: dict) -> None:
+        _run_spans[run_id] = tracer.start_span(name, context=self._parent_context(parent_run_id),
+                                               attributes=attributes)
+
+    def _end(self, run_id: UUID, error: BaseException = None) -> None:
+        self.parents.pop(run_id, None)
+        span = _run_spans.pop(run_id, None)
+        if span is None:
+            return
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, type(error).__name__))
+        span.end()
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID = None,
+                       metadata: dict = None, **kwargs) -> None:
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if parent_run_id is None:
+            self._start(run_id, None, "agent run", {"langgraph.thread_id": str(metadata.get("thread_id", ""))})
+        elif node and kwargs.get("name") == node:
+            self._start(run_id, parent_run_id, f"node {node}",
+                        {"langgraph.node": node, "langgraph.step": metadata.get("langgraph_step", -1)})
+        else:
+            self.parents[run_id] = parent_run_id
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: UUID = None,
+                            metadata: dict = None, **kwargs) -> None:
+        model = (metadata or {}).get("ls_model_name", "")
+        self._start(run_id, parent_run_id, f"llm {model}".strip(), {"gen_ai.request.model": model})
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        span = _run_spans.get(run_id)
+        if span is not None:
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    span.set_attribute("gen_ai.usage.input_tokens", usage.get("input_tokens", 0))
+                    span.set_attribute("gen_ai.usage.output_tokens", usage.get("output_tokens", 0))
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: UUID = None, **kwargs) -> None:
+        name = (serialized or {}).get("name", "unknown")
+        self._start(run_id, parent_run_id, f"tool {name}", {"tool.name": name})
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._end(run_id, error)
+
+
+def _traced_tool_coroutine(server: str, tool_name: str, connection: dict):
+    """Tool coroutine that opens an MCP session and sends the trace context in `_meta`."""
+
+    async def call_tool(**arguments):
+        with tracer.start_as_current_span(
+            f"mcp {server}/{tool_name}",
+            context=_run_context(),
+            kind=SpanKind.CLIENT,
+            attributes={"mcp.server": server, "mcp.tool": tool_name},
+        ) as span:
+            async with create_session(connection) as session:
+                await session.initialize()
+                # Separates server start-up from the call itself
+                span.add_event("session initialized")
+                result = await session.call_tool(tool_name, arguments, meta=inject_context())
+            if result.isError:
+                span.set_status(Status(StatusCode.ERROR))
+        return _convert_call_tool_result(result)
+
+    return call_tool
+
+
+def _tool_schema_key(server: str, connection: dict) -> str:
+    """Shared cache key for a server's tool list; the environment (user tokens) is left out."""
+    command = [connection.get("command", ""), *connection.get("args", [])]
+    mtimes = [os.path.getmtime(arg) for arg in command if arg.endswith(".py") and os.path.exists(arg)]
+    digest = hashlib.sha256(json.dumps([command, mtimes]).encode()).hexdigest()[:16]
+    return f"mcp-tools:{server}:{digest}"
+
+
+async def _list_server_tools(server: str, connection: dict) -> List[Tool]:
+    """A server's tool definitions, from the shared cache or by starting the server."""
+    cache = shared_cache()
+    key = _tool_schema_key(server, connection)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return [Tool.model_validate(tool) for tool in cached]
+
+    async with create_session(connection) as session:
+        await session.initialize()
+        tools = await _list_all_tools(session)
+    await asyncio.to_thread(cache.set, key, [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools],
+                            TOOL_SCHEMA_TTL)
+    return tools
+
+
+async def load_traced_mcp_tools(client: MultiServerMCPClient) -> List[BaseTool]:
+    """Load every server's tools with calls that carry the current trace context.
+
+    langchain-mcp-adapters starts a session per call but cannot add request
+    metadata, so each tool's coroutine is replaced with one that does.
+    """
+    names = list(client.connections)
+    loaded = await asyncio.gather(*(_list_server_tools(name, client.connections[name]) for name in names))
+
+    tools = []
+    for name, server_tools in zip(names, loaded):
+        connection = client.connections[name]
+        for mcp_tool in server_tools:
+            tool = convert_mcp_tool_to_langchain_tool(None, mcp_tool, connection=connection)
+            tool.coroutine = _traced_tool_coroutine(name, tool.name, connection)
+            tools.append(tool)
+    return tools
@@ -0,0 +1,141 @@
+"""
+Microbenchmark: calendar datetime parsing, legacy implementation vs datetime_parser.
+
+Runs a mix of ISO strings and natural-language phrases through the old
+dateutil-based _parse_datetime (copied below unchanged) and through the new
+regex fast path, both cold (memo cleared before each call) and warm.
+
+Usage:
+    uv run benchmarks/bench_datetime_parser.py [--number 2000]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from dateutil import parser as date_parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "calendar"))
+import datetime_parser  # noqa: E402
+
+# Silence the legacy parser's error logging during the run
+logging.disable(logging.CRITICAL)
+
+INPUTS = [
+    "2024-12-01T10:00:00",
+    "2024-12-01T10:00:00Z",
+    "2024-12-01",
+    "now",
+    "today",
+    "tomorrow",
+    "tomorrow at 12pm",
+    "tomorrow afternoon",
+    "next tuesday 3pm",
+    "in 2 hours",
+    "end of day",
+    "Dec 15 at 10am",
+]
+
+
+def legacy_parse_datetime(dt_string: str) -> str:
+    """Parse various datetime formats and return ISO format."""
+    try:
+        # Handle special keywords
+        dt_string_lower = dt_string.lower().strip()
+        
+        if dt_string_lower == "now":
+            dt = datetime.utcnow()
+        elif dt_string_lower == "today":
+            dt = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        elif dt_string_lower == "tomorrow":
+            dt = (datetime.utcnow() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            # Handle compound expressions like "tomorrow at 12pm", "tomorrow afternoon"
+            if "tomorrow" in dt_string_lower:
+                # Get tomorrow's date
+                tomorrow = datetime.utcnow() + timedelta(days=1)
+                
+                # Try to extract time from the string
+                # Remove "tomorrow" and "at" to get just the time part
+                time_part = dt_string_lower.replace("tomorrow", "").replace("at", "").strip()
+                
+                if time_part:
+                    # Parse just the time part
+                    try:
+                        time_dt = date_parser.parse(time_part, fuzzy=True)
+                        # Combine tomorrow's date with the parsed time
+                        dt = tomorrow.replace(
+                            hour=time_dt.hour,
+                            minute=time_dt.minute,
+                            second=0,
+                            microsecond=0
+                        )
+                    except:
+                        # If time parsing fails, use tomorrow at midnight
+                        dt = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
+                else:
+                    dt = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
+            else:
+                # Try to parse the datetime string with fuzzy parsing
+                dt = date_parser.parse(dt_string, fuzzy=True)
+            
+            # If the parsed date is in the past and the string contains "tomorrow", add a day
+            if "tomorrow" in dt_string_lower and dt < datetime.utcnow():
+                dt = dt + timedelta(days=1)
+        
+        return dt.isoformat()
+    except Exception as e:
+        logging.error(f"Failed to parse datetime '{dt_string}': {e}")
+        # Return current time as fallback
+        return datetime.utcnow().isoformat()
+
+
+
+def new_parse_datetime(dt_string: str) -> str:
+    return datetime_parser.parse_datetime(dt_string, "Asia/Kolkata").isoformat()
+
+
+def new_parse_datetime_cold(dt_string: str) -> str:
+    datetime_parser.clear_cache()
+    return new_parse_datetime(dt_string)
+
+
+def bench(func, number: int) -> float:
+    """Return the mean time per call in microseconds over all inputs."""
+    total = 0.0
+    for text in INPUTS:
+        total += timeit.timeit(lambda: func(text), number=number)
+    return total / (number * len(INPUTS)) * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--number", type=int, default=2000, help="Calls per input")
+    args = arg_parser.parse_args()
+
+    print("=" * 80)
+    print(f"Datetime parsing microbenchmark ({len(INPUTS)} inputs x {args.number} calls)")
+    print("=" * 80)
+
+    results = {
+        "legacy (dateutil fuzzy)": bench(legacy_parse_datetime, args.number),
+        "new, cold memo": bench(new_parse_datetime_cold, args.number),
+        "new, warm memo": bench(new_parse_datetime, args.number),
+    }
+    baseline = results["legacy (dateutil fuzzy)"]
+    for name, usec in results.items():
+        print(f"{name:28} {usec:10.2f} us/call   {baseline / usec:6.1f}x")
+
+    print("\nPer-input (legacy -> new, cold):")
+    for text in INPUTS:
+        legacy = timeit.timeit(lambda: legacy_parse_datetime(text), number=args.number) / args.number * 1e6
+        new = timeit.timeit(lambda: new_parse_datetime_cold(text), number=args.number) / args.number * 1e6
+        print(f"  {text!r:24} {legacy:9.2f} us -> {new:8.2f} us")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
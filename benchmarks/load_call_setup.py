@@ -0,0 +1,172 @@
+"""
+Load test: concurrent outbound call setups against the offline LiveKit stand-in.
+
+Places batches of simultaneous calls at increasing concurrency levels and
+reports setup latency percentiles, throughput and failures per level, plus the
+highest level that stays within the latency SLO. Nothing leaves the machine:
+LiveKit and the SIP trunk are replaced by thecallagent/fake_livekit.py.
+
+Modes:
+    direct    livekit_client.start_outbound_call (dispatch + SIP dial)
+    registry  CallRegistry.start_call, timed until the call is connected
+    api       POST /api/make-call on api_server_v2, timed until connected
+
+Usage:
+    uv run benchmarks/load_call_setup.py [--mode direct] [--levels 10,50,100,200]
+        [--sip-latency 0.15] [--max-concurrent-setups 0] [--error-rate 0]
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("CALL_STORE_DB", os.path.join(tempfile.mkdtemp(), "calls.db"))
+
+from thecallagent import livekit_client  # noqa: E402
+from thecallagent.fake_livekit import FakeConfig, FakeLiveKitAPI  # noqa: E402
+
+TRUNK_ID = "ST_loadtest"
+
+# Keep per-call logging out of the report
+logging.disable(logging.CRITICAL)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)), 1) - 1]
+
+
+async def setup_direct(i):
+    await livekit_client.start_outbound_call(f"+1555{i:07d}", TRUNK_ID)
+
+
+async def wait_connected(registry, call_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = registry.get(call_id)
+        if record["status"] == "connected":
+            return
+        if record["status"] in ("ended", "failed"):
+            raise RuntimeError(record["error"] or record["status"])
+        await asyncio.sleep(0.02)
+    raise TimeoutError("call did not connect")
+
+
+def make_registry_setup(timeout):
+    from thecallagent import call_registry
+    from thecallagent.call_registry import CallRegistry
+    call_registry.TRACK_POLL_SECONDS = 0.05
+    registry = CallRegistry()
+
+    async def setup(i):
+        call_id = registry.start_call(f"+1555{i:07d}", TRUNK_ID)
+        await wait_connected(registry, call_id, timeout)
+
+    return setup
+
+
+def make_api_setup(timeout):
+    import httpx
+    import api_server_v2
+    from thecallagent import call_registry
+    call_registry.TRACK_POLL_SECONDS = 0.05
+    api_server_v2.outbound_trunk_id = TRUNK_ID
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api_server_v2.app), base_url="http://loadtest")
+
+    async def setup(i):
+        response = await client.post("/api/make-call", json={"phone_number": f"+1555{i:07d}"})
+        body = response.json()
+        if response.status_code != 200 or not body.get("call_id"):
+            raise RuntimeError(body.get("message") or response.status_code)
+        await wait_connected(api_server_v2.call_registry, body["call_id"], timeout)
+
+    return setup
+
+
+async def run_level(setup, concurrency, offset):
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await setup(offset + i)
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--mode", choices=("direct", "registry", "api"), default="direct")
+    arg_parser.add_argument("--levels", default="10,50,100,200,500", help="Comma-separated concurrency levels")
+    arg_parser.add_argument("--slo-ms", type=float, default=2000, help="p95 setup latency target")
+    arg_parser.add_argument("--dispatch-latency", type=float, default=0.05)
+    arg_parser.add_argument("--sip-latency", type=float, default=0.15)
+    arg_parser.add_argument("--ring-seconds", type=float, default=0.5)
+    arg_parser.add_argument("--max-concurrent-setups", type=int, default=0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    config = FakeConfig(
+        dispatch_latency=args.dispatch_latency,
+        sip_latency=args.sip_latency,
+        ring_seconds=args.ring_seconds,
+        talk_seconds=60,
+        error_rate=args.error_rate,
+        max_concurrent_setups=args.max_concurrent_setups,
+        seed=args.seed,
+    )
+    fake = FakeLiveKitAPI(config)
+    livekit_client.set_livekit_api(fake)
+
+    if args.mode == "direct":
+        setup = setup_direct
+    elif args.mode == "registry":
+        setup = make_registry_setup(timeout=30)
+    else:
+        setup = make_api_setup(timeout=30)
+
+    levels = [int(level) for level in args.levels.split(",")]
+    print("=" * 80)
+    print(f"Call setup load test ({args.mode}), SIP latency {args.sip_latency * 1000:.0f} ms, "
+          f"trunk capacity {args.max_concurrent_setups or 'unlimited'}")
+    print("=" * 80)
+    print(f"{'concurrency':>11} {'ok':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls/s':>9}")
+
+    sustained = 0
+    offset = 0
+    for level in levels:
+        latencies, errors, elapsed = await run_level(setup, level, offset)
+        offset += level
+        if latencies:
+            p50, p95, p99 = (percentile(latencies, pct) * 1000 for pct in (50, 95, 99))
+        else:
+            p50 = p95 = p99 = float("nan")
+        print(f"{level:>11} {len(latencies):>6} {errors:>6} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f} "
+              f"{len(latencies) / elapsed:>9.1f}")
+        if latencies and p95 <= args.slo_ms and errors <= level * 0.01:
+            sustained = level
+
+    print("-" * 80)
+    print(f"Highest level within p95 <= {args.slo_ms:.0f} ms and <= 1% errors: {sustained or 'none'}")
+    print(f"Fake server: {fake.stats.dispatches} dispatches, {fake.stats.sip_calls} SIP calls, "
+          f"peak {fake.stats.peak_concurrent_setups} concurrent setups, failures {fake.stats.failures or 0}")
+    print("=" * 80)
+    await livekit_client.close_livekit_api()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,277 @@
+"""
+Load test: /api/chat and /api/chat/stream with a scripted LLM and fake Google APIs.
+
+Runs api_server_v2 in this process on a local port with the scripted chat
+model (backend/fake_llm.py, LLM_FAKE=1) and the MCP servers pointed at an
+offline Gmail/Calendar stand-in (common/fake_google.py), then sends batches of
+concurrent chat turns for a pool of users at increasing concurrency levels.
+Nothing leaves the machine. Each turn still starts the real MCP servers for
+its tool calls, so tool overhead is measured as in production.
+
+Reports per level: requests served, rejections (429/503 from the turn
+scheduler), errors, latency percentiles, time to the first event on the
+stream endpoint, throughput and tool calls. Before the levels run every user
+gets one warm-up turn, which builds the agents; the growth in resident
+memory over that phase is reported per agent. An extra user is warmed up
+first and left out, so one-time imports and caches are not counted.
+
+With --url the load goes to a server that is already running instead (start
+it with LLM_FAKE=1 and GOOGLE_API_ENDPOINT set, e.g. to a fake started with
+python common/fake_google.py); memory per agent is then not measured.
+
+Messages cycle through --messages; keywords pick the fake model's tool script
+("email", "meeting", "brief", "free", "schedule", "label"; anything else needs
+no tools). Every message gets a unique suffix so duplicate-turn coalescing
+does not answer it from another request.
+
+Usage:
+    uv run benchmarks/load_chat.py [--endpoint chat|stream] [--users 20] [--levels 1,5,10,20]
+        [--requests 100] [--llm-latency 0.3] [--google-latency 0.05]
+        [--messages "any new email?,meetings today?,hello"] [--url http://localhost:8000]
+
+The MCP servers log to stderr; add 2>/dev/null for a clean report.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "common"))
+
+import httpx  # noqa: E402
+
+from fake_google import FakeGoogleConfig, FakeGoogleServer  # noqa: E402
+
+# Keep per-request logging out of the report
+logging.disable(logging.CRITICAL)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)), 1) - 1]
+
+
+def rss_bytes():
+    """Current resident set size (peak size where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def chat_request(i, users, messages):
+    user = i % users
+    return {
+        "message": f"{messages[i % len(messages)]} (#{i})",
+        "user_id": f"bench-user-{user}",
+        "access_token": f"bench-token-{user}",
+        "context": {"timezone": "UTC"},
+    }
+
+
+class Result:
+    def __init__(self):
+        self.latencies = []
+        self.first_events = []
+        self.rejected = 0
+        self.errors = 0
+        self.tool_calls = 0
+
+
+async def send_chat(client, body, result):
+    started = time.perf_counter()
+    response = await client.post("/api/chat", json=body)
+    if response.status_code in (429, 503):
+        result.rejected += 1
+        return
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    result.latencies.append(time.perf_counter() - started)
+    result.tool_calls += len(response.json().get("metadata", {}).get("tool_calls", []))
+
+
+async def send_stream(client, body, result):
+    started = time.perf_counter()
+    first_event = None
+    async with client.stream("POST", "/api/chat/stream", json=body) as response:
+        if response.status_code in (429, 503):
+            result.rejected += 1
+            return
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if first_event is None:
+                first_event = time.perf_counter() - started
+            if event.get("type") == "error":
+                raise RuntimeError(event.get("message"))
+            if event.get("type") == "tool_call":
+                result.tool_calls += 1
+    result.latencies.append(time.perf_counter() - started)
+    result.first_events.append(first_event)
+
+
+async def run_level(client, send, concurrency, requests, offset, users, messages):
+    result = Result()
+    next_request = iter(range(offset, offset + requests))
+
+    async def worker():
+        for i in next_request:
+            try:
+                await send(client, chat_request(i, users, messages), result)
+            except Exception:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return result, time.perf_counter() - started
+
+
+async def start_local_server():
+    """api_server_v2 under uvicorn on a free local port; returns (server, serve task, base URL)."""
+    import uvicorn
+    import api_server_v2
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    config = uvicorn.Config(api_server_v2.app, log_level="critical", lifespan="on")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+async def warm_up(client, send, users, messages):
+    """One turn per user, building every agent; returns (seconds, resident memory growth)."""
+    result = Result()
+    await send(client, {"message": "hello", "user_id": "bench-prime", "access_token": "bench-token-prime",
+                        "context": {"timezone": "UTC"}}, result)
+    gc.collect()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    for user in range(users):
+        body = chat_request(user, users, messages)
+        body["message"] = f"hello (warm-up {user})"
+        try:
+            await send(client, body, result)
+        except Exception as e:
+            print(f"Warm-up failed for bench-user-{user}: {e}")
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    return elapsed, rss_bytes() - rss_before
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--endpoint", choices=("chat", "stream"), default="chat")
+    arg_parser.add_argument("--users", type=int, default=20)
+    arg_parser.add_argument("--levels", default="1,5,10,20", help="Comma-separated concurrency levels")
+    arg_parser.add_argument("--requests", type=int, default=100, help="Requests per level")
+    arg_parser.add_argument("--messages", default="any new email?,what meetings do I have?,morning brief,hello",
+                            help="Comma-separated messages, sent in turn")
+    arg_parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake model time to first token")
+    arg_parser.add_argument("--token-latency", type=float, default=0.01, help="Fake model time per token")
+    arg_parser.add_argument("--answer-tokens", type=int, default=40)
+    arg_parser.add_argument("--google-latency", type=float, default=0.05)
+    arg_parser.add_argument("--google-error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--url", help="Load an already running server instead of starting one")
+    arg_parser.add_argument("--timeout", type=float, default=300)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    messages = [message.strip() for message in args.messages.split(",") if message.strip()]
+    send = send_chat if args.endpoint == "chat" else send_stream
+
+    fake_google = None
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        fake_google = FakeGoogleServer(FakeGoogleConfig(latency=args.google_latency,
+                                                        error_rate=args.google_error_rate,
+                                                        seed=args.seed)).start()
+        state_dir = tempfile.mkdtemp(prefix="load-chat-")
+        # Inherited by the MCP servers the agents start
+        os.environ.update({
+            "LLM_FAKE": "1",
+            "LLM_FAKE_FIRST_TOKEN_LATENCY": str(args.llm_latency),
+            "LLM_FAKE_TOKEN_LATENCY": str(args.token_latency),
+            "LLM_FAKE_ANSWER_TOKENS": str(args.answer_tokens),
+            "GOOGLE_API_ENDPOINT": fake_google.url,
+            "METRICS_DIR": os.path.join(state_dir, "metrics"),
+            "GOOGLE_RATE_LIMIT_DIR": os.path.join(state_dir, "ratelimit"),
+            "CALENDAR_MIRROR_DB": os.path.join(state_dir, "event_store.db"),
+            "CACHE_URL": os.getenv("CACHE_URL") or f"sqlite:///{os.path.join(state_dir, 'cache.db')}",
+        })
+        server, serve_task, base_url = await start_local_server()
+
+    client = httpx.AsyncClient(base_url=base_url, timeout=args.timeout,
+                               limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+    levels = [int(level) for level in args.levels.split(",")]
+
+    print("=" * 90)
+    target = (f"against {args.url}" if args.url else
+              f"LLM latency {args.llm_latency * 1000:.0f} ms, Google latency {args.google_latency * 1000:.0f} ms")
+    print(f"Chat load test (/api/{'chat' if args.endpoint == 'chat' else 'chat/stream'}), {args.users} users, "
+          f"{args.requests} requests per level, {target}")
+    print("=" * 90)
+
+    warm_seconds, rss_growth = await warm_up(client, send, args.users, messages)
+    print(f"Warm-up: {args.users} agents in {warm_seconds:.1f} s ({warm_seconds / args.users * 1000:.0f} ms per user)")
+    if server is not None:
+        print(f"Memory per agent: {rss_growth / args.users / 1024:.0f} KiB resident")
+    print("-" * 90)
+
+    first_event_column = f" {'first p50':>9}" if args.endpoint == "stream" else ""
+    print(f"{'concurrency':>11} {'ok':>6} {'rejected':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8}{first_event_column} {'turns/s':>8} {'tools':>6}")
+
+    offset = args.users
+    for level in levels:
+        result, elapsed = await run_level(client, send, level, args.requests, offset, args.users, messages)
+        offset += args.requests
+        if result.latencies:
+            p50, p95, p99 = (percentile(result.latencies, pct) * 1000 for pct in (50, 95, 99))
+        else:
+            p50 = p95 = p99 = float("nan")
+        first_event = ""
+        if args.endpoint == "stream":
+            samples = [sample for sample in result.first_events if sample is not None]
+            first_event = f" {percentile(samples, 50) * 1000 if samples else float('nan'):>9.0f}"
+        print(f"{level:>11} {len(result.latencies):>6} {result.rejected:>8} {result.errors:>6} {p50:>8.0f} "
+              f"{p95:>8.0f} {p99:>8.0f}{first_event} {len(result.latencies) / elapsed:>8.2f} "
+              f"{result.tool_calls:>6}")
+
+    print("-" * 90)
+    if fake_google is not None:
+        stats = fake_google.stats
+        print(f"Fake Google APIs: {sum(stats.requests.values())} requests, peak {stats.peak_active} concurrent, "
+              f"{stats.errors} errors injected")
+    print("=" * 90)
+
+    await client.aclose()
+    if server is not None:
+        server.should_exit = True
+        await serve_task
+    if fake_google is not None:
+        fake_google.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
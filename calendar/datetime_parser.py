@@ -0,0 +1,194 @@
+"""
+Natural-language datetime parsing for the calendar tools.
+
+ISO 8601 strings and the relative phrases the agent produces most often
+("tomorrow at 3pm", "next Tuesday 10:30", "in 2 hours", "end of day") are
+handled by precompiled regexes; anything else falls through to dateutil.
+Results are timezone-aware in the user's timezone and memoized. Unparseable
+input raises DateParseError instead of silently turning into "now".
+"""
+
+import re
+from datetime import datetime, timedelta, time as dt_time, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+from dateutil import parser as date_parser
+
+
+class DateParseError(ValueError):
+    """Raised when a datetime string cannot be understood."""
+
+
+WEEKDAYS = {
+    "mon": 0, "monday": 0,
+    "tue": 1, "tues": 1, "tuesday": 1,
+    "wed": 2, "wednesday": 2,
+    "thu": 3, "thur": 3, "thurs": 3, "thursday": 3,
+    "fri": 4, "friday": 4,
+    "sat": 5, "saturday": 5,
+    "sun": 6, "sunday": 6,
+}
+
+DAY_OFFSETS = {"yesterday": -1, "today": 0, "tonight": 0, "tomorrow": 1}
+
+NAMED_TIMES = {
+    "morning": dt_time(9, 0),
+    "noon": dt_time(12, 0),
+    "midday": dt_time(12, 0),
+    "afternoon": dt_time(14, 0),
+    "evening": dt_time(18, 0),
+    "tonight": dt_time(20, 0),
+    "night": dt_time(20, 0),
+    "midnight": dt_time(0, 0),
+    "eod": dt_time(23, 59, 59),
+    "end of day": dt_time(23, 59, 59),
+    "start of day": dt_time(0, 0),
+}
+
+UNITS = {
+    "min": "minutes", "mins": "minutes", "minute": "minutes", "minutes": "minutes",
+    "hr": "hours", "hrs": "hours", "hour": "hours", "hours": "hours",
+    "day": "days", "days": "days",
+    "week": "weeks", "weeks": "weeks",
+}
+
+_TIME = r"(?:(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)|(?P<hour24>\d{1,2}):(?P<minute24>\d{2})|(?P<named>" + \
+    "|".join(sorted(NAMED_TIMES, key=len, reverse=True)) + r"))"
+_DAY = r"(?:(?P<dayword>yesterday|today|tonight|tomorrow)|(?:(?P<modifier>next|this|coming)\s+)?(?P<weekday>" + \
+    "|".join(sorted(WEEKDAYS, key=len, reverse=True)) + r"))"
+
+ISO_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?(?:z|[+-]\d{2}:?\d{2})?$"
+)
+DAY_TIME_RE = re.compile(rf"^{_DAY}(?:\s+(?:at\s+|in the\s+)?{_TIME})?$")
+TIME_DAY_RE = re.compile(rf"^(?:at\s+)?{_TIME}(?:\s+(?:on\s+)?{_DAY})?$")
+OFFSET_RE = re.compile(
+    r"^(?:in\s+(?P<amount>\d+|an?|one)\s+(?P<unit>[a-z]+)|(?P<ago_amount>\d+|an?|one)\s+(?P<ago_unit>[a-z]+)\s+ago)$"
+)
+END_OF_WEEK_RE = re.compile(r"^(?:end of (?:the )?week|eow)$")
+
+
+def _resolve_time(match: re.Match) -> Optional[dt_time]:
+    if match.group("named"):
+        return NAMED_TIMES[match.group("named")]
+    if match.group("hour24") is not None:
+        hour, minute = int(match.group("hour24")), int(match.group("minute24"))
+    elif match.group("hour") is not None:
+        hour, minute = int(match.group("hour")), int(match.group("minute") or 0)
+        if not 1 <= hour <= 12:
+            raise DateParseError(f"Invalid 12-hour time: {match.group(0)}")
+        hour = hour % 12 + (12 if match.group("ampm") == "pm" else 0)
+    else:
+        return None
+    if hour > 23 or minute > 59:
+        raise DateParseError(f"Invalid time of day: {match.group(0)}")
+    return dt_time(hour, minute)
+
+
+def _resolve_day(match: re.Match, anchor: datetime) -> datetime:
+    """Return midnight of the day the match refers to.
+
+    A bare weekday means its next occurrence including today; "next <weekday>"
+    always means a later day.
+    """
+    midnight = anchor.replace(hour=0, minute=0, second=0, microsecond=0)
+    if match.group("dayword"):
+        return midnight + timedelta(days=DAY_OFFSETS[match.group("dayword")])
+    if match.group("weekday"):
+        days_ahead = (WEEKDAYS[match.group("weekday")] - anchor.weekday()) % 7
+        if days_ahead == 0 and match.group("modifier") == "next":
+            days_ahead = 7
+        return midnight + timedelta(days=days_ahead)
+    return midnight
+
+
+def _combine(day: datetime, at: Optional[dt_time], default: dt_time) -> datetime:
+    at = at or default
+    return day.replace(hour=at.hour, minute=at.minute, second=at.second)
+
+
+@lru_cache(maxsize=1024)
+def _parse_iso(text: str, tz_name: str) -> datetime:
+    try:
+        dt = datetime.fromisoformat(text.upper().replace("Z", "+00:00"))
+    except ValueError as error:
+        raise DateParseError(f"Invalid ISO datetime '{text}': {error}") from error
+    tz = ZoneInfo(tz_name)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=tz)
+    return dt.astimezone(tz)
+
+
+@lru_cache(maxsize=1024)
+def _parse_relative(text: str, tz_name: str, anchor: datetime) -> datetime:
+    match = DAY_TIME_RE.match(text)
+    if match:
+        default = NAMED_TIMES["tonight"] if match.group("dayword") == "tonight" else dt_time(0, 0)
+        return _combine(_resolve_day(match, anchor), _resolve_time(match), default)
+
+    match = TIME_DAY_RE.match(text)
+    if match:
+        return _combine(_resolve_day(match, anchor), _resolve_time(match), dt_time(0, 0))
+
+    match = OFFSET_RE.match(text)
+    if match:
+        amount = match.group("amount") or match.group("ago_amount")
+        unit = UNITS.get(match.group("unit") or match.group("ago_unit"))
+        if not unit:
+            raise DateParseError(f"Unknown time unit in '{text}'")
+        count = 1 if amount in ("a", "an", "one") else int(amount)
+        delta = timedelta(**{unit: count})
+        if match.group("ago_amount"):
+            delta = -delta
+        # Offsets are elapsed time, so do the arithmetic in UTC to stay correct across DST
+        return (anchor.astimezone(timezone.utc) + delta).astimezone(anchor.tzinfo)
+
+    if END_OF_WEEK_RE.match(text):
+        sunday = anchor + timedelta(days=6 - anchor.weekday())
+        return _combine(sunday, NAMED_TIMES["eod"], NAMED_TIMES["eod"])
+
+    # Slow path: absolute dates such as "Dec 15 at 10am" or "15/12/2024 14:00"
+    default = anchor.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    try:
+        dt = date_parser.parse(text, default=default)
+    except (ValueError, OverflowError) as error:
+        raise DateParseError(f"Could not understand date/time '{text}'") from error
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=ZoneInfo(tz_name))
+    return dt.astimezone(ZoneInfo(tz_name))
+
+
+def parse_datetime(text: str, tz_name: str = "UTC", now: Optional[datetime] = None) -> datetime:
+    """Parse an ISO or natural-language datetime into an aware datetime in tz_name.
+
+    Args:
+        text: Input such as "2024-12-01T10:00:00", "tomorrow at 3pm", "next tuesday 10:30",
+              "in 2 hours", "end of day" or "Dec 15 at 10am".
+        tz_name: IANA timezone used for naive input and relative phrases.
+        now: Reference time for relative phrases (default: the current time).
+
+    Raises:
+        DateParseError: If the input cannot be parsed.
+    """
+    if not text or not text.strip():
+        raise DateParseError("Empty date/time")
+
+    normalized = " ".join(text.lower().split())
+    if ISO_RE.match(normalized):
+        return _parse_iso(normalized, tz_name)
+
+    tz = ZoneInfo(tz_name)
+    now = now.astimezone(tz) if now else datetime.now(tz)
+    if normalized == "now":
+        return now
+
+    # Relative phrases are memoized per minute of the reference time
+    return _parse_relative(normalized, tz_name, now.replace(second=0, microsecond=0))
+
+
+def clear_cache() -> None:
+    """Drop memoized parse results."""
+    _parse_iso.cache_clear()
+    _parse_relative.cache_clear()
@@ -0,0 +1,262 @@
+"""
+Local incremental mirror of Google Calendar events.
+
+Each (user, calendar) pair is fully synced once and then kept current with
+events.list(syncToken=...) deltas. The mirror lives in SQLite because the MCP
+client starts a fresh server process for every tool call, so an in-memory
+copy would never be warm.
+
+A calendar can be mirrored in two shapes: expanded instances
+(singleEvents=True, the default) or recurring series, where masters and their
+exceptions are stored once and expanded locally (see recurrence.py).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+# Largest page size accepted by events.list
+SYNC_PAGE_SIZE = 2500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_key TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    sync_token TEXT,
+    synced_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_key, calendar_id)
+);
+CREATE TABLE IF NOT EXISTS events (
+    user_key TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    search_text TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_key, calendar_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS events_by_start ON events (user_key, calendar_id, start_ts);
+"""
+
+
+def to_timestamp(value: str) -> float:
+    """Convert an RFC3339 datetime or an all-day date to a UTC epoch timestamp.
+
+    Naive values are treated as UTC, matching how the calendar tools send them.
+    """
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _event_bounds(event: Dict) -> tuple:
+    """Return the (start, end) timestamps used for range queries.
+
+    Recurring masters never end for range purposes, and exceptions cover both
+    their original slot and their current one so either can match a query.
+    """
+    original = event.get("originalStartTime", {})
+    original_value = original.get("dateTime") or original.get("date")
+    start = event.get("start", {})
+    end = event.get("end", {})
+    start_ts = to_timestamp(start.get("dateTime") or start.get("date") or original_value)
+    end_value = end.get("dateTime") or end.get("date")
+    end_ts = to_timestamp(end_value) if end_value else start_ts
+
+    if event.get("recurrence"):
+        end_ts = float("inf")
+    if original_value:
+        original_ts = to_timestamp(original_value)
+        start_ts, end_ts = min(start_ts, original_ts), max(end_ts, original_ts)
+    return start_ts, end_ts
+
+
+def _storage_id(calendar_id: str, single_events: bool) -> str:
+    return calendar_id if single_events else f"{calendar_id}#series"
+
+
+def _search_text(event: Dict) -> str:
+    parts = [
+        event.get("summary", ""),
+        event.get("description", ""),
+        event.get("location", ""),
+    ]
+    for attendee in event.get("attendees", []):
+        parts.append(attendee.get("email", ""))
+        parts.append(attendee.get("displayName", ""))
+    return " ".join(p for p in parts if p).lower()
+
+
+def matches_query(event: Dict, query: Optional[str]) -> bool:
+    """Whether every query term appears in the event, as in EventStore.list_events."""
+    text = _search_text(event)
+    return all(term in text for term in (query or "").lower().split())
+
+
+class EventStore:
+    """SQLite-backed event mirror kept current with Calendar sync tokens."""
+
+    def __init__(self, db_path: str, ttl_seconds: float = 60):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def _state(self, user_key: str, calendar_id: str) -> Optional[tuple]:
+        return self.conn.execute(
+            "SELECT sync_token, synced_at FROM sync_state WHERE user_key = ? AND calendar_id = ?",
+            (user_key, calendar_id),
+        ).fetchone()
+
+    def is_fresh(self, user_key: str, calendar_id: str, single_events: bool = True) -> bool:
+        """True if the calendar was synced within the TTL."""
+        with self.lock:
+            state = self._state(user_key, _storage_id(calendar_id, single_events))
+        return bool(state and state[0] and time.time() - state[1] < self.ttl_seconds)
+
+    def mark_stale(self, user_key: str, calendar_id: str) -> None:
+        """Force the next read to pull a delta (used after local writes)."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE sync_state SET synced_at = 0 WHERE user_key = ? AND calendar_id IN (?, ?)",
+                (user_key, calendar_id, _storage_id(calendar_id, False)),
+            )
+
+    def ensure_fresh(self, service, user_key: str, calendar_id: str, single_events: bool = True) -> None:
+        """Sync the calendar unless it is already fresh."""
+        if not self.is_fresh(user_key, calendar_id, single_events):
+            self.sync(service, user_key, calendar_id, single_events)
+
+    def sync(self, service, user_key: str, calendar_id: str, single_events: bool = True) -> None:
+        """Pull changes since the stored sync token, or do a full sync if there is none.
+
+        A 410 Gone response means the token expired; the calendar is then
+        cleared and fully resynced.
+        """
+        with self.lock:
+            state = self._state(user_key, _storage_id(calendar_id, single_events))
+        sync_token = state[0] if state else None
+
+        if sync_token:
+            try:
+                self._pull(service, user_key, calendar_id, single_events, sync_token)
+                return
+            except HttpError as error:
+                if error.resp.status != 410:
+                    raise
+                logging.info(f"Sync token expired for {calendar_id}, running full resync")
+
+        self._pull(service, user_key, calendar_id, single_events, None)
+
+    def _pull(self, service, user_key: str, calendar_id: str, single_events: bool,
+              sync_token: Optional[str]) -> None:
+        changed: List[Dict] = []
+        page_token = None
+
+        while True:
+            params: Dict[str, Any] = {
+                "calendarId": calendar_id,
+                "singleEvents": single_events,
+                "maxResults": SYNC_PAGE_SIZE,
+                "pageToken": page_token,
+            }
+            if sync_token:
+                params["syncToken"] = sync_token
+            elif not single_events:
+                # Cancelled occurrences of a series are needed to expand it correctly
+                params["showDeleted"] = True
+            result = service.events().list(**params).execute()
+            changed.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                next_sync_token = result.get("nextSyncToken")
+                break
+
+        storage_id = _storage_id(calendar_id, single_events)
+        with self.lock, self.conn:
+            if not sync_token:
+                self.conn.execute(
+                    "DELETE FROM events WHERE user_key = ? AND calendar_id = ?",
+                    (user_key, storage_id),
+                )
+            for event in changed:
+                self._apply(user_key, storage_id, event, single_events)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (user_key, calendar_id, sync_token, synced_at) "
+                "VALUES (?, ?, ?, ?)",
+                (user_key, storage_id, next_sync_token, time.time()),
+            )
+
+        mode = "incremental" if sync_token else "full"
+        logging.info(f"Calendar mirror {mode} sync for {storage_id}: {len(changed)} change(s)")
+
+    def _apply(self, user_key: str, calendar_id: str, event: Dict, single_events: bool) -> None:
+        # Cancelled events are tombstones: drop them from the mirror. In series mode a
+        # cancelled occurrence is kept, because it removes that date from its series.
+        cancelled_occurrence = not single_events and event.get("recurringEventId")
+        if event.get("status") == "cancelled" and not cancelled_occurrence:
+            self.conn.execute(
+                "DELETE FROM events WHERE user_key = ? AND calendar_id = ? AND event_id = ?",
+                (user_key, calendar_id, event["id"]),
+            )
+            return
+
+        start_ts, end_ts = _event_bounds(event)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO events "
+            "(user_key, calendar_id, event_id, start_ts, end_ts, search_text, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_key, calendar_id, event["id"], start_ts, end_ts,
+             _search_text(event), json.dumps(event)),
+        )
+
+    def list_events(self, user_key: str, calendar_id: str, time_min: Optional[str] = None,
+                    time_max: Optional[str] = None, max_results: Optional[int] = 10,
+                    query: Optional[str] = None, single_events: bool = True) -> List[Dict]:
+        """Return events overlapping [time_min, time_max) ordered by start time.
+
+        Mirrors the events.list semantics: time_min bounds the event end and
+        time_max bounds the event start. Every query term must appear in the
+        summary, description, location or attendees. In series mode the
+        masters and exceptions are returned unexpanded.
+        """
+        sql = "SELECT data FROM events WHERE user_key = ? AND calendar_id = ?"
+        params: List[Any] = [user_key, _storage_id(calendar_id, single_events)]
+
+        if time_min:
+            sql += " AND end_ts > ?"
+            params.append(to_timestamp(time_min))
+        if time_max:
+            sql += " AND start_ts < ?"
+            params.append(to_timestamp(time_max))
+        for term in (query or "").lower().split():
+            sql += " AND instr(search_text, ?) > 0"
+            params.append(term)
+
+        sql += " ORDER BY start_ts"
+        if max_results is not None:
+            sql += " LIMIT ?"
+            params.append(max_results)
+
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_event(self, user_key: str, calendar_id: str, event_id: str) -> Optional[Dict]:
+        """Return a mirrored event by ID, or None if it is not in the mirror."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM events WHERE user_key = ? AND calendar_id = ? AND event_id = ?",
+                (user_key, calendar_id, event_id),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
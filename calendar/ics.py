@@ -0,0 +1,323 @@
+"""
+Streaming iCalendar (RFC 5545) reader and writer for calendar import/export.
+
+The reader yields one VEVENT at a time from a file object and the writer emits
+one VEVENT at a time, so memory use does not grow with the calendar size.
+"""
+
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# RFC 5545 limits content lines to 75 octets, excluding the line break
+MAX_LINE_OCTETS = 75
+
+CALENDAR_HEADER = [
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//Office Assistant//Calendar Export//EN",
+    "CALSCALE:GREGORIAN",
+]
+CALENDAR_FOOTER = ["END:VCALENDAR"]
+
+# Properties copied verbatim into the Google "recurrence" list
+RECURRENCE_PROPERTIES = ("RRULE", "EXRULE", "RDATE", "EXDATE")
+
+DURATION_RE = re.compile(
+    r"^(?P<sign>[+-])?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?"
+    r"(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$"
+)
+
+# A parsed property: (parameters, value, original unfolded line)
+Property = Tuple[Dict[str, str], str, str]
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def iter_lines(fp: IO[str]) -> Iterator[str]:
+    """Yield unfolded content lines (continuation lines start with a space or tab)."""
+    current = None
+    for raw in fp:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """Split a content line into (NAME, {PARAM: value}, value)."""
+    # The value starts at the first colon that is not inside a quoted parameter
+    in_quotes = False
+    split_at = -1
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ":" and not in_quotes:
+            split_at = i
+            break
+    if split_at < 0:
+        raise ValueError(f"Malformed content line: {line[:60]}")
+
+    head, value = line[:split_at], line[split_at + 1:]
+    parts = head.split(";")
+    params = {}
+    for part in parts[1:]:
+        if "=" in part:
+            key, val = part.split("=", 1)
+            params[key.upper()] = val.strip('"')
+    return parts[0].upper(), params, value
+
+
+def iter_vevents(fp: IO[str]) -> Iterator[Dict[str, List[Property]]]:
+    """Yield each VEVENT as {PROPERTY: [(params, value, line), ...]}.
+
+    Nested components such as VALARM are skipped.
+    """
+    event: Optional[Dict[str, List[Property]]] = None
+    depth = 0
+    for line in iter_lines(fp):
+        if not line.strip():
+            continue
+        name, params, value = parse_line(line)
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and event is None:
+                event = {}
+            elif event is not None:
+                depth += 1
+            continue
+        if name == "END":
+            if event is not None:
+                if depth:
+                    depth -= 1
+                elif value.upper() == "VEVENT":
+                    yield event
+                    event = None
+            continue
+        if event is not None and not depth:
+            event.setdefault(name, []).append((params, value, line))
+
+
+def unescape_text(value: str) -> str:
+    out = []
+    chars = iter(value)
+    for ch in chars:
+        if ch == "\\":
+            nxt = next(chars, "")
+            out.append("\n" if nxt in ("n", "N") else nxt)
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _valid_tz(tz_name: Optional[str]) -> Optional[str]:
+    if not tz_name:
+        return None
+    try:
+        ZoneInfo(tz_name)
+        return tz_name
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def _ics_to_google_time(params: Dict[str, str], value: str, default_tz: str) -> Dict[str, str]:
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return {"date": f"{value[0:4]}-{value[4:6]}-{value[6:8]}"}
+
+    dt = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return {"dateTime": dt.strftime("%Y-%m-%dT%H:%M:%SZ")}
+    # TZIDs that are not IANA names (e.g. Windows zone names) fall back to the default
+    tz_name = _valid_tz(params.get("TZID")) or default_tz
+    return {"dateTime": dt.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": tz_name}
+
+
+def _parse_duration(value: str) -> timedelta:
+    match = DURATION_RE.match(value.upper())
+    if not match:
+        raise ValueError(f"Invalid DURATION: {value}")
+    delta = timedelta(**{k: int(v) for k, v in match.groupdict().items() if v and k != "sign"})
+    return -delta if match.group("sign") == "-" else delta
+
+
+def _shift(google_time: Dict[str, str], delta: timedelta) -> Dict[str, str]:
+    if "date" in google_time:
+        day = datetime.strptime(google_time["date"], "%Y-%m-%d") + delta
+        return {"date": day.strftime("%Y-%m-%d")}
+    dt = datetime.fromisoformat(google_time["dateTime"].replace("Z", "+00:00")) + delta
+    shifted = dict(google_time)
+    shifted["dateTime"] = dt.strftime("%Y-%m-%dT%H:%M:%S") + ("Z" if google_time["dateTime"].endswith("Z") else "")
+    return shifted
+
+
+def _first(props: Dict[str, List[Property]], name: str) -> Optional[Property]:
+    values = props.get(name)
+    return values[0] if values else None
+
+
+def _email(value: str) -> str:
+    return value[7:] if value.lower().startswith("mailto:") else value
+
+
+def vevent_to_event(props: Dict[str, List[Property]], default_tz: str) -> Optional[Dict]:
+    """Convert a parsed VEVENT to a Google Calendar events.import body.
+
+    Returns None for cancelled events.
+    """
+    status = _first(props, "STATUS")
+    if status and status[1].upper() == "CANCELLED":
+        return None
+
+    dtstart = _first(props, "DTSTART")
+    if not dtstart:
+        raise ValueError("VEVENT has no DTSTART")
+    start = _ics_to_google_time(dtstart[0], dtstart[1], default_tz)
+
+    dtend = _first(props, "DTEND")
+    duration = _first(props, "DURATION")
+    if dtend:
+        end = _ics_to_google_time(dtend[0], dtend[1], default_tz)
+    elif duration:
+        end = _shift(start, _parse_duration(duration[1]))
+    else:
+        end = _shift(start, timedelta(days=1)) if "date" in start else dict(start)
+
+    uid = _first(props, "UID")
+    if uid:
+        ical_uid = uid[1]
+    else:
+        # Stable UID so re-running an import updates instead of duplicating
+        fingerprint = "|".join(line for values in props.values() for _, _, line in values)
+        ical_uid = hashlib.sha1(fingerprint.encode()).hexdigest() + "@officeassistant"
+
+    event: Dict = {"iCalUID": ical_uid, "start": start, "end": end}
+
+    for ics_name, field in (("SUMMARY", "summary"), ("DESCRIPTION", "description"), ("LOCATION", "location")):
+        prop = _first(props, ics_name)
+        if prop:
+            event[field] = unescape_text(prop[1])
+
+    recurrence = [line for name in RECURRENCE_PROPERTIES for _, _, line in props.get(name, [])]
+    if recurrence:
+        event["recurrence"] = recurrence
+
+    recurrence_id = _first(props, "RECURRENCE-ID")
+    if recurrence_id:
+        event["originalStartTime"] = _ics_to_google_time(recurrence_id[0], recurrence_id[1], default_tz)
+
+    attendees = []
+    for params, value, _ in props.get("ATTENDEE", []):
+        attendee = {"email": _email(value)}
+        if params.get("CN"):
+            attendee["displayName"] = params["CN"]
+        attendees.append(attendee)
+    if attendees:
+        event["attendees"] = attendees
+
+    organizer = _first(props, "ORGANIZER")
+    if organizer:
+        event["organizer"] = {"email": _email(organizer[1])}
+
+    transp = _first(props, "TRANSP")
+    if transp and transp[1].upper() == "TRANSPARENT":
+        event["transparency"] = "transparent"
+
+    return event
+
+
+# ============================================================================
+# WRITING
+# ============================================================================
+
+def escape_text(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold_line(line: str) -> str:
+    """Fold a content line at 75 octets without splitting UTF-8 sequences, adding CRLF."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= MAX_LINE_OCTETS:
+        return line + "\r\n"
+
+    chunks = []
+    limit = MAX_LINE_OCTETS
+    current = ""
+    size = 0
+    for ch in line:
+        ch_size = len(ch.encode("utf-8"))
+        if size + ch_size > limit:
+            chunks.append(current)
+            current, size = "", 0
+            # Continuation lines lose one octet to the leading space
+            limit = MAX_LINE_OCTETS - 1
+        current += ch
+        size += ch_size
+    chunks.append(current)
+    return "\r\n ".join(chunks) + "\r\n"
+
+
+def _utc_stamp(value: str) -> str:
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _google_to_ics_time(name: str, google_time: Dict[str, str]) -> str:
+    if "date" in google_time:
+        return f"{name};VALUE=DATE:{google_time['date'].replace('-', '')}"
+    tz_name = _valid_tz(google_time.get("timeZone"))
+    if tz_name:
+        dt = datetime.fromisoformat(google_time["dateTime"].replace("Z", "+00:00"))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(ZoneInfo(tz_name))
+        return f"{name};TZID={tz_name}:{dt.strftime('%Y%m%dT%H%M%S')}"
+    return f"{name}:{_utc_stamp(google_time['dateTime'])}"
+
+
+def event_to_vevent(event: Dict) -> List[str]:
+    """Convert a Google Calendar event resource to unfolded VEVENT content lines."""
+    lines = ["BEGIN:VEVENT", f"UID:{event.get('iCalUID') or event.get('id', '') + '@google.com'}"]
+    if event.get("updated"):
+        lines.append(f"DTSTAMP:{_utc_stamp(event['updated'])}")
+    if event.get("created"):
+        lines.append(f"CREATED:{_utc_stamp(event['created'])}")
+    lines.append(_google_to_ics_time("DTSTART", event.get("start", {})))
+    if event.get("end"):
+        lines.append(_google_to_ics_time("DTEND", event["end"]))
+    if event.get("originalStartTime"):
+        lines.append(_google_to_ics_time("RECURRENCE-ID", event["originalStartTime"]))
+    lines.extend(event.get("recurrence", []))
+
+    for field, ics_name in (("summary", "SUMMARY"), ("description", "DESCRIPTION"), ("location", "LOCATION")):
+        if event.get(field):
+            lines.append(f"{ics_name}:{escape_text(event[field])}")
+
+    if event.get("status"):
+        lines.append(f"STATUS:{event['status'].upper()}")
+    if event.get("transparency") == "transparent":
+        lines.append("TRANSP:TRANSPARENT")
+    if event.get("organizer", {}).get("email"):
+        lines.append(f"ORGANIZER:mailto:{event['organizer']['email']}")
+    for attendee in event.get("attendees", []):
+        if not attendee.get("email"):
+            continue
+        cn = f';CN="{attendee["displayName"]}"' if attendee.get("displayName") else ""
+        lines.append(f"ATTENDEE{cn}:mailto:{attendee['email']}")
+
+    lines.append("END:VEVENT")
+    return lines
+
+
+def write_lines(fp: IO[str], lines: List[str]) -> None:
+    """Write content lines to fp, folded and CRLF-terminated."""
+    fp.write("".join(fold_line(line) for line in lines))
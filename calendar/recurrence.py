@@ -0,0 +1,177 @@
+"""
+Client-side expansion of recurring calendar events.
+
+Instead of asking the API to expand every series into instances
+(singleEvents=True), the calendar tools can fetch each recurring master once
+and expand its RRULE/RDATE/EXDATE rules locally with dateutil.rrule. Modified
+and cancelled instances (exceptions) replace or remove the generated
+occurrence they belong to.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateutil import rrule
+
+class RecurrenceError(ValueError):
+    """Raised when a recurrence rule cannot be expanded locally."""
+
+
+def _zone(tz_name: Optional[str], default_tz: str):
+    try:
+        return ZoneInfo(tz_name or default_tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(default_tz)
+
+
+def _start_of(google_time: Dict, default_tz: str):
+    """Return a naive datetime for all-day values and an aware local datetime otherwise."""
+    if "date" in google_time:
+        return datetime.strptime(google_time["date"], "%Y-%m-%d")
+    dt = datetime.fromisoformat(google_time["dateTime"].replace("Z", "+00:00"))
+    tz = _zone(google_time.get("timeZone"), default_tz)
+    return dt.replace(tzinfo=tz) if dt.tzinfo is None else dt.astimezone(tz)
+
+
+def _occurrence_key(value) -> str:
+    """Instance ID suffix used by Google: YYYYMMDD for all-day, UTC basic format otherwise."""
+    if value.tzinfo is None:
+        return value.strftime("%Y%m%d")
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _to_google_time(value, template: Dict) -> Dict:
+    if value.tzinfo is None:
+        return {"date": value.strftime("%Y-%m-%d")}
+    result = {"dateTime": value.isoformat()}
+    if template.get("timeZone"):
+        result["timeZone"] = template["timeZone"]
+    return result
+
+
+def _ruleset(master: Dict, dtstart) -> rrule.rruleset:
+    try:
+        return rrule.rrulestr("\n".join(master["recurrence"]), dtstart=dtstart,
+                              forceset=True, unfold=True)
+    except (ValueError, TypeError) as error:
+        raise RecurrenceError(f"Cannot expand recurrence of event {master['id']}: {error}") from error
+
+
+def _bound(ts: Optional[float], like, default_tz: str):
+    """Convert an epoch bound to the same naive/aware flavour as a series start."""
+    if ts is None:
+        return None
+    if like.tzinfo is None:
+        # All-day series: compare against wall-clock time in the calendar timezone
+        return datetime.fromtimestamp(ts, tz=ZoneInfo(default_tz)).replace(tzinfo=None)
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def _timestamp(value, default_tz: str) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo(default_tz))
+    return value.timestamp()
+
+
+def _occurrences(master: Dict, time_min: Optional[float], time_max: Optional[float],
+                 limit: int, default_tz: str) -> Iterable:
+    dtstart = _start_of(master["start"], default_tz)
+    duration = _start_of(master["end"], default_tz) - dtstart
+    ruleset = _ruleset(master, dtstart)
+
+    # Widen the lower bound by the duration so occurrences already in progress are kept
+    lower = _bound(time_min, dtstart, default_tz)
+    if lower is not None:
+        lower -= duration
+    upper = _bound(time_max, dtstart, default_tz)
+
+    try:
+        if upper is not None:
+            return ruleset.between(lower or dtstart, upper, inc=True)
+        return list(ruleset.xafter(lower or dtstart, count=limit, inc=True))
+    except TypeError as error:
+        # Mixed naive/aware values, e.g. a floating EXDATE on a zoned series
+        raise RecurrenceError(f"Cannot expand recurrence of event {master['id']}: {error}") from error
+
+
+def _overlaps(event: Dict, time_min: Optional[float], time_max: Optional[float], default_tz: str) -> bool:
+    start = _timestamp(_start_of(event["start"], default_tz), default_tz)
+    end = _timestamp(_start_of(event.get("end", event["start"]), default_tz), default_tz)
+    if time_min is not None and end <= time_min:
+        return False
+    if time_max is not None and start >= time_max:
+        return False
+    return True
+
+
+def _sort_key(event: Dict, default_tz: str) -> float:
+    return _timestamp(_start_of(event["start"], default_tz), default_tz)
+
+
+def expand_events(items: List[Dict], time_min: Optional[float] = None, time_max: Optional[float] = None,
+                  max_results: int = 250, default_tz: str = "UTC",
+                  keep: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+    """Expand recurring masters from events.list(singleEvents=False) into instances.
+
+    Args:
+        items: Events as returned with singleEvents=False (and ideally showDeleted=True,
+               so cancelled occurrences are known).
+        time_min: Lower bound (epoch seconds) on event end.
+        time_max: Upper bound (epoch seconds) on event start.
+        max_results: Maximum number of events to return.
+        default_tz: Timezone for series without an explicit one.
+        keep: Optional filter applied to the expanded events before max_results, e.g. a
+              text search. Filtering the unexpanded items instead would drop cancelled and
+              modified exceptions, and their occurrences would come back from the master.
+
+    Returns:
+        Single events and expanded instances overlapping the range, ordered by start.
+
+    Raises:
+        RecurrenceError: If a recurrence rule cannot be expanded locally.
+    """
+    masters = {}
+    exceptions: Dict[Tuple[str, str], Dict] = {}
+    results = []
+
+    for event in items:
+        if event.get("recurrence"):
+            if event.get("status") != "cancelled":
+                masters[event["id"]] = event
+        elif event.get("recurringEventId") and event.get("originalStartTime"):
+            original = _start_of(event["originalStartTime"], default_tz)
+            exceptions[(event["recurringEventId"], _occurrence_key(original))] = event
+        elif event.get("status") != "cancelled":
+            if _overlaps(event, time_min, time_max, default_tz):
+                results.append(event)
+
+    for master_id, master in masters.items():
+        dtstart = _start_of(master["start"], default_tz)
+        duration = _start_of(master["end"], default_tz) - dtstart
+        for occurrence in _occurrences(master, time_min, time_max, max_results, default_tz):
+            key = _occurrence_key(occurrence)
+            if (master_id, key) in exceptions:
+                continue
+            instance = {k: v for k, v in master.items() if k not in ("recurrence", "etag")}
+            instance["id"] = f"{master_id}_{key}"
+            instance["recurringEventId"] = master_id
+            instance["start"] = _to_google_time(occurrence, master["start"])
+            instance["end"] = _to_google_time(occurrence + duration, master["end"])
+            instance["originalStartTime"] = instance["start"]
+            if _overlaps(instance, time_min, time_max, default_tz):
+                results.append(instance)
+
+    # Modified occurrences keep their own (possibly moved) times
+    for exception in exceptions.values():
+        if exception.get("status") == "cancelled":
+            continue
+        if _overlaps(exception, time_min, time_max, default_tz):
+            results.append(exception)
+
+    if keep is not None:
+        results = [event for event in results if keep(event)]
+    results.sort(key=lambda e: _sort_key(e, default_tz))
+    logging.debug(f"Expanded {len(masters)} recurring series into {len(results)} event(s)")
+    return results[:max_results]
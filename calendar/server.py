@@ -2,10 +2,13 @@ import os
 import os.path
 import asyncio
 import logging
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, time as dt_time, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import hashlib
-from dateutil import parser as date_parser
+import json
+import sqlite3
+import sys
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -14,6 +17,18 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from fastmcp import FastMCP
 
+# Helpers shared by the MCP servers live in the top-level common/ directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from cache import MemoryCache, shared_cache
+from google_api import client_options, execute_batch, request_builder
+from telemetry import ToolTracingMiddleware, setup_tracing
+from tool_metrics import ToolMetricsMiddleware
+
+from datetime_parser import DateParseError, parse_datetime
+from event_store import EventStore, SYNC_PAGE_SIZE, matches_query, to_timestamp
+from recurrence import RecurrenceError, expand_events
+from ics import CALENDAR_FOOTER, CALENDAR_HEADER, event_to_vevent, iter_vevents, vevent_to_event, write_lines
+
 # Define the scopes required for the Calendar API
 SCOPES = [
     "https://www.googleapis.com/auth/calendar",
@@ -24,11 +39,36 @@ SCOPES = [
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CREDENTIALS_FILE = os.path.join(BASE_DIR, "credentials.json")
 
+# Timezone used for new events and working hours
+DEFAULT_TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "Asia/Kolkata")
+
+# freebusy.query accepts at most 50 calendars per request
+FREEBUSY_MAX_ITEMS = 50
+
+# Calendar batch requests are limited to 50 calls
+BATCH_MAX_REQUESTS = 50
+
 logging.basicConfig(level=logging.INFO)
-mcp = FastMCP("Calendar Manager")
+setup_tracing("mcp-calendar", batch=False)
+mcp = FastMCP("Calendar Manager", middleware=[ToolTracingMiddleware("calendar"), ToolMetricsMiddleware("calendar")])
+
+# Authenticated services; they hold live HTTP clients, so they stay in this process.
+# Access tokens last an hour, so a service is rebuilt before its token runs out.
+_service_cache = MemoryCache(max_entries=64)
+SERVICE_CACHE_TTL = 50 * 60
 
-# Cache for authenticated services
-_service_cache: Dict[str, Any] = {}
+# Slow-changing API results, shared by every server process on the host
+shared = shared_cache()
+METADATA_TTL = float(os.getenv("CACHE_METADATA_TTL_SECONDS", "300"))
+
+# Local event mirror, kept current with Calendar sync tokens
+MIRROR_ENABLED = os.getenv("CALENDAR_MIRROR_ENABLED", "true").lower() == "true"
+MIRROR_DB = os.getenv("CALENDAR_MIRROR_DB", os.path.join(BASE_DIR, "event_store.db"))
+MIRROR_TTL_SECONDS = float(os.getenv("CALENDAR_MIRROR_TTL_SECONDS", "60"))
+event_store = EventStore(MIRROR_DB, MIRROR_TTL_SECONDS) if MIRROR_ENABLED else None
+
+# import_ics and export_ics only read and write .ics files under this directory, one subdirectory per user
+ICS_DIR = os.path.realpath(os.path.expanduser(os.getenv("CALENDAR_ICS_DIR", os.path.join(BASE_DIR, "ics"))))
 
 
 def _get_token_file(user_email: Optional[str] = None) -> str:
@@ -39,6 +79,13 @@ def _get_token_file(user_email: Optional[str] = None) -> str:
     return os.path.join(BASE_DIR, "token.json")
 
 
+def _user_cache_key(user_email: Optional[str] = None) -> str:
+    """Get the per-user key used for the service cache, the shared cache and the event mirror."""
+    if os.getenv("GOOGLE_ACCESS_TOKEN"):
+        return os.getenv("USER_ID") or "token_user"
+    return user_email or "default"
+
+
 def get_calendar_service(user_email: Optional[str] = None):
     """Authenticates and returns an authorized Calendar API service instance.
     
@@ -49,27 +96,28 @@ def get_calendar_service(user_email: Optional[str] = None):
     access_token = os.getenv("GOOGLE_ACCESS_TOKEN")
     user_id = os.getenv("USER_ID")
     
+    cache_key = _user_cache_key(user_email)
+    
     if access_token:
         # Production mode: Use access token from environment
-        cache_key = user_id or "token_user"
-        
-        if cache_key in _service_cache:
-            return _service_cache[cache_key]
+        service = _service_cache.get(cache_key)
+        if service is not None:
+            return service
         
         # Create credentials from access token
         creds = Credentials(token=access_token)
         
         # Build the Calendar service
-        service = build("calendar", "v3", credentials=creds)
-        _service_cache[cache_key] = service
+        service = build("calendar", "v3", credentials=creds, requestBuilder=request_builder(cache_key),
+                        client_options=client_options())
+        _service_cache.set(cache_key, service, SERVICE_CACHE_TTL)
         logging.info(f"Calendar service created for user: {user_id}")
         return service
     
     # Development mode: Use OAuth flow with credentials.json
-    cache_key = user_email or "default"
-    
-    if cache_key in _service_cache:
-        return _service_cache[cache_key]
+    service = _service_cache.get(cache_key)
+    if service is not None:
+        return service
     
     token_file = _get_token_file(user_email)
     creds = None
@@ -87,62 +135,33 @@ def get_calendar_service(user_email: Optional[str] = None):
         with open(token_file, "w") as token:
             token.write(creds.to_json())
     
-    service = build("calendar", "v3", credentials=creds)
-    _service_cache[cache_key] = service
+    service = build("calendar", "v3", credentials=creds, requestBuilder=request_builder(cache_key),
+                    client_options=client_options())
+    _service_cache.set(cache_key, service, SERVICE_CACHE_TTL)
     return service
 
 
-def _parse_datetime(dt_string: str) -> str:
-    """Parse various datetime formats and return ISO format."""
+def _get_user_timezone() -> str:
+    """Get the IANA timezone for the current user.
+    
+    The backend passes USER_TIMEZONE per user; otherwise DEFAULT_TIMEZONE is used.
+    """
+    tz_name = os.getenv("USER_TIMEZONE") or DEFAULT_TIMEZONE
     try:
-        # Handle special keywords
-        dt_string_lower = dt_string.lower().strip()
-        
-        if dt_string_lower == "now":
-            dt = datetime.utcnow()
-        elif dt_string_lower == "today":
-            dt = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        elif dt_string_lower == "tomorrow":
-            dt = (datetime.utcnow() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        else:
-            # Handle compound expressions like "tomorrow at 12pm", "tomorrow afternoon"
-            if "tomorrow" in dt_string_lower:
-                # Get tomorrow's date
-                tomorrow = datetime.utcnow() + timedelta(days=1)
-                
-                # Try to extract time from the string
-                # Remove "tomorrow" and "at" to get just the time part
-                time_part = dt_string_lower.replace("tomorrow", "").replace("at", "").strip()
-                
-                if time_part:
-                    # Parse just the time part
-                    try:
-                        time_dt = date_parser.parse(time_part, fuzzy=True)
-                        # Combine tomorrow's date with the parsed time
-                        dt = tomorrow.replace(
-                            hour=time_dt.hour,
-                            minute=time_dt.minute,
-                            second=0,
-                            microsecond=0
-                        )
-                    except:
-                        # If time parsing fails, use tomorrow at midnight
-                        dt = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
-                else:
-                    dt = tomorrow.replace(hour=0, minute=0, second=0, microsecond=0)
-            else:
-                # Try to parse the datetime string with fuzzy parsing
-                dt = date_parser.parse(dt_string, fuzzy=True)
-            
-            # If the parsed date is in the past and the string contains "tomorrow", add a day
-            if "tomorrow" in dt_string_lower and dt < datetime.utcnow():
-                dt = dt + timedelta(days=1)
-        
-        return dt.isoformat()
-    except Exception as e:
-        logging.error(f"Failed to parse datetime '{dt_string}': {e}")
-        # Return current time as fallback
-        return datetime.utcnow().isoformat()
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning(f"Unknown timezone '{tz_name}', falling back to {DEFAULT_TIMEZONE}")
+        tz_name = DEFAULT_TIMEZONE
+    return tz_name
+
+
+def _parse_datetime(dt_string: str) -> str:
+    """Parse ISO or natural-language datetimes and return an RFC3339 string in the user's timezone.
+    
+    Raises:
+        DateParseError: If the string cannot be parsed.
+    """
+    return parse_datetime(dt_string, _get_user_timezone()).isoformat()
 
 
 def _format_event(event: Dict) -> str:
@@ -183,11 +202,12 @@ def _create_event_body(summary: str, start: str, end: str, description: Optional
     start_dt = _parse_datetime(start)
     end_dt = _parse_datetime(end)
     
-    # Use Asia/Kolkata timezone instead of UTC
+    # Use the user's timezone (Asia/Kolkata by default) instead of UTC
+    tz_name = _get_user_timezone()
     event = {
         "summary": summary,
-        "start": {"dateTime": start_dt, "timeZone": "Asia/Kolkata"},
-        "end": {"dateTime": end_dt, "timeZone": "Asia/Kolkata"}
+        "start": {"dateTime": start_dt, "timeZone": tz_name},
+        "end": {"dateTime": end_dt, "timeZone": tz_name}
     }
     
     if description:
@@ -206,6 +226,183 @@ def _create_event_body(summary: str, start: str, end: str, description: Optional
     return event
 
 
+def _build_event_patch(summary: Optional[str] = None, start: Optional[str] = None,
+                       end: Optional[str] = None, description: Optional[str] = None,
+                       location: Optional[str] = None, attendees: Optional[str] = None) -> Dict:
+    """Create a partial event body containing only the fields being changed."""
+    patch: Dict[str, Any] = {}
+    if summary:
+        patch["summary"] = summary
+    if start:
+        patch["start"] = {"dateTime": _parse_datetime(start), "timeZone": _get_user_timezone()}
+    if end:
+        patch["end"] = {"dateTime": _parse_datetime(end), "timeZone": _get_user_timezone()}
+    if description:
+        patch["description"] = description
+    if location:
+        patch["location"] = location
+    if attendees:
+        patch["attendees"] = [{"email": email.strip()} for email in attendees.split(",")]
+    return patch
+
+
+def _event_patch_request(service, calendar_id: str, event_id: str, patch: Dict,
+                         etag: Optional[str] = None):
+    """Build an events.patch request, guarded by If-Match when an ETag is given."""
+    request = service.events().patch(calendarId=calendar_id, eventId=event_id, body=patch)
+    if etag:
+        request.headers["If-Match"] = etag
+    return request
+
+
+def _describe_http_error(error: HttpError) -> str:
+    """Short, agent-friendly description of an API error."""
+    if error.resp.status == 412:
+        return "event was modified since the given etag; fetch it again and retry"
+    if error.resp.status in (404, 410):
+        return "event not found"
+    return str(error)
+
+
+def _mirror_list_events(service, user_email: Optional[str], calendar_id: str,
+                        time_min: Optional[str], time_max: Optional[str],
+                        max_results: Optional[int], query: Optional[str],
+                        single_events: bool = True) -> Optional[List[Dict]]:
+    """Serve an events.list query from the local mirror, or None to fall back to the API."""
+    if not event_store:
+        return None
+    
+    cache_key = _user_cache_key(user_email)
+    try:
+        event_store.ensure_fresh(service, cache_key, calendar_id, single_events)
+        return event_store.list_events(cache_key, calendar_id, time_min, time_max, max_results,
+                                       query, single_events)
+    except (HttpError, sqlite3.Error) as error:
+        logging.warning(f"Calendar mirror unavailable, querying API directly: {error}")
+        return None
+
+
+def _mirror_get_event(service, user_email: Optional[str], calendar_id: str,
+                      event_id: str) -> Optional[Dict]:
+    """Look up an event in the local mirror, or None to fall back to the API."""
+    if not event_store:
+        return None
+    
+    cache_key = _user_cache_key(user_email)
+    try:
+        event_store.ensure_fresh(service, cache_key, calendar_id)
+        return event_store.get_event(cache_key, calendar_id, event_id)
+    except (HttpError, sqlite3.Error) as error:
+        logging.warning(f"Calendar mirror unavailable, querying API directly: {error}")
+        return None
+
+
+def _list_recurring_series(service, user_email: Optional[str], calendar_id: str,
+                           time_min: str, time_max: Optional[str],
+                           max_results: int, query: Optional[str]) -> List[Dict]:
+    """List events with recurring series expanded locally instead of by the API.
+
+    Masters and their exceptions come from the series mirror when it is
+    enabled, otherwise from events.list(singleEvents=False). Both are fetched
+    without the text query, which is applied to the expanded instances: a
+    cancelled or renamed exception would not match it, and the occurrence
+    would be regenerated from the master.
+    """
+    items = _mirror_list_events(service, user_email, calendar_id, time_min, time_max,
+                                None, None, single_events=False)
+    
+    if items is None:
+        items = []
+        page_token = None
+        while True:
+            result = service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                singleEvents=False,
+                showDeleted=True,
+                maxResults=SYNC_PAGE_SIZE,
+                pageToken=page_token
+            ).execute()
+            items.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+    
+    return expand_events(
+        items,
+        to_timestamp(time_min),
+        to_timestamp(time_max) if time_max else None,
+        max_results,
+        _get_user_timezone(),
+        keep=(lambda event: matches_query(event, query)) if query else None,
+    )
+
+
+def _invalidate_mirror(user_email: Optional[str], calendar_id: str) -> None:
+    """Make the next read pull a delta after this server changed the calendar."""
+    if event_store:
+        event_store.mark_stale(_user_cache_key(user_email), calendar_id)
+
+
+def _to_utc(dt_string: str) -> datetime:
+    """Convert an RFC3339 string (naive values are treated as UTC) to an aware UTC datetime."""
+    dt = datetime.fromisoformat(dt_string.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def _merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """Merge overlapping or touching intervals with a single sort-and-sweep pass."""
+    merged: List[Tuple[datetime, datetime]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _working_windows(range_start: datetime, range_end: datetime, tz: ZoneInfo,
+                     day_start: dt_time, day_end: dt_time,
+                     include_weekends: bool) -> List[Tuple[datetime, datetime]]:
+    """Split [range_start, range_end) into per-day working-hour windows in the given timezone."""
+    windows = []
+    day = range_start.astimezone(tz).date()
+    last_day = range_end.astimezone(tz).date()
+    while day <= last_day:
+        if include_weekends or day.weekday() < 5:
+            start = max(datetime.combine(day, day_start, tz), range_start)
+            end = min(datetime.combine(day, day_end, tz), range_end)
+            if start < end:
+                windows.append((start, end))
+        day += timedelta(days=1)
+    return windows
+
+
+def _free_slots(windows: List[Tuple[datetime, datetime]], busy: List[Tuple[datetime, datetime]],
+                min_length: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Sweep merged busy intervals across the windows and keep gaps of at least min_length."""
+    slots = []
+    i = 0
+    for window_start, window_end in windows:
+        # Skip busy intervals that finished before this window
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+        cursor = window_start
+        j = i
+        while j < len(busy) and busy[j][0] < window_end:
+            if busy[j][0] - cursor >= min_length:
+                slots.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if window_end - cursor >= min_length:
+            slots.append((cursor, window_end))
+    return slots
+
+
 # ============================================================================
 # MCP TOOLS
 # ============================================================================
@@ -222,9 +419,12 @@ def list_calendars(user_email: Optional[str] = None) -> str:
     """
     try:
         service = get_calendar_service(user_email)
-        calendars = service.calendarList().list().execute()
+        items = shared.get_or_set(
+            f"calendar:calendar-list:{_user_cache_key(user_email)}",
+            METADATA_TTL,
+            lambda: service.calendarList().list().execute().get("items", []),
+        )
         
-        items = calendars.get("items", [])
         if not items:
             return "No calendars found."
         
@@ -257,7 +457,11 @@ def get_calendar(calendar_id: str = "primary", user_email: Optional[str] = None)
     """
     try:
         service = get_calendar_service(user_email)
-        calendar = service.calendars().get(calendarId=calendar_id).execute()
+        calendar = shared.get_or_set(
+            f"calendar:calendar:{_user_cache_key(user_email)}:{calendar_id}",
+            METADATA_TTL,
+            lambda: service.calendars().get(calendarId=calendar_id).execute(),
+        )
         
         return f"""Calendar Details:
 ID: {calendar.get('id', '')}
@@ -296,11 +500,14 @@ def create_event(summary: str, start: str, end: str, calendar_id: str = "primary
         event_body = _create_event_body(summary, start, end, description, location, attendees, reminders)
         
         event = service.events().insert(calendarId=calendar_id, body=event_body).execute()
+        _invalidate_mirror(user_email, calendar_id)
         
         event_id = event.get("id", "")
         event_link = event.get("htmlLink", "")
         logging.info(f"Event created successfully! Event ID: {event_id}")
         return f"Event created successfully!\nEvent ID: {event_id}\nLink: {event_link}"
+    except DateParseError as error:
+        return f"Failed to create event. Error: {error}"
     except HttpError as error:
         logging.error(f"An error occurred: {error}")
         return f"Failed to create event. Error: {error}"
@@ -308,7 +515,8 @@ def create_event(summary: str, start: str, end: str, calendar_id: str = "primary
 
 def _list_events_impl(calendar_id: str = "primary", time_min: Optional[str] = None,
                      time_max: Optional[str] = None, max_results: int = 10,
-                     query: Optional[str] = None, user_email: Optional[str] = None) -> str:
+                     query: Optional[str] = None, user_email: Optional[str] = None,
+                     expand_recurring: bool = False) -> str:
     """Internal implementation for listing events."""
     try:
         service = get_calendar_service(user_email)
@@ -318,25 +526,34 @@ def _list_events_impl(calendar_id: str = "primary", time_min: Optional[str] = No
             time_min = datetime.utcnow().isoformat() + "Z"
         else:
             time_min = _parse_datetime(time_min)
-            if not time_min.endswith("Z"):
-                time_min += "Z"
         
         if time_max:
             time_max = _parse_datetime(time_max)
-            if not time_max.endswith("Z"):
-                time_max += "Z"
         
-        events_result = service.events().list(
-            calendarId=calendar_id,
-            timeMin=time_min,
-            timeMax=time_max,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy="startTime",
-            q=query
-        ).execute()
+        events = None
+        if expand_recurring:
+            try:
+                events = _list_recurring_series(service, user_email, calendar_id, time_min,
+                                                time_max, max_results, query)
+            except RecurrenceError as error:
+                logging.warning(f"{error}; falling back to server-side expansion")
         
-        events = events_result.get("items", [])
+        if events is None:
+            events = _mirror_list_events(service, user_email, calendar_id, time_min, time_max,
+                                         max_results, query)
+        
+        if events is None:
+            events_result = service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min,
+                timeMax=time_max,
+                maxResults=max_results,
+                singleEvents=True,
+                orderBy="startTime",
+                q=query
+            ).execute()
+            
+            events = events_result.get("items", [])
         
         if not events:
             return "No events found."
@@ -347,6 +564,8 @@ def _list_events_impl(calendar_id: str = "primary", time_min: Optional[str] = No
             output.append("-" * 80)
         
         return "\n".join(output)
+    except DateParseError as error:
+        return f"Failed to list events. Error: {error}"
     except HttpError as error:
         logging.error(f"An error occurred: {error}")
         return f"Failed to list events. Error: {error}"
@@ -355,7 +574,7 @@ def _list_events_impl(calendar_id: str = "primary", time_min: Optional[str] = No
 @mcp.tool()
 def list_events(calendar_id: str = "primary", time_min: Optional[str] = None,
                time_max: Optional[str] = None, max_results: int = 10,
-               user_email: Optional[str] = None) -> str:
+               expand_recurring: bool = False, user_email: Optional[str] = None) -> str:
     """List events from a calendar.
     
     Args:
@@ -363,18 +582,21 @@ def list_events(calendar_id: str = "primary", time_min: Optional[str] = None,
         time_min: Start time for events (ISO format or natural language).
         time_max: End time for events (ISO format or natural language).
         max_results: Maximum number of events to return (default: 10).
+        expand_recurring: Fetch recurring series once and expand them locally
+                          (cheaper for long ranges) instead of asking the API for every instance.
         user_email: Optional email address for multi-account support.
     
     Returns:
         List of events as a formatted string.
     """
-    return _list_events_impl(calendar_id, time_min, time_max, max_results, None, user_email)
+    return _list_events_impl(calendar_id, time_min, time_max, max_results, None, user_email,
+                             expand_recurring)
 
 
 @mcp.tool()
 def search_events(query: str, calendar_id: str = "primary", time_min: Optional[str] = None,
                  time_max: Optional[str] = None, max_results: int = 20,
-                 user_email: Optional[str] = None) -> str:
+                 expand_recurring: bool = False, user_email: Optional[str] = None) -> str:
     """Search for events in a calendar.
     
     Args:
@@ -383,12 +605,14 @@ def search_events(query: str, calendar_id: str = "primary", time_min: Optional[s
         time_min: Start time for search range.
         time_max: End time for search range.
         max_results: Maximum number of results (default: 20).
+        expand_recurring: Expand recurring series locally instead of on the server.
         user_email: Optional email address for multi-account support.
     
     Returns:
         Search results as a formatted string.
     """
-    return _list_events_impl(calendar_id, time_min, time_max, max_results, query, user_email)
+    return _list_events_impl(calendar_id, time_min, time_max, max_results, query, user_email,
+                             expand_recurring)
 
 
 @mcp.tool()
@@ -405,7 +629,9 @@ def get_event(event_id: str, calendar_id: str = "primary", user_email: Optional[
     """
     try:
         service = get_calendar_service(user_email)
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+        event = _mirror_get_event(service, user_email, calendar_id, event_id)
+        if event is None:
+            event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
         
         return f"""Event Details:
 {_format_event(event)}
@@ -413,6 +639,7 @@ def get_event(event_id: str, calendar_id: str = "primary", user_email: Optional[
 Created: {event.get('created', 'N/A')}
 Updated: {event.get('updated', 'N/A')}
 Status: {event.get('status', 'N/A')}
+ETag: {event.get('etag', 'N/A')}
 Link: {event.get('htmlLink', 'N/A')}"""
     except HttpError as error:
         logging.error(f"An error occurred: {error}")
@@ -423,9 +650,11 @@ Link: {event.get('htmlLink', 'N/A')}"""
 def update_event(event_id: str, calendar_id: str = "primary", summary: Optional[str] = None,
                 start: Optional[str] = None, end: Optional[str] = None,
                 description: Optional[str] = None, location: Optional[str] = None,
-                user_email: Optional[str] = None) -> str:
+                etag: Optional[str] = None, user_email: Optional[str] = None) -> str:
     """Update an existing event.
     
+    Only the given fields are sent (events.patch), so no prior read is needed.
+    
     Args:
         event_id: Event ID to update.
         calendar_id: Calendar ID (default: "primary").
@@ -434,6 +663,7 @@ def update_event(event_id: str, calendar_id: str = "primary", summary: Optional[
         end: New end time (optional).
         description: New description (optional).
         location: New location (optional).
+        etag: Optional event ETag; the update fails if the event changed since then.
         user_email: Optional email address for multi-account support.
     
     Returns:
@@ -442,30 +672,132 @@ def update_event(event_id: str, calendar_id: str = "primary", summary: Optional[
     try:
         service = get_calendar_service(user_email)
         
-        # Get existing event
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
-        
-        # Update fields
-        if summary:
-            event["summary"] = summary
-        if start:
-            event["start"] = {"dateTime": _parse_datetime(start), "timeZone": "Asia/Kolkata"}
-        if end:
-            event["end"] = {"dateTime": _parse_datetime(end), "timeZone": "Asia/Kolkata"}
-        if description:
-            event["description"] = description
-        if location:
-            event["location"] = location
-        
-        updated_event = service.events().update(
-            calendarId=calendar_id, eventId=event_id, body=event
-        ).execute()
+        patch = _build_event_patch(summary, start, end, description, location)
+        if not patch:
+            return "Nothing to update. Provide at least one field to change."
+        
+        updated_event = _event_patch_request(service, calendar_id, event_id, patch, etag).execute()
+        _invalidate_mirror(user_email, calendar_id)
         
         logging.info(f"Event updated successfully! Event ID: {event_id}")
-        return f"Event updated successfully!\nEvent ID: {event_id}\nLink: {updated_event.get('htmlLink', '')}"
+        return f"Event updated successfully!\nEvent ID: {event_id}\nETag: {updated_event.get('etag', '')}\nLink: {updated_event.get('htmlLink', '')}"
+    except DateParseError as error:
+        return f"Failed to update event. Error: {error}"
     except HttpError as error:
         logging.error(f"An error occurred: {error}")
-        return f"Failed to update event. Error: {error}"
+        return f"Failed to update event. Error: {_describe_http_error(error)}"
+
+
+@mcp.tool()
+def apply_event_changes(changes: List[Dict[str, Any]], calendar_id: str = "primary",
+                        user_email: Optional[str] = None) -> str:
+    """Create, update and delete many events in a single batch request.
+    
+    Args:
+        changes: List of operations. Each is a dict with:
+            - "action": "create", "patch" or "delete"
+            - "event_id": required for "patch" and "delete"
+            - "etag": optional; the operation fails if the event changed since then
+            - "calendar_id": optional per-operation calendar override
+            - "summary", "start", "end", "description", "location", "attendees"
+              (comma-separated emails): fields for "create" (summary/start/end required)
+              or the fields to change for "patch"
+        calendar_id: Default calendar ID (default: "primary").
+        user_email: Optional email address for multi-account support.
+    
+    Returns:
+        One result line per operation, in order.
+    
+    Example:
+        [{"action": "patch", "event_id": "abc", "start": "tomorrow 3pm", "end": "tomorrow 4pm"},
+         {"action": "delete", "event_id": "def"},
+         {"action": "create", "summary": "Retro", "start": "friday 4pm", "end": "friday 5pm"}]
+    """
+    if not changes:
+        return "No changes given."
+    
+    try:
+        service = get_calendar_service(user_email)
+    except HttpError as error:
+        logging.error(f"An error occurred: {error}")
+        return f"Failed to apply event changes. Error: {error}"
+    
+    results: Dict[int, str] = {}
+    pending = []
+    touched_calendars = set()
+    
+    # Build all requests up front so invalid operations never reach the API
+    for index, change in enumerate(changes):
+        action = str(change.get("action", "")).lower()
+        cal_id = change.get("calendar_id") or calendar_id
+        event_id = change.get("event_id")
+        label = f"{action or '?'} {event_id or ''}".strip()
+        try:
+            if action == "create":
+                if not all(change.get(k) for k in ("summary", "start", "end")):
+                    raise ValueError("create needs summary, start and end")
+                body = _create_event_body(change["summary"], change["start"], change["end"],
+                                          change.get("description"), change.get("location"),
+                                          change.get("attendees"), change.get("reminders"))
+                request = service.events().insert(calendarId=cal_id, body=body)
+            elif action == "patch":
+                if not event_id:
+                    raise ValueError("patch needs event_id")
+                patch = _build_event_patch(change.get("summary"), change.get("start"), change.get("end"),
+                                           change.get("description"), change.get("location"),
+                                           change.get("attendees"))
+                if not patch:
+                    raise ValueError("patch has no fields to change")
+                request = _event_patch_request(service, cal_id, event_id, patch, change.get("etag"))
+            elif action == "delete":
+                if not event_id:
+                    raise ValueError("delete needs event_id")
+                request = service.events().delete(calendarId=cal_id, eventId=event_id)
+                if change.get("etag"):
+                    request.headers["If-Match"] = change["etag"]
+            else:
+                raise ValueError(f"unknown action '{action}'")
+        except ValueError as error:
+            results[index] = f"{label}: FAILED - {error}"
+            continue
+        pending.append((index, label, request))
+        touched_calendars.add(cal_id)
+    
+    labels = {index: label for index, label, _ in pending}
+    
+    def on_response(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None:
+            if isinstance(exception, HttpError):
+                results[index] = f"{labels[index]}: FAILED - {_describe_http_error(exception)}"
+            else:
+                results[index] = f"{labels[index]}: FAILED - {exception}"
+        elif response:
+            results[index] = f"{labels[index]}: OK - Event ID: {response.get('id', '')}, ETag: {response.get('etag', '')}"
+        else:
+            results[index] = f"{labels[index]}: OK"
+    
+    batches = 0
+    try:
+        for i in range(0, len(pending), BATCH_MAX_REQUESTS):
+            batch = service.new_batch_http_request(callback=on_response)
+            for index, _, request in pending[i:i + BATCH_MAX_REQUESTS]:
+                batch.add(request, request_id=str(index))
+            execute_batch(batch)
+            batches += 1
+    except HttpError as error:
+        logging.error(f"An error occurred: {error}")
+        for index, label, _ in pending:
+            results.setdefault(index, f"{label}: NOT APPLIED - batch request failed: {error}")
+    finally:
+        for cal_id in touched_calendars:
+            _invalidate_mirror(user_email, cal_id)
+    
+    succeeded = sum(1 for r in results.values() if ": OK" in r)
+    output = [f"Applied {succeeded}/{len(changes)} change(s) in {batches} batch request(s):\n"]
+    output += [f"{index + 1}. {results[index]}" for index in sorted(results)]
+    logging.info(f"Applied {succeeded}/{len(changes)} event change(s) in {batches} batch(es)")
+    return "\n".join(output)
 
 
 @mcp.tool()
@@ -483,6 +815,7 @@ def delete_event(event_id: str, calendar_id: str = "primary", user_email: Option
     try:
         service = get_calendar_service(user_email)
         service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        _invalidate_mirror(user_email, calendar_id)
         
         logging.info(f"Event {event_id} deleted successfully!")
         return f"Event {event_id} deleted successfully!"
@@ -508,15 +841,10 @@ def check_availability(time_min: str, time_max: str, calendar_id: str = "primary
     try:
         service = get_calendar_service(user_email)
         
+        # RFC3339 with the user's UTC offset
         time_min_parsed = _parse_datetime(time_min)
         time_max_parsed = _parse_datetime(time_max)
         
-        # Ensure RFC3339 format with 'Z' suffix for UTC
-        if not time_min_parsed.endswith('Z'):
-            time_min_parsed += 'Z'
-        if not time_max_parsed.endswith('Z'):
-            time_max_parsed += 'Z'
-        
         body = {
             "timeMin": time_min_parsed,
             "timeMax": time_max_parsed,
@@ -539,11 +867,290 @@ def check_availability(time_min: str, time_max: str, calendar_id: str = "primary
             output.append(f"- {start} to {end}")
         
         return "\n".join(output)
+    except DateParseError as error:
+        return f"Failed to check availability. Error: {error}"
     except HttpError as error:
         logging.error(f"An error occurred: {error}")
         return f"Failed to check availability. Error: {error}"
 
 
+@mcp.tool()
+def find_free_slots(time_min: str, time_max: str, calendar_ids: str = "primary",
+                    attendees: Optional[str] = None, duration_minutes: int = 30,
+                    working_hours_start: str = "09:00", working_hours_end: str = "18:00",
+                    include_weekends: bool = False, max_slots: int = 5,
+                    time_zone: Optional[str] = None, user_email: Optional[str] = None) -> str:
+    """Find common free time across several calendars and attendees.
+    
+    Queries free/busy for every calendar and attendee in one request, merges their busy
+    times and returns the earliest gaps that fit the meeting within working hours.
+    
+    Args:
+        time_min: Start of the search range.
+        time_max: End of the search range.
+        calendar_ids: Comma-separated calendar IDs to check (default: "primary").
+        attendees: Optional comma-separated attendee emails to check as well.
+        duration_minutes: Minimum slot length in minutes (default: 30).
+        working_hours_start: Start of the working day, "HH:MM" (default: "09:00").
+        working_hours_end: End of the working day, "HH:MM" (default: "18:00").
+        include_weekends: Whether Saturday and Sunday count as working days (default: False).
+        max_slots: Maximum number of slots to return (default: 5).
+        time_zone: Timezone for working hours and output (default: the user's timezone).
+        user_email: Optional email address for multi-account support.
+    
+    Returns:
+        Free slots as a formatted string, earliest first.
+    """
+    tz_name = time_zone or _get_user_timezone()
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return f"Failed to find free slots. Error: unknown timezone '{tz_name}'; use an IANA name such as Europe/London."
+    try:
+        day_start = datetime.strptime(working_hours_start, "%H:%M").time()
+        day_end = datetime.strptime(working_hours_end, "%H:%M").time()
+        min_length = timedelta(minutes=duration_minutes)
+        
+        range_start = _to_utc(_parse_datetime(time_min))
+        range_end = _to_utc(_parse_datetime(time_max))
+        if range_end <= range_start:
+            return "Failed to find free slots. Error: time_max must be after time_min."
+        
+        ids = [c.strip() for c in calendar_ids.split(",") if c.strip()]
+        if attendees:
+            ids += [a.strip() for a in attendees.split(",") if a.strip()]
+        ids = list(dict.fromkeys(ids))
+        
+        service = get_calendar_service(user_email)
+        
+        busy: List[Tuple[datetime, datetime]] = []
+        unavailable = []
+        for i in range(0, len(ids), FREEBUSY_MAX_ITEMS):
+            body = {
+                "timeMin": range_start.isoformat(),
+                "timeMax": range_end.isoformat(),
+                "timeZone": tz_name,
+                "items": [{"id": cal_id} for cal_id in ids[i:i + FREEBUSY_MAX_ITEMS]]
+            }
+            freebusy = service.freebusy().query(body=body).execute()
+            
+            for cal_id, info in freebusy.get("calendars", {}).items():
+                if info.get("errors"):
+                    reasons = ", ".join(e.get("reason", "unknown") for e in info["errors"])
+                    unavailable.append(f"{cal_id} ({reasons})")
+                    continue
+                for period in info.get("busy", []):
+                    busy.append((_to_utc(period["start"]), _to_utc(period["end"])))
+        
+        windows = _working_windows(range_start, range_end, tz, day_start, day_end, include_weekends)
+        slots = _free_slots(windows, _merge_intervals(busy), min_length)[:max_slots]
+        
+        output = []
+        if not slots:
+            output.append(f"No free slots of {duration_minutes}+ minutes found for {', '.join(ids)}.")
+        else:
+            output.append(f"Found {len(slots)} free slot(s) of {duration_minutes}+ minutes "
+                          f"for {', '.join(ids)} ({tz_name}):\n")
+            for n, (start, end) in enumerate(slots, 1):
+                local_start = start.astimezone(tz)
+                local_end = end.astimezone(tz)
+                length = int((end - start).total_seconds() // 60)
+                output.append(f"{n}. {local_start:%a %Y-%m-%d %H:%M} - {local_end:%H:%M} ({length} min)")
+                output.append(f"   Start: {local_start.isoformat()}  End: {local_end.isoformat()}")
+        
+        if unavailable:
+            output.append(f"\nWarning: could not read availability for {', '.join(unavailable)}; "
+                          f"they were treated as free.")
+        
+        return "\n".join(output)
+    except ValueError as error:
+        return f"Failed to find free slots. Error: {error}"
+    except HttpError as error:
+        logging.error(f"An error occurred: {error}")
+        return f"Failed to find free slots. Error: {error}"
+
+
+def _ics_path(file_path: str, user_email: Optional[str] = None) -> str:
+    """Resolve a tool's file_path inside the user's directory under ICS_DIR.
+    
+    Users cannot reach each other's exports or import progress. Symlinks are resolved
+    first, so links pointing out of the directory are refused too. Raises ValueError
+    if the path is not an .ics file there.
+    """
+    user_dir = os.path.join(ICS_DIR, hashlib.sha256(_user_cache_key(user_email).encode()).hexdigest()[:16])
+    path = os.path.realpath(os.path.join(user_dir, file_path))
+    if os.path.commonpath([path, user_dir]) != user_dir or path == user_dir:
+        raise ValueError(f"{file_path} is outside your import/export directory {user_dir}")
+    if not path.lower().endswith(".ics"):
+        raise ValueError(f"{file_path} is not an .ics file")
+    return path
+
+
+@mcp.tool()
+def import_ics(file_path: str, calendar_id: str = "primary", resume: bool = True,
+               user_email: Optional[str] = None) -> str:
+    """Import events from an .ics file into a calendar.
+    
+    The file is read one event at a time and events are inserted in batch requests.
+    Progress is saved after every batch, so an interrupted import continues where it
+    stopped when run again. Re-importing is safe: events are matched by their iCal UID.
+    
+    Args:
+        file_path: Name of the .ics file, relative to your import/export directory (under CALENDAR_ICS_DIR).
+        calendar_id: Calendar ID to import into (default: "primary").
+        resume: Continue a previously interrupted import of this file (default: True).
+        user_email: Optional email address for multi-account support.
+    
+    Returns:
+        Counts of imported, skipped and failed events.
+    """
+    try:
+        file_path = _ics_path(file_path, user_email)
+    except ValueError as error:
+        return f"Failed to import ICS. Error: {error}"
+    progress_file = f"{file_path}.progress.json"
+    if not os.path.exists(file_path):
+        return f"Failed to import ICS. Error: file not found: {file_path}"
+    
+    state = {"calendar_id": calendar_id, "position": 0, "imported": 0, "skipped": 0, "failed": 0, "errors": []}
+    if resume and os.path.exists(progress_file):
+        with open(progress_file) as f:
+            saved = json.load(f)
+        if saved.get("calendar_id") == calendar_id:
+            state = saved
+            logging.info(f"Resuming ICS import of {file_path} at event {state['position']}")
+    
+    def save_progress():
+        with open(progress_file, "w") as f:
+            json.dump(state, f)
+    
+    try:
+        service = get_calendar_service(user_email)
+        tz_name = _get_user_timezone()
+        pending: List[Tuple[int, Dict]] = []
+        # Counts for events consumed since the last saved batch
+        staged = {"skipped": 0, "failed": 0, "errors": []}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                state["failed"] += 1
+                state["errors"].append(f"event {int(request_id) + 1}: {exception}")
+            else:
+                state["imported"] += 1
+        
+        def flush(position: int):
+            if pending:
+                batch = service.new_batch_http_request(callback=on_response)
+                for index, body in pending:
+                    batch.add(service.events().import_(calendarId=calendar_id, body=body),
+                              request_id=str(index))
+                execute_batch(batch)
+                pending.clear()
+            state["skipped"] += staged["skipped"]
+            state["failed"] += staged["failed"]
+            state["errors"] += staged["errors"]
+            staged.update(skipped=0, failed=0, errors=[])
+            state["position"] = position
+            save_progress()
+        
+        position = state["position"]
+        with open(file_path, encoding="utf-8") as fp:
+            for index, props in enumerate(iter_vevents(fp)):
+                if index < state["position"]:
+                    continue
+                position = index + 1
+                try:
+                    body = vevent_to_event(props, tz_name)
+                except ValueError as error:
+                    staged["failed"] += 1
+                    staged["errors"].append(f"event {index + 1}: {error}")
+                    continue
+                if body is None:
+                    staged["skipped"] += 1
+                    continue
+                pending.append((index, body))
+                if len(pending) >= BATCH_MAX_REQUESTS:
+                    flush(position)
+        flush(position)
+    except (HttpError, OSError, ValueError) as error:
+        logging.error(f"An error occurred: {error}")
+        return (f"ICS import interrupted after {state['position']} event(s) "
+                f"({state['imported']} imported). Error: {error}\n"
+                f"Run import_ics again with resume=True to continue.")
+    
+    _invalidate_mirror(user_email, calendar_id)
+    os.remove(progress_file)
+    
+    output = [f"""ICS import finished for {file_path}:
+Imported: {state['imported']}
+Skipped (cancelled): {state['skipped']}
+Failed: {state['failed']}"""]
+    if state["errors"]:
+        output.append("\nFirst errors:")
+        output += [f"- {e}" for e in state["errors"][:10]]
+    logging.info(f"Imported {state['imported']} event(s) from {file_path}")
+    return "\n".join(output)
+
+
+@mcp.tool()
+def export_ics(file_path: str, calendar_id: str = "primary", time_min: Optional[str] = None,
+               time_max: Optional[str] = None, user_email: Optional[str] = None) -> str:
+    """Export a calendar to an .ics file.
+    
+    Events are fetched page by page and written as they arrive, so large calendars
+    are exported with constant memory. Recurring events are exported once with
+    their recurrence rules.
+    
+    Args:
+        file_path: Name of the .ics file to write, relative to your import/export directory (under CALENDAR_ICS_DIR).
+        calendar_id: Calendar ID to export (default: "primary").
+        time_min: Optional start of the export range.
+        time_max: Optional end of the export range.
+        user_email: Optional email address for multi-account support.
+    
+    Returns:
+        Number of events written.
+    """
+    try:
+        file_path = _ics_path(file_path, user_email)
+    except ValueError as error:
+        return f"Failed to export ICS. Error: {error}"
+    partial_file = f"{file_path}.part"
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        service = get_calendar_service(user_email)
+        params: Dict[str, Any] = {"calendarId": calendar_id, "maxResults": SYNC_PAGE_SIZE}
+        if time_min:
+            params["timeMin"] = _parse_datetime(time_min)
+        if time_max:
+            params["timeMax"] = _parse_datetime(time_max)
+        
+        count = 0
+        # newline="" keeps the CRLF line endings required by RFC 5545
+        with open(partial_file, "w", encoding="utf-8", newline="") as fp:
+            write_lines(fp, CALENDAR_HEADER)
+            while True:
+                result = service.events().list(**params).execute()
+                for event in result.get("items", []):
+                    write_lines(fp, event_to_vevent(event))
+                    count += 1
+                params["pageToken"] = result.get("nextPageToken")
+                if not params["pageToken"]:
+                    break
+            write_lines(fp, CALENDAR_FOOTER)
+        
+        os.replace(partial_file, file_path)
+        logging.info(f"Exported {count} event(s) to {file_path}")
+        return f"Exported {count} event(s) from {calendar_id} to {file_path}"
+    except DateParseError as error:
+        return f"Failed to export ICS. Error: {error}"
+    except (HttpError, OSError) as error:
+        logging.error(f"An error occurred: {error}")
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        return f"Failed to export ICS. Error: {error}"
+
+
 @mcp.tool()
 def quick_add_event(text: str, calendar_id: str = "primary", user_email: Optional[str] = None) -> str:
     """Quickly add an event using natural language.
@@ -564,6 +1171,7 @@ def quick_add_event(text: str, calendar_id: str = "primary", user_email: Optiona
     try:
         service = get_calendar_service(user_email)
         event = service.events().quickAdd(calendarId=calendar_id, text=text).execute()
+        _invalidate_mirror(user_email, calendar_id)
         
         event_id = event.get("id", "")
         event_link = event.get("htmlLink", "")
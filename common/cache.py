@@ -0,0 +1,287 @@
+"""
+Caches shared by the API server and the MCP servers.
+
+Every backend has the same interface and semantics:
+
+- get(key) returns the value, or None when it is missing or expired
+- set(key, value, ttl) stores a value for `ttl` seconds (None: until evicted)
+- delete(key) drops one entry, invalidate(prefix) every key starting with prefix
+- get_or_set(key, ttl, compute) returns the cached value or stores compute()
+- the least recently used entries are evicted beyond max_entries
+- None is never cached, and a failing backend behaves like an empty cache
+
+Backends:
+
+    MemoryCache    one process; values are kept as they are, so it can hold
+                   objects such as API clients
+    SQLiteCache    a file shared by every process on the host (the MCP servers
+                   run as a new process for each tool call)
+    RedisCache     a Redis-protocol server shared by several hosts; needs the
+                   optional `redis` package
+
+Shared backends store values as JSON.
+
+Configuration:
+    CACHE_URL          memory://, sqlite:///<path> or redis://host:port/db
+                       (default sqlite:///<tmp>/office-assistant-cache.db)
+    CACHE_MAX_ENTRIES  entries kept before LRU eviction (default 10000)
+"""
+
+import functools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from prometheus_client import Counter
+
+DEFAULT_CACHE_URL = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'office-assistant-cache.db')}"
+DEFAULT_MAX_ENTRIES = 10000
+# Keeps our keys apart from anything else on a shared Redis server
+REDIS_KEY_PREFIX = "office-assistant:"
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups, by backend and outcome",
+    ["backend", "outcome"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Cache:
+    """Base class: public methods count hits and misses and survive backend failures."""
+
+    backend = "none"
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+
+    def _get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Any, expires: Optional[float]) -> None:
+        raise NotImplementedError
+
+    def _delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def _invalidate(self, prefix: str) -> int:
+        raise NotImplementedError
+
+    def get(self, key: str) -> Any:
+        try:
+            value = self._get(key)
+        except Exception as e:
+            logger.warning(f"{self.backend} cache read failed for {key}: {e}")
+            value = None
+        CACHE_REQUESTS.labels(backend=self.backend, outcome="miss" if value is None else "hit").inc()
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if value is None:
+            return
+        try:
+            self._set(key, value, time.time() + ttl if ttl is not None else None)
+        except Exception as e:
+            logger.warning(f"{self.backend} cache write failed for {key}: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self._delete(key)
+        except Exception as e:
+            logger.error(f"{self.backend} cache could not delete {key}: {e}")
+
+    def invalidate(self, prefix: str) -> int:
+        """Delete every key that starts with `prefix`; returns how many were removed."""
+        try:
+            return self._invalidate(prefix)
+        except Exception as e:
+            logger.error(f"{self.backend} cache could not invalidate {prefix}*: {e}")
+            return 0
+
+    def get_or_set(self, key: str, ttl: Optional[float], compute: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+
+class MemoryCache(Cache):
+    """LRU dict in this process."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        super().__init__(max_entries)
+        # key -> (expires at or None, value), least recently used first
+        self.entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key: str) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def _set(self, key: str, value: Any, expires: Optional[float]) -> None:
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def _invalidate(self, prefix: str) -> int:
+        with self.lock:
+            keys = [key for key in self.entries if key.startswith(prefix)]
+            for key in keys:
+                del self.entries[key]
+        return len(keys)
+
+
+class SQLiteCache(Cache):
+    """Table in a SQLite file; WAL mode lets processes read while another writes."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str, max_entries: Optional[int] = None) -> None:
+        super().__init__(max_entries)
+        self.path = path
+        self.db: Optional[sqlite3.Connection] = None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+            self.db = db
+        return self.db
+
+    def _get(self, key: str) -> Any:
+        now = time.time()
+        with self.lock:
+            db = self._connect()
+            row = db.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                db.execute("DELETE FROM cache WHERE key = ? AND expires <= ?", (key, now))
+                return None
+            db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, expires: Optional[float]) -> None:
+        now = time.time()
+        with self.lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires, "
+                    "accessed = excluded.accessed",
+                    (key, json.dumps(value), expires, now),
+                )
+                db.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (now,))
+                db.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _delete(self, key: str) -> None:
+        with self.lock:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _invalidate(self, prefix: str) -> int:
+        # substr() instead of LIKE, which would treat % and _ in the prefix as wildcards
+        with self.lock:
+            return self._connect().execute(
+                "DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+            ).rowcount
+
+
+class RedisCache(Cache):
+    """Keys on a Redis-protocol server; TTLs are Redis expirations.
+
+    The server evicts by its own maxmemory-policy (allkeys-lru gives the same
+    LRU behaviour as the other backends), so max_entries is not enforced here.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, max_entries: Optional[int] = None) -> None:
+        super().__init__(max_entries)
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL points at Redis but the `redis` package is not installed") from e
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+    def _get(self, key: str) -> Any:
+        value = self.client.get(REDIS_KEY_PREFIX + key)
+        return json.loads(value) if value is not None else None
+
+    def _set(self, key: str, value: Any, expires: Optional[float]) -> None:
+        ttl_ms = max(1, int((expires - time.time()) * 1000)) if expires is not None else None
+        self.client.set(REDIS_KEY_PREFIX + key, json.dumps(value), px=ttl_ms)
+
+    def _delete(self, key: str) -> None:
+        self.client.delete(REDIS_KEY_PREFIX + key)
+
+    def _invalidate(self, prefix: str) -> int:
+        # Escape glob characters so the prefix matches literally
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in REDIS_KEY_PREFIX + prefix) + "*"
+        removed = 0
+        batch = []
+        for key in self.client.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) == 500:
+                removed += self.client.delete(*batch)
+                batch = []
+        if batch:
+            removed += self.client.delete(*batch)
+        return removed
+
+
+def open_cache(url: str, max_entries: Optional[int] = None) -> Cache:
+    """Cache for a CACHE_URL-style URL."""
+    if url.startswith("memory://"):
+        return MemoryCache(max_entries)
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///"):], max_entries)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, max_entries)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+@functools.lru_cache(maxsize=None)
+def shared_cache() -> Cache:
+    """The cache configured by CACHE_URL, one instance per process."""
+    return open_cache(os.getenv("CACHE_URL") or DEFAULT_CACHE_URL)
@@ -0,0 +1,370 @@
+"""
+Offline stand-in for the Gmail and Calendar REST APIs.
+
+FakeGoogleServer answers the requests the MCP servers make (profile, labels,
+message list/get/send/modify, drafts, calendar list, events with sync tokens,
+free/busy) from deterministic generated mailboxes and calendars, with
+configurable latency and error rates. Point the MCP servers at it with
+GOOGLE_API_ENDPOINT=http://127.0.0.1:<port>/.
+
+Each access token gets its own mailbox and calendar, so load tests with many
+users see independent data. Writes are accepted and echoed back but not kept.
+Batch requests are not faked: googleapiclient sends them to Google's own
+batch URL whatever the endpoint.
+
+With an endpoint override googleapiclient drops the API's service path, so
+Calendar requests arrive without /calendar/v3 while Gmail paths keep /gmail/v1.
+
+Run it on its own with:
+    python common/fake_google.py [--port 8765] [--latency 0.05]
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+LABELS = [
+    {"id": "INBOX", "name": "INBOX", "type": "system"},
+    {"id": "UNREAD", "name": "UNREAD", "type": "system"},
+    {"id": "STARRED", "name": "STARRED", "type": "system"},
+    {"id": "SENT", "name": "SENT", "type": "system"},
+    {"id": "TRASH", "name": "TRASH", "type": "system"},
+    {"id": "Label_1", "name": "Receipts", "type": "user"},
+    {"id": "Label_2", "name": "Newsletters", "type": "user"},
+]
+
+SENDERS = ["alice@example.com", "bob@example.com", "billing@example.com", "news@example.com"]
+SUBJECTS = ["Quarterly report", "Lunch on Friday?", "Your invoice", "Weekly digest", "Project update"]
+EVENT_TITLES = ["Standup", "1:1", "Design review", "Customer call", "Planning", "Focus time"]
+
+
+@dataclass
+class FakeGoogleConfig:
+    """Latencies are in seconds; rates are probabilities per request."""
+    latency: float = 0.05
+    jitter: float = 0.3
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    messages_per_user: int = 200
+    events_per_user: int = 40
+    page_size: int = 100
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeGoogleStats:
+    requests: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+    active: int = 0
+    peak_active: int = 0
+
+
+def _rfc3339(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class _Mailbox:
+    """Generated data of one user; the same token always gets the same data."""
+
+    def __init__(self, token: str, config: FakeGoogleConfig) -> None:
+        rng = random.Random(f"{config.seed}:{token}")
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        self.email = f"user-{hashlib.sha256(token.encode()).hexdigest()[:8]}@example.com"
+
+        self.messages = []
+        for i in range(config.messages_per_user):
+            sent = now - timedelta(hours=i * 3 + rng.randint(0, 2))
+            self.messages.append({
+                "id": f"msg{i:05d}",
+                "threadId": f"thr{i // 3:05d}",
+                "labelIds": ["INBOX"] + (["UNREAD"] if rng.random() < 0.3 else []),
+                "snippet": f"Message {i} snippet",
+                "internalDate": str(int(sent.timestamp() * 1000)),
+                "from": rng.choice(SENDERS),
+                "subject": f"{rng.choice(SUBJECTS)} #{i}",
+                "date": sent.strftime("%a, %d %b %Y %H:%M:%S +0000"),
+            })
+
+        self.events = []
+        start_of_day = now.replace(hour=9)
+        for i in range(config.events_per_user):
+            start = start_of_day + timedelta(days=i // 4, hours=(i % 4) * 2)
+            self.events.append({
+                "kind": "calendar#event",
+                "id": f"evt{i:05d}",
+                "status": "confirmed",
+                "summary": f"{rng.choice(EVENT_TITLES)} #{i}",
+                "start": {"dateTime": _rfc3339(start)},
+                "end": {"dateTime": _rfc3339(start + timedelta(minutes=rng.choice((30, 45, 60))))},
+                "updated": _rfc3339(now),
+                "etag": f'"{i}"',
+            })
+
+    def message(self, message_id: str, fmt: str) -> Optional[dict]:
+        found = next((m for m in self.messages if m["id"] == message_id), None)
+        if found is None:
+            return None
+        headers = [{"name": "From", "value": found["from"]}, {"name": "To", "value": self.email},
+                   {"name": "Subject", "value": found["subject"]}, {"name": "Date", "value": found["date"]}]
+        message = {key: found[key] for key in ("id", "threadId", "labelIds", "snippet", "internalDate")}
+        message["payload"] = {"mimeType": "text/plain", "headers": headers}
+        if fmt == "full":
+            body = f"Hello,\n\nThis is message {message_id}.\n\nRegards"
+            message["payload"]["body"] = {"data": base64.urlsafe_b64encode(body.encode()).decode()}
+        return message
+
+
+class FakeGoogleServer:
+    """Threaded HTTP server implementing the Gmail and Calendar endpoints the tools use."""
+
+    def __init__(self, config: Optional[FakeGoogleConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config or FakeGoogleConfig()
+        self.stats = FakeGoogleStats()
+        self.mailboxes: Dict[str, _Mailbox] = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random(self.config.seed)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "FakeGoogleServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def mailbox(self, token: str) -> _Mailbox:
+        with self.lock:
+            if token not in self.mailboxes:
+                self.mailboxes[token] = _Mailbox(token, self.config)
+            return self.mailboxes[token]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                token = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip() or "anonymous"
+                status, payload = server.handle(self.command, self.path, body, token)
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+        return Handler
+
+    def handle(self, method: str, raw_path: str, body: bytes, token: str) -> Tuple[int, Optional[dict]]:
+        """Status and JSON body for one request, after the configured latency."""
+        with self.lock:
+            self.stats.active += 1
+            self.stats.peak_active = max(self.stats.peak_active, self.stats.active)
+            roll = self.rng.random()
+            delay = self.config.latency * (1 + self.rng.uniform(-self.config.jitter, self.config.jitter))
+        try:
+            time.sleep(max(0.0, delay))
+            url = urlparse(raw_path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            route, params = self._route(method, url.path)
+            with self.lock:
+                self.stats.requests[route] = self.stats.requests.get(route, 0) + 1
+
+            if roll < self.config.rate_limit_rate:
+                return self._error(429, "Rate limit exceeded", "rateLimitExceeded")
+            if roll < self.config.rate_limit_rate + self.config.error_rate:
+                return self._error(503, "Backend error", "backendError")
+            if route == "unknown":
+                return self._error(404, f"No fake for {method} {url.path}", "notFound")
+
+            data = json.loads(body) if body.strip().startswith(b"{") else {}
+            return getattr(self, f"_{route}")(self.mailbox(token), params, query, data)
+        finally:
+            with self.lock:
+                self.stats.active -= 1
+
+    def _error(self, status: int, message: str, reason: str) -> Tuple[int, dict]:
+        with self.lock:
+            self.stats.errors += 1
+        return status, {"error": {"code": status, "message": message,
+                                  "errors": [{"message": message, "domain": "global", "reason": reason}]}}
+
+    ROUTES = [
+        ("GET", r"/gmail/v1/users/[^/]+/profile", "profile"),
+        ("GET", r"/gmail/v1/users/[^/]+/labels", "labels"),
+        ("GET", r"/gmail/v1/users/[^/]+/messages", "messages_list"),
+        ("POST", r"/gmail/v1/users/[^/]+/messages/send", "messages_send"),
+        ("POST", r"/gmail/v1/users/[^/]+/messages/batchModify", "empty"),
+        ("POST", r"/gmail/v1/users/[^/]+/messages/(?P<id>[^/]+)/modify", "messages_get"),
+        ("GET", r"/gmail/v1/users/[^/]+/messages/(?P<id>[^/]+)", "messages_get"),
+        ("POST", r"/gmail/v1/users/[^/]+/drafts", "drafts_create"),
+        ("DELETE", r"/gmail/v1/users/[^/]+/drafts/[^/]+", "empty"),
+        ("GET", r"/users/me/calendarList", "calendar_list"),
+        ("POST", r"/freeBusy", "freebusy"),
+        ("GET", r"/calendars/(?P<cal>[^/]+)/events", "events_list"),
+        ("POST", r"/calendars/(?P<cal>[^/]+)/events(/quickAdd)?", "events_insert"),
+        ("GET", r"/calendars/(?P<cal>[^/]+)/events/(?P<id>[^/]+)", "events_get"),
+        ("PATCH", r"/calendars/(?P<cal>[^/]+)/events/(?P<id>[^/]+)", "events_update"),
+        ("PUT", r"/calendars/(?P<cal>[^/]+)/events/(?P<id>[^/]+)", "events_update"),
+        ("DELETE", r"/calendars/(?P<cal>[^/]+)/events/(?P<id>[^/]+)", "empty"),
+        ("GET", r"/calendars/(?P<cal>[^/]+)", "calendar_get"),
+    ]
+
+    def _route(self, method: str, path: str) -> Tuple[str, dict]:
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                return name, match.groupdict()
+        return "unknown", {}
+
+    def _page(self, items: List[dict], query: dict, key: str, limit_param: str = "maxResults") -> dict:
+        start = int(query.get("pageToken") or 0)
+        size = min(int(query.get(limit_param) or self.config.page_size), self.config.page_size)
+        result = {key: items[start:start + size]}
+        if start + size < len(items):
+            result["nextPageToken"] = str(start + size)
+        return result
+
+    def _empty(self, mailbox, params, query, data):
+        return 204, None
+
+    def _profile(self, mailbox, params, query, data):
+        return 200, {"emailAddress": mailbox.email, "messagesTotal": len(mailbox.messages),
+                     "threadsTotal": len(mailbox.messages) // 3, "historyId": "1000"}
+
+    def _labels(self, mailbox, params, query, data):
+        return 200, {"labels": LABELS}
+
+    def _messages_list(self, mailbox, params, query, data):
+        refs = [{"id": m["id"], "threadId": m["threadId"]} for m in mailbox.messages]
+        result = self._page(refs, query, "messages")
+        result["resultSizeEstimate"] = len(refs)
+        return 200, result
+
+    def _messages_get(self, mailbox, params, query, data):
+        message = mailbox.message(params["id"], query.get("format", "full"))
+        if message is None:
+            return self._error(404, "Requested entity was not found.", "notFound")
+        return 200, message
+
+    def _messages_send(self, mailbox, params, query, data):
+        return 200, {"id": f"sent{int(time.time() * 1000)}", "threadId": data.get("threadId", "thrsent"),
+                     "labelIds": ["SENT"]}
+
+    def _drafts_create(self, mailbox, params, query, data):
+        return 200, {"id": f"draft{int(time.time() * 1000)}", "message": {"id": "msgdraft", "labelIds": ["DRAFT"]}}
+
+    def _calendar_list(self, mailbox, params, query, data):
+        return 200, {"items": [{"id": mailbox.email, "summary": mailbox.email, "primary": True,
+                                "accessRole": "owner", "timeZone": "UTC"}]}
+
+    def _calendar_get(self, mailbox, params, query, data):
+        return 200, {"id": mailbox.email if params["cal"] == "primary" else params["cal"],
+                     "summary": mailbox.email, "timeZone": "UTC"}
+
+    def _events_list(self, mailbox, params, query, data):
+        if query.get("syncToken"):
+            # Nothing changes between syncs
+            return 200, {"items": [], "nextSyncToken": query["syncToken"]}
+        time_min, time_max = _parse_time(query.get("timeMin")), _parse_time(query.get("timeMax"))
+        items = [
+            event for event in mailbox.events
+            if (time_min is None or _parse_time(event["end"]["dateTime"]) > time_min)
+            and (time_max is None or _parse_time(event["start"]["dateTime"]) < time_max)
+            and (not query.get("q") or query["q"].lower() in event["summary"].lower())
+        ]
+        result = self._page(items, query, "items")
+        if "nextPageToken" not in result:
+            result["nextSyncToken"] = "sync-1"
+        result["timeZone"] = "UTC"
+        return 200, result
+
+    def _events_get(self, mailbox, params, query, data):
+        event = next((e for e in mailbox.events if e["id"] == params["id"]), None)
+        if event is None:
+            return self._error(404, "Not Found", "notFound")
+        return 200, event
+
+    def _events_insert(self, mailbox, params, query, data):
+        start = datetime.now(timezone.utc) + timedelta(days=1)
+        event = {"kind": "calendar#event", "id": f"new{int(time.time() * 1000)}", "status": "confirmed",
+                 "summary": query.get("text", ""), "start": {"dateTime": _rfc3339(start)},
+                 "end": {"dateTime": _rfc3339(start + timedelta(hours=1))}, "htmlLink": "https://calendar.example"}
+        event.update(data)
+        return 200, event
+
+    def _events_update(self, mailbox, params, query, data):
+        status, event = self._events_get(mailbox, params, query, data)
+        return (status, {**event, **data}) if status == 200 else (status, event)
+
+    def _freebusy(self, mailbox, params, query, data):
+        time_min, time_max = _parse_time(data.get("timeMin")), _parse_time(data.get("timeMax"))
+        busy = [
+            {"start": event["start"]["dateTime"], "end": event["end"]["dateTime"]}
+            for event in mailbox.events
+            if (time_min is None or _parse_time(event["end"]["dateTime"]) > time_min)
+            and (time_max is None or _parse_time(event["start"]["dateTime"]) < time_max)
+        ]
+        calendars = {item.get("id", "primary"): {"busy": busy} for item in data.get("items", [])}
+        return 200, {"kind": "calendar#freeBusy", "timeMin": data.get("timeMin"),
+                     "timeMax": data.get("timeMax"), "calendars": calendars}
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    config = FakeGoogleConfig(latency=args.latency, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    server = FakeGoogleServer(config, args.host, args.port)
+    print(f"Fake Google APIs on {server.url} (set GOOGLE_API_ENDPOINT={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
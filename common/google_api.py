@@ -0,0 +1,306 @@
+"""
+Rate limiting and retries for every Google API request the MCP servers make.
+
+Build services with requestBuilder=request_builder(user) and each .execute()
+goes through this module:
+
+- Quota: each call is charged its quota cost (Gmail counts units per method,
+  e.g. messages.send costs 100 and messages.get 5; Calendar counts requests)
+  against a token bucket per API and user. A call that would overdraw the
+  bucket sleeps until its tokens have refilled, which smooths bursts such as
+  bulk imports instead of running into 429s.
+- Retries: 429s, rate-limit 403s and, for idempotent methods, 5xx responses
+  and connection errors are retried with jittered exponential backoff. A
+  Retry-After header, if present, sets the delay instead.
+
+The agent starts a new MCP server process for every tool call, so the
+buckets live in lock-protected files under GOOGLE_RATE_LIMIT_DIR and every
+process of the same user draws from the same one.
+
+Configuration:
+    GOOGLE_RATE_LIMITS        JSON of api -> tokens per second (default gmail 250, calendar 10)
+    GOOGLE_API_MAX_RETRIES    retries per request (default 5)
+    GOOGLE_RATE_LIMIT_DIR     bucket state directory (default <tmp>/office-assistant-ratelimit)
+    GOOGLE_API_ENDPOINT       send every request to this base URL instead, e.g. the offline
+                              fake in common/fake_google.py used by the benchmarks
+"""
+
+import email.utils
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Dict, Iterable, Optional
+
+from googleapiclient.errors import HttpError
+from opentelemetry import trace
+from prometheus_client import Counter, Histogram
+
+from google_http import TracedHttpRequest
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets are only shared within one process
+    fcntl = None
+
+# Per-user limits: Gmail allows 15,000 quota units a minute, Calendar about 600 requests
+DEFAULT_RATES = {"gmail": 250.0, "calendar": 10.0}
+
+# Gmail quota units per method (https://developers.google.com/gmail/api/reference/quota)
+GMAIL_QUOTA_COSTS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.labels.list": 1,
+    "gmail.users.labels.get": 1,
+    "gmail.users.labels.create": 5,
+    "gmail.users.labels.update": 5,
+    "gmail.users.labels.patch": 5,
+    "gmail.users.labels.delete": 5,
+    "gmail.users.drafts.list": 5,
+    "gmail.users.drafts.get": 5,
+    "gmail.users.drafts.create": 10,
+    "gmail.users.drafts.update": 15,
+    "gmail.users.drafts.delete": 10,
+    "gmail.users.drafts.send": 100,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.attachments.get": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.messages.trash": 5,
+    "gmail.users.messages.untrash": 5,
+    "gmail.users.messages.delete": 10,
+    "gmail.users.messages.import": 25,
+    "gmail.users.messages.insert": 25,
+    "gmail.users.messages.batchModify": 50,
+    "gmail.users.messages.batchDelete": 50,
+    "gmail.users.messages.send": 100,
+    "gmail.users.threads.list": 10,
+    "gmail.users.threads.get": 10,
+    "gmail.users.threads.modify": 10,
+    "gmail.users.threads.trash": 10,
+    "gmail.users.threads.delete": 20,
+}
+DEFAULT_GMAIL_COST = 5
+
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_CAP = 32.0
+# A Retry-After longer than this is not waited out; the error goes back to the tool
+MAX_RETRY_AFTER = 60.0
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+# Only these are safe to resend when the outcome of the first attempt is unknown
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT")
+
+QUOTA_UNITS = Counter(
+    "google_api_quota_units_total",
+    "Quota units charged to the rate limiter",
+    ["api"],
+)
+
+THROTTLE_SECONDS = Histogram(
+    "google_api_throttle_seconds",
+    "Time throttled requests waited for rate limiter tokens",
+    ["api"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+RETRIES = Counter(
+    "google_api_retries_total",
+    "Google API requests retried, by cause",
+    ["api", "reason"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket whose state is kept in a file shared by every process.
+
+    reserve() takes the tokens right away, going into debt if needed, and
+    returns how long the caller has to wait for the debt to be paid back. So
+    concurrent callers queue up in the order they reserved.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: Optional[float] = None) -> None:
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity or rate
+
+    def reserve(self, cost: float) -> float:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.loads(f.read())
+            except ValueError:
+                state = {}
+
+            now = time.time()
+            tokens = state.get("tokens", self.capacity)
+            tokens = min(self.capacity, tokens + (now - state.get("updated", now)) * self.rate)
+            tokens -= cost
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps({"tokens": tokens, "updated": now}))
+            # Closing the file releases the lock
+        return max(0.0, -tokens / self.rate)
+
+
+def _rates() -> Dict[str, float]:
+    return {**DEFAULT_RATES, **json.loads(os.getenv("GOOGLE_RATE_LIMITS") or "{}")}
+
+
+def _api(method_id: Optional[str]) -> str:
+    return (method_id or "unknown").split(".", 1)[0]
+
+
+def quota_cost(method_id: Optional[str]) -> int:
+    """Quota units a call of the given API method costs."""
+    if _api(method_id) == "gmail":
+        return GMAIL_QUOTA_COSTS.get(method_id, DEFAULT_GMAIL_COST)
+    return 1
+
+
+def _bucket(api: str, user: str) -> TokenBucket:
+    directory = os.getenv("GOOGLE_RATE_LIMIT_DIR",
+                          os.path.join(tempfile.gettempdir(), "office-assistant-ratelimit"))
+    user_hash = hashlib.sha256(user.encode()).hexdigest()[:16]
+    rate = float(_rates().get(api, DEFAULT_RATES["calendar"]))
+    return TokenBucket(os.path.join(directory, f"{api}-{user_hash}.json"), rate)
+
+
+def acquire(api: str, user: str, cost: int) -> None:
+    """Charge `cost` units to the user's bucket for `api`, sleeping if it runs dry."""
+    QUOTA_UNITS.labels(api=api).inc(cost)
+    wait = _bucket(api, user).reserve(cost)
+    if wait > 0:
+        THROTTLE_SECONDS.labels(api=api).observe(wait)
+        trace.get_current_span().add_event("google throttled", {"google.api": api, "wait_seconds": wait})
+        logger.info(f"Throttling {api} call for {wait:.2f}s to stay within quota")
+        time.sleep(wait)
+
+
+def _retry_after(error: HttpError) -> Optional[float]:
+    """Delay the server asked for, in seconds (the header is either seconds or an HTTP date)."""
+    value = error.resp.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _is_rate_limited(error: HttpError) -> bool:
+    if error.resp.status == 429:
+        return True
+    if error.resp.status != 403:
+        return False
+    details = error.error_details if isinstance(error.error_details, list) else []
+    return any(isinstance(detail, dict) and detail.get("reason") in RATE_LIMIT_REASONS for detail in details)
+
+
+def _retry_reason(error: Exception, idempotent: bool) -> Optional[str]:
+    """Why `error` can be retried (a status code or "connection"), or None if it cannot."""
+    if isinstance(error, HttpError):
+        if _is_rate_limited(error):
+            return str(error.resp.status)
+        if error.resp.status >= 500 and idempotent:
+            return str(error.resp.status)
+        return None
+    if isinstance(error, (ConnectionError, TimeoutError)) and idempotent:
+        return "connection"
+    return None
+
+
+def _backoff(attempt: int, error: Exception) -> Optional[float]:
+    """Seconds to wait before the next attempt, or None to give up."""
+    retry_after = _retry_after(error) if isinstance(error, HttpError) else None
+    if retry_after is not None:
+        if retry_after > MAX_RETRY_AFTER:
+            return None
+        # A little jitter so callers told the same Retry-After do not return together
+        return retry_after + random.uniform(0, RETRY_BACKOFF_BASE)
+    # Full jitter: anywhere between zero and the exponential ceiling
+    return random.uniform(0, min(RETRY_BACKOFF_CAP, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def call_with_retries(api: str, call, idempotent: bool):
+    """Run call() and retry it on rate limits and transient failures."""
+    max_retries = int(os.getenv("GOOGLE_API_MAX_RETRIES", "5"))
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except (HttpError, ConnectionError, TimeoutError) as error:
+            reason = _retry_reason(error, idempotent)
+            delay = _backoff(attempt, error) if reason and attempt < max_retries else None
+            if delay is None:
+                raise
+            attempt += 1
+            RETRIES.labels(api=api, reason=reason).inc()
+            trace.get_current_span().add_event("google retry", {"google.api": api, "reason": reason,
+                                                                "attempt": attempt, "delay_seconds": delay})
+            logger.warning(f"Retrying {api} call in {delay:.2f}s (attempt {attempt}, reason {reason})")
+            time.sleep(delay)
+
+
+class RateLimitedHttpRequest(TracedHttpRequest):
+    """HttpRequest that is rate limited per user and retried on transient errors."""
+
+    def __init__(self, *args, quota_user: str = "default", **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.quota_user = quota_user
+
+    def execute(self, http=None, num_retries=0):
+        api = _api(self.methodId)
+        # Every attempt counts against the quota, retries included
+        def attempt():
+            acquire(api, self.quota_user, quota_cost(self.methodId))
+            return super(RateLimitedHttpRequest, self).execute(http=http, num_retries=0)
+
+        return call_with_retries(api, attempt, self.method in IDEMPOTENT_METHODS)
+
+
+def client_options() -> Optional[Dict[str, str]]:
+    """client_options for build(), pointing the service at GOOGLE_API_ENDPOINT if it is set."""
+    endpoint = os.getenv("GOOGLE_API_ENDPOINT")
+    return {"api_endpoint": endpoint.rstrip("/") + "/"} if endpoint else None
+
+
+def request_builder(user: str):
+    """requestBuilder for build() whose requests are charged to `user`'s quota."""
+    return functools.partial(RateLimitedHttpRequest, quota_user=user)
+
+
+def _batch_requests(batch) -> Iterable:
+    # BatchHttpRequest has no public accessor for the requests added to it
+    return batch._requests.values()
+
+
+def execute_batch(batch) -> None:
+    """Execute a BatchHttpRequest, charging the quota of every request in it.
+
+    Only a rate-limited batch as a whole is retried: nothing in it has run.
+    Failures of single requests go to the batch callback as usual.
+    """
+    requests = list(_batch_requests(batch))
+    if not requests:
+        return
+    api = _api(requests[0].methodId)
+    user = getattr(requests[0], "quota_user", "default")
+
+    def attempt():
+        acquire(api, user, sum(quota_cost(request.methodId) for request in requests))
+        return batch.execute()
+
+    call_with_retries(api, attempt, idempotent=False)
@@ -0,0 +1,32 @@
+"""
+googleapiclient request class that traces every API call.
+
+Each .execute() becomes a client span named after the API method (e.g.
+calendar.events.list), so the time a tool spends waiting on Google shows up
+in the trace. The servers use it through google_api.RateLimitedHttpRequest,
+which adds rate limiting and retries; every attempt gets its own span.
+"""
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+tracer = trace.get_tracer("officeagent.google")
+
+
+class TracedHttpRequest(HttpRequest):
+    """HttpRequest whose execute() runs inside an OpenTelemetry client span."""
+
+    def execute(self, http=None, num_retries=0):
+        with tracer.start_as_current_span(
+            f"google {self.methodId or self.method}",
+            kind=SpanKind.CLIENT,
+            attributes={"http.request.method": self.method, "google.api.method": self.methodId or ""},
+        ) as span:
+            try:
+                return super().execute(http=http, num_retries=num_retries)
+            except HttpError as error:
+                span.set_attribute("http.response.status_code", error.resp.status)
+                span.set_status(Status(StatusCode.ERROR, str(error.resp.status)))
+                raise
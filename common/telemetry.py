@@ -0,0 +1,92 @@
+"""
+OpenTelemetry tracing shared by the API server and the MCP servers.
+
+Tracing is off unless TRACING_EXPORTER is set:
+- file: one JSON span per line appended to TRACING_FILE (default logs/traces.jsonl)
+- otlp: OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. a local collector)
+
+The API injects its trace context into the `_meta` field of every MCP
+tools/call request, and the servers continue the trace from it, so a chat
+turn shows up as one trace across the stdio boundary. The MCP servers inherit
+TRACING_EXPORTER and TRACING_FILE from the API's environment.
+"""
+
+import os
+from typing import Any, Awaitable, Callable, Dict
+
+from fastmcp.server.middleware import Middleware
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+from opentelemetry.trace import SpanKind
+
+DEFAULT_TRACING_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "traces.jsonl")
+
+tracer = trace.get_tracer("officeagent")
+
+
+def setup_tracing(service_name: str, batch: bool = True) -> bool:
+    """Install the global tracer provider for this process; False if tracing is off.
+
+    Short-lived processes (one MCP server per tool call) should pass
+    batch=False so spans are exported before the process exits.
+    """
+    exporter_name = os.getenv("TRACING_EXPORTER", "").lower()
+    if exporter_name == "file":
+        trace_file = os.getenv("TRACING_FILE", DEFAULT_TRACING_FILE)
+        os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+        exporter = ConsoleSpanExporter(
+            out=open(trace_file, "a"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    elif exporter_name == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    else:
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    return True
+
+
+def inject_context() -> Dict[str, str]:
+    """Current trace context as a carrier dict (traceparent/tracestate)."""
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def _meta_carrier(meta: Any) -> Dict[str, str]:
+    """Carrier fields from an MCP request's _meta (a pydantic model or dict)."""
+    if meta is None:
+        return {}
+    if not isinstance(meta, dict):
+        meta = meta.model_dump()
+    return {key: value for key, value in meta.items() if isinstance(value, str)}
+
+
+async def traced_tool_call(server: str, tool: str, meta: Any, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Await call() inside a server span that continues the caller's trace from `meta`."""
+    parent = propagate.extract(_meta_carrier(meta))
+    with tracer.start_as_current_span(
+        f"tool {tool}",
+        context=parent,
+        kind=SpanKind.SERVER,
+        attributes={"mcp.server": server, "mcp.tool": tool},
+    ):
+        return await call()
+
+
+class ToolTracingMiddleware(Middleware):
+    """fastmcp middleware that traces every tool call of one server."""
+
+    def __init__(self, server: str) -> None:
+        self.server = server
+
+    async def on_call_tool(self, context, call_next):
+        # fastmcp rebuilds the request params without _meta; the original is on the request context
+        meta = context.fastmcp_context.request_context.meta if context.fastmcp_context else None
+        return await traced_tool_call(self.server, context.message.name, meta, lambda: call_next(context))
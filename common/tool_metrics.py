@@ -0,0 +1,61 @@
+"""
+Prometheus metrics for MCP tool calls, recorded inside the MCP servers.
+
+The agent starts a fresh stdio server process for every tool call, so the
+values only survive if prometheus_client runs in multiprocess mode: the API
+server sets PROMETHEUS_MULTIPROC_DIR, the MCP servers inherit it, and the
+API's /metrics endpoint aggregates the files every process writes there
+(merging those of exited processes into an archive file, see
+backend/metrics.py). Without the variable the metrics stay in memory and die
+with the process.
+"""
+
+import time
+from typing import Any, Awaitable, Callable
+
+from fastmcp.server.middleware import Middleware
+from prometheus_client import Histogram
+
+TOOL_DURATION = Histogram(
+    "mcp_tool_duration_seconds",
+    "Duration of MCP tool calls, measured inside the server",
+    ["server", "tool", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# Tools report failures as text instead of raising, e.g. "Failed to list events. Error: ..."
+ERROR_PREFIXES = ("Failed to", "Error")
+
+
+def _result_text(result: Any) -> str:
+    """Text of the first content block of a tool result, or "" if there is none."""
+    content = getattr(result, "content", result)
+    if isinstance(content, tuple):
+        # (unstructured content, structured content)
+        content = content[0]
+    if isinstance(content, (list, tuple)) and content:
+        return getattr(content[0], "text", "") or ""
+    return ""
+
+
+async def timed_tool_call(server: str, tool: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Await call() and record its duration, labelled ok or error."""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        result = await call()
+        if not _result_text(result).startswith(ERROR_PREFIXES):
+            status = "ok"
+        return result
+    finally:
+        TOOL_DURATION.labels(server=server, tool=tool, status=status).observe(time.perf_counter() - started)
+
+
+class ToolMetricsMiddleware(Middleware):
+    """fastmcp middleware that times every tool call of one server."""
+
+    def __init__(self, server: str) -> None:
+        self.server = server
+
+    async def on_call_tool(self, context, call_next):
+        return await timed_tool_call(self.server, context.message.name, lambda: call_next(context))
@@ -1,4 +1,6 @@
+import 'dart:async';
 import 'dart:convert';
+import 'dart:math';
 import 'package:http/http.dart' as http;
 import 'package:flutter/foundation.dart' show kIsWeb;
 
@@ -19,29 +21,47 @@ class ChatService {
     }
   }
   
+  static const Duration requestTimeout = Duration(seconds: 60);
+  static const int maxAttempts = 3;
+  final Random _random = Random.secure();
+  
+  // One id per message; its retries reuse it so the server answers them from the first attempt
+  String _newRequestId() =>
+      List.generate(16, (_) => _random.nextInt(256).toRadixString(16).padLeft(2, '0')).join();
+  
   Future<String> sendMessage({
     required String message,
     required String userId,
     required String accessToken,
   }) async {
+    final requestId = _newRequestId();
     try {
-      final response = await http.post(
-        Uri.parse('$baseUrl/api/chat'),  // Updated endpoint
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: jsonEncode({
-          'message': message,
-          'user_id': userId,  // Added user_id
-          'access_token': accessToken,  // Added access_token
-        }),
-      );
-      
-      if (response.statusCode == 200) {
-        final data = jsonDecode(response.body);
-        return data['response'] ?? 'No response';
-      } else {
-        return 'Error: ${response.statusCode} - ${response.body}';
+      for (var attempt = 1; ; attempt++) {
+        try {
+          final response = await http.post(
+            Uri.parse('$baseUrl/api/chat'),  // Updated endpoint
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            body: jsonEncode({
+              'message': message,
+              'user_id': userId,  // Added user_id
+              'access_token': accessToken,  // Added access_token
+              'request_id': requestId,
+            }),
+          ).timeout(requestTimeout);
+          
+          if (response.statusCode == 200) {
+            final data = jsonDecode(response.body);
+            return data['response'] ?? 'No response';
+          } else {
+            return 'Error: ${response.statusCode} - ${response.body}';
+          }
+        } on TimeoutException {
+          if (attempt >= maxAttempts) rethrow;
+        } on http.ClientException {
+          if (attempt >= maxAttempts) rethrow;
+        }
       }
     } catch (e) {
       return 'Error: $e';
@@ -9,6 +9,7 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import hashlib
 import json
+import sys
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -17,6 +18,13 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from fastmcp import FastMCP
 
+# Helpers shared by the MCP servers live in the top-level common/ directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from cache import MemoryCache, shared_cache
+from google_api import client_options, request_builder
+from telemetry import ToolTracingMiddleware, setup_tracing
+from tool_metrics import ToolMetricsMiddleware
+
 # Define the scopes required for the Gmail API
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.send",
@@ -35,10 +43,21 @@ ATTACHMENTS_DIR = os.path.join(BASE_DIR, "attachments")
 os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
 
 logging.basicConfig(level=logging.INFO)
-mcp = FastMCP("Gmail Manager")
+setup_tracing("mcp-gmail", batch=False)
+mcp = FastMCP("Gmail Manager", middleware=[ToolTracingMiddleware("gmail"), ToolMetricsMiddleware("gmail")])
+
+# Authenticated services; they hold live HTTP clients, so they stay in this process.
+# Access tokens last an hour, so a service is rebuilt before its token runs out.
+_service_cache = MemoryCache(max_entries=64)
+SERVICE_CACHE_TTL = 50 * 60
+
+# Slow-changing API results, shared by every server process on the host
+shared = shared_cache()
+METADATA_TTL = float(os.getenv("CACHE_METADATA_TTL_SECONDS", "300"))
 
-# Cache for authenticated services
-_service_cache: Dict[str, Any] = {}
+# Gmail API limits for bulk operations
+LIST_PAGE_SIZE = 500
+BATCH_MODIFY_LIMIT = 1000
 
 
 def _get_token_file(user_email: Optional[str] = None) -> str:
@@ -49,6 +68,13 @@ def _get_token_file(user_email: Optional[str] = None) -> str:
     return os.path.join(BASE_DIR, "token.json")
 
 
+def _user_cache_key(user_email: Optional[str] = None) -> str:
+    """Get the per-user key used for the service cache and the shared cache."""
+    if os.getenv("GOOGLE_ACCESS_TOKEN"):
+        return os.getenv("USER_ID") or "token_user"
+    return user_email or "default"
+
+
 def get_gmail_service(user_email: Optional[str] = None):
     """Authenticates and returns an authorized Gmail API service instance.
     
@@ -63,11 +89,12 @@ def get_gmail_service(user_email: Optional[str] = None):
     if access_token:
         # Production mode: Use access token from environment
         # In production, Flutter will provide a full OAuth token
-        cache_key = user_id or "token_user"
+        cache_key = _user_cache_key(user_email)
         
         # Return cached service if available
-        if cache_key in _service_cache:
-            return _service_cache[cache_key]
+        service = _service_cache.get(cache_key)
+        if service is not None:
+            return service
         
         # For development: If we have a full token.json, use it
         # This happens when we auto-load from token.json in dev mode
@@ -81,17 +108,19 @@ def get_gmail_service(user_email: Optional[str] = None):
             creds = Credentials(token=access_token)
         
         # Build the Gmail service
-        service = build("gmail", "v1", credentials=creds)
-        _service_cache[cache_key] = service
+        service = build("gmail", "v1", credentials=creds, requestBuilder=request_builder(cache_key),
+                        client_options=client_options())
+        _service_cache.set(cache_key, service, SERVICE_CACHE_TTL)
         logging.info(f"Gmail service created for user: {user_id}")
         return service
     
     # Development mode: Use OAuth flow with credentials.json
-    cache_key = user_email or "default"
+    cache_key = _user_cache_key(user_email)
     
     # Return cached service if available
-    if cache_key in _service_cache:
-        return _service_cache[cache_key]
+    service = _service_cache.get(cache_key)
+    if service is not None:
+        return service
     
     token_file = _get_token_file(user_email)
     creds = None
@@ -113,8 +142,9 @@ def get_gmail_service(user_email: Optional[str] = None):
             token.write(creds.to_json())
     
     # Build the Gmail service
-    service = build("gmail", "v1", credentials=creds)
-    _service_cache[cache_key] = service
+    service = build("gmail", "v1", credentials=creds, requestBuilder=request_builder(cache_key),
+                    client_options=client_options())
+    _service_cache.set(cache_key, service, SERVICE_CACHE_TTL)
     return service
 
 
@@ -189,6 +219,73 @@ def _create_message(to: str, subject: str, body: str, cc: Optional[str] = None,
     return result
 
 
+def _list_message_ids(service, query: Optional[str] = None, include_spam_trash: bool = False,
+                      limit: Optional[int] = None) -> List[str]:
+    """Collect message IDs matching a query, following nextPageToken."""
+    ids: List[str] = []
+    page_token = None
+
+    while True:
+        page_size = LIST_PAGE_SIZE if limit is None else min(LIST_PAGE_SIZE, limit - len(ids))
+        results = service.users().messages().list(
+            userId="me",
+            q=query,
+            includeSpamTrash=include_spam_trash,
+            maxResults=page_size,
+            pageToken=page_token
+        ).execute()
+
+        ids.extend(msg["id"] for msg in results.get("messages", []))
+        page_token = results.get("nextPageToken")
+
+        if not page_token or (limit is not None and len(ids) >= limit):
+            break
+
+    return ids
+
+
+def _labels_key(user_email: Optional[str]) -> str:
+    return f"gmail:labels:{_user_cache_key(user_email)}"
+
+
+def _list_labels(service, user_email: Optional[str]) -> List[Dict[str, Any]]:
+    """The user's labels; they rarely change, so they are cached for METADATA_TTL."""
+    return shared.get_or_set(
+        _labels_key(user_email),
+        METADATA_TTL,
+        lambda: service.users().labels().list(userId="me").execute().get("labels", []),
+    )
+
+
+def _resolve_label_ids(service, labels: Optional[str], user_email: Optional[str] = None) -> List[str]:
+    """Map comma-separated label names or IDs to Gmail label IDs.
+
+    System labels (INBOX, UNREAD, STARRED, ...) can be given by name in any case;
+    user labels are matched by their display name.
+    """
+    if not labels:
+        return []
+
+    names = [label.strip() for label in labels.split(",") if label.strip()]
+    label_ids = _match_labels(names, _list_labels(service, user_email))
+    if None in label_ids:
+        # The cached labels may predate a label the user just created
+        shared.delete(_labels_key(user_email))
+        label_ids = _match_labels(names, _list_labels(service, user_email))
+
+    for name, label_id in zip(names, label_ids):
+        if not label_id:
+            raise ValueError(f"Unknown label: {name}")
+    return label_ids
+
+
+def _match_labels(names: List[str], existing: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """Label ID for each name, or None where nothing matches."""
+    by_id = {label["id"]: label["id"] for label in existing}
+    by_name = {label["name"].lower(): label["id"] for label in existing}
+    return [by_id.get(name) or by_name.get(name.lower()) or by_id.get(name.upper()) for name in names]
+
+
 # ============================================================================
 # MCP TOOLS
 # ============================================================================
@@ -369,6 +466,70 @@ Date: {headers.get('date', 'N/A')}
         return f"Failed to get emails. Error: {error}"
 
 
+@mcp.tool()
+def modify_emails(message_ids: Optional[str] = None, query: Optional[str] = None,
+                  add_labels: Optional[str] = None, remove_labels: Optional[str] = None,
+                  include_spam_trash: bool = False, max_messages: Optional[int] = None,
+                  user_email: Optional[str] = None) -> str:
+    """Add or remove labels on many emails at once (archive, mark read, label, star...).
+
+    Args:
+        message_ids: Comma-separated list of message IDs to modify.
+        query: Gmail search query selecting the messages to modify (used when message_ids is not given).
+        add_labels: Comma-separated label names or IDs to add (e.g., "STARRED", "Receipts").
+        remove_labels: Comma-separated label names or IDs to remove (e.g., "INBOX", "UNREAD").
+        include_spam_trash: Whether the query should also match spam and trash (default: False).
+        max_messages: Optional cap on the number of messages matched by the query.
+        user_email: Optional email address for multi-account support.
+
+    Returns:
+        Number of messages modified and the label changes applied.
+
+    Examples:
+        - Archive: query="from:newsletter@example.com", remove_labels="INBOX"
+        - Mark read: query="is:unread older_than:7d", remove_labels="UNREAD"
+        - Label: message_ids="18c1...,18c2...", add_labels="Receipts"
+    """
+    if not message_ids and not query:
+        return "Failed to modify emails. Error: provide either message_ids or query."
+    if not add_labels and not remove_labels:
+        return "Failed to modify emails. Error: provide add_labels and/or remove_labels."
+
+    try:
+        service = get_gmail_service(user_email)
+
+        add_label_ids = _resolve_label_ids(service, add_labels, user_email)
+        remove_label_ids = _resolve_label_ids(service, remove_labels, user_email)
+
+        if message_ids:
+            ids = [mid.strip() for mid in message_ids.split(",") if mid.strip()]
+        else:
+            ids = _list_message_ids(service, query, include_spam_trash, max_messages)
+
+        if not ids:
+            return "No emails matched. Nothing was modified."
+
+        batches = 0
+        for i in range(0, len(ids), BATCH_MODIFY_LIMIT):
+            body = {"ids": ids[i:i + BATCH_MODIFY_LIMIT]}
+            if add_label_ids:
+                body["addLabelIds"] = add_label_ids
+            if remove_label_ids:
+                body["removeLabelIds"] = remove_label_ids
+            service.users().messages().batchModify(userId="me", body=body).execute()
+            batches += 1
+
+        logging.info(f"Modified {len(ids)} email(s) in {batches} batch(es)")
+        return f"""Modified {len(ids)} email(s) in {batches} batch request(s).
+Labels added: {', '.join(add_label_ids) or 'none'}
+Labels removed: {', '.join(remove_label_ids) or 'none'}"""
+    except ValueError as error:
+        return f"Failed to modify emails. Error: {error}"
+    except HttpError as error:
+        logging.error(f"An error occurred: {error}")
+        return f"Failed to modify emails. Error: {error}"
+
+
 @mcp.tool()
 def create_draft(to: str, subject: str, body: str, cc: Optional[str] = None, 
                 bcc: Optional[str] = None, user_email: Optional[str] = None) -> str:
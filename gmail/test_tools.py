@@ -25,6 +25,7 @@ def main():
         'search_emails',
         'get_email',
         'get_emails',
+        'modify_emails',
         'create_draft',
         'delete_draft',
         'reply_to_email',
@@ -69,7 +70,9 @@ def main():
         '_parse_email_headers',
         '_format_email_summary',
         '_get_email_body',
-        '_create_message'
+        '_create_message',
+        '_list_message_ids',
+        '_resolve_label_ids'
     ]
     
     for func_name in helper_functions:
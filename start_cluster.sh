@@ -0,0 +1,36 @@
+#!/bin/bash
+
+# Office Assistant local cluster
+# Starts several api_server_v2 replicas that share users by consistent hashing.
+# Usage: ./start_cluster.sh [replicas] [first port]   (default: 3 replicas from port 8001)
+# Any replica accepts any request; requests for another replica's users are forwarded.
+
+COUNT=${1:-3}
+BASE_PORT=${2:-8001}
+
+REPLICAS=""
+for ((i = 0; i < COUNT; i++)); do
+    REPLICAS+="${REPLICAS:+,}r$i=http://127.0.0.1:$((BASE_PORT + i))"
+done
+
+echo "🚀 Starting $COUNT Office Assistant replicas..."
+echo "=================================="
+
+# Replicas accept forwarded requests and warm-ups only with the shared secret
+export CLUSTER_SECRET=${CLUSTER_SECRET:-$(python3 -c 'import secrets; print(secrets.token_hex(16))')}
+
+PIDS=()
+for ((i = 0; i < COUNT; i++)); do
+    PORT=$((BASE_PORT + i))
+    echo "✨ Replica r$i on http://localhost:$PORT"
+    # Each replica needs its own metrics directory, cleared so totals start from zero;
+    # the Google rate limit buckets stay shared
+    METRICS_DIR="${TMPDIR:-/tmp}/office-assistant-metrics-r$i"
+    rm -rf "$METRICS_DIR"
+    CLUSTER_REPLICAS=$REPLICAS CLUSTER_SELF=r$i PORT=$PORT METRICS_DIR=$METRICS_DIR \
+        python3 api_server_v2.py &
+    PIDS+=($!)
+done
+
+trap 'echo ""; echo "🛑 Stopping replicas..."; kill "${PIDS[@]}" 2>/dev/null' INT TERM
+wait
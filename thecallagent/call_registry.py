@@ -0,0 +1,174 @@
+"""
+Registry of outbound calls and their live state.
+
+start_call() returns a call ID immediately and dials in the background. The
+call then moves through dialing -> ringing -> connected -> ended (or failed),
+tracked from the SIP participant's sip.callStatus attribute. Every transition
+is persisted to the call store and pushed to watchers, which back the API's
+status endpoint and SSE stream.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from livekit import api
+
+from thecallagent.call_store import CallStore
+from thecallagent.livekit_client import dial_sip_participant, dispatch_agent, get_livekit_api, new_call_identity
+
+logger = logging.getLogger("call-registry")
+logger.setLevel(logging.INFO)
+
+# Configuration
+TRACK_POLL_SECONDS = float(os.getenv("CALL_TRACK_POLL_SECONDS", "1"))
+# Failed status polls in a row (with backoff) before a call is given up as failed
+TRACK_MAX_ERRORS = int(os.getenv("CALL_TRACK_MAX_ERRORS", "5"))
+TRACK_MAX_BACKOFF_SECONDS = 30.0
+MAX_CALL_SECONDS = 30 * 60
+
+TERMINAL_STATUSES = ("ended", "failed")
+
+# LiveKit sip.callStatus attribute values mapped to registry states
+SIP_CALL_STATUSES = {
+    "dialing": "dialing",
+    "ringing": "ringing",
+    "active": "connected",
+    "automation": "connected",
+    "hangup": "ended",
+}
+
+
+def _with_durations(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Add ring, talk and total durations (seconds) to a call record."""
+    now = time.time()
+    end = record["ended_at"] or now
+    record["ring_seconds"] = round((record["connected_at"] or end) - record["created_at"], 1)
+    record["talk_seconds"] = round(end - record["connected_at"], 1) if record["connected_at"] else 0.0
+    record["total_seconds"] = round(end - record["created_at"], 1)
+    return record
+
+
+class CallRegistry:
+    """Places calls in the background and tracks their state."""
+
+    def __init__(self, store: Optional[CallStore] = None):
+        self.store = store or CallStore()
+        self.watchers: Dict[str, Set[asyncio.Queue]] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def start_call(self, phone_number: str, trunk_id: str, metadata: Optional[str] = None) -> str:
+        """Register a call, start dialing it in the background and return its call ID."""
+        call_id, room_name, identity = new_call_identity(phone_number)
+        self.store.create_call(call_id, room_name, phone_number, "dialing")
+
+        task = asyncio.create_task(self._run(call_id, room_name, identity, phone_number, trunk_id,
+                                             metadata or phone_number))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return call_id
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        """Return a call by call ID, room name, dispatch ID or SIP participant ID."""
+        record = self.store.get_call(ref)
+        return _with_durations(record) if record else None
+
+    async def watch(self, ref: str, heartbeat_seconds: float = 15) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield the call record now and after every state change until the call ends.
+
+        Yields None when nothing changed for heartbeat_seconds, so streams can send keep-alives.
+        """
+        record = self.get(ref)
+        if not record:
+            return
+
+        call_id = record["call_id"]
+        queue: asyncio.Queue = asyncio.Queue()
+        self.watchers.setdefault(call_id, set()).add(queue)
+        try:
+            yield record
+            while record["status"] not in TERMINAL_STATUSES:
+                try:
+                    record = await asyncio.wait_for(queue.get(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield record
+        finally:
+            self.watchers[call_id].discard(queue)
+            if not self.watchers[call_id]:
+                del self.watchers[call_id]
+
+    def _set(self, call_id: str, status: Optional[str] = None, **fields: Any) -> None:
+        if status:
+            fields["status"] = status
+            if status in ("ringing", "connected", "ended"):
+                fields[f"{status}_at"] = time.time()
+        self.store.update_call(call_id, **fields)
+
+        record = self.get(call_id)
+        for queue in self.watchers.get(call_id, ()):
+            queue.put_nowait(record)
+        if status:
+            logger.info(f"Call {call_id}: {status}")
+
+    async def _run(self, call_id: str, room_name: str, identity: str, phone_number: str,
+                   trunk_id: str, metadata: str) -> None:
+        try:
+            dispatch_id = await dispatch_agent(room_name, metadata)
+            self._set(call_id, dispatch_id=dispatch_id)
+            sip_participant_id = await dial_sip_participant(room_name, phone_number, trunk_id, identity)
+            self._set(call_id, sip_participant_id=sip_participant_id)
+        except Exception as e:
+            logger.error(f"Error dialing call {call_id}: {e}")
+            self._set(call_id, "failed", error=str(e), ended_at=time.time())
+            return
+
+        try:
+            await self._track(call_id, room_name, identity)
+        except Exception as e:
+            logger.error(f"Error tracking call {call_id}: {e}")
+            self._set(call_id, "failed", error=f"tracking stopped: {e}", ended_at=time.time())
+
+    async def _track(self, call_id: str, room_name: str, identity: str) -> None:
+        """Follow the SIP participant's call status until the call is over."""
+        lkapi = get_livekit_api()
+        status = "dialing"
+        deadline = time.monotonic() + MAX_CALL_SECONDS
+        errors = 0
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(TRACK_POLL_SECONDS * 2 ** errors, TRACK_MAX_BACKOFF_SECONDS))
+            try:
+                participant = await lkapi.room.get_participant(
+                    api.RoomParticipantIdentity(room=room_name, identity=identity)
+                )
+            except Exception as e:
+                if not isinstance(e, api.TwirpError) or e.code != "not_found":
+                    # A server hiccup or network error does not say anything about the call
+                    errors += 1
+                    if errors >= TRACK_MAX_ERRORS:
+                        raise
+                    logger.warning(f"Polling call {call_id} failed ({errors}/{TRACK_MAX_ERRORS}): {e}")
+                    continue
+                # The participant (or the whole room) is gone
+                if status == "connected":
+                    self._set(call_id, "ended")
+                else:
+                    self._set(call_id, "failed", error="call was not answered", ended_at=time.time())
+                return
+
+            errors = 0
+            new_status = SIP_CALL_STATUSES.get(participant.attributes.get("sip.callStatus", ""), status)
+            if new_status == "ended" and status != "connected":
+                self._set(call_id, "failed", error="call was not answered", ended_at=time.time())
+                return
+            if new_status != status:
+                status = new_status
+                self._set(call_id, status)
+            if status == "ended":
+                return
+
+        self._set(call_id, "ended", error=f"stopped tracking after {MAX_CALL_SECONDS}s")
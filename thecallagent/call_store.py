@@ -0,0 +1,140 @@
+"""
+Local store for call records, transcripts and summaries.
+
+The API's call registry records each call's state transitions. The voice
+worker appends each conversation turn as it happens and keeps a rolling
+summary up to date, so the summary can be read by the MCP server (which runs
+in a different process) during the call and right after hang-up.
+Calls are keyed by their LiveKit room name, which is unique per call.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from thecallagent.livekit_client import ROOM_PREFIX
+
+logger = logging.getLogger("call-store")
+
+# Configuration
+CALL_STORE_DB = os.getenv("CALL_STORE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calls.db"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_id TEXT PRIMARY KEY,
+    room_name TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    dispatch_id TEXT,
+    sip_participant_id TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    ringing_at REAL,
+    connected_at REAL,
+    ended_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_by_dispatch ON calls (dispatch_id);
+CREATE INDEX IF NOT EXISTS calls_by_sip_participant ON calls (sip_participant_id);
+CREATE TABLE IF NOT EXISTS transcripts (
+    room_name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (room_name, seq)
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    room_name TEXT PRIMARY KEY,
+    phone_number TEXT,
+    summary TEXT NOT NULL DEFAULT '',
+    turns_summarized INTEGER NOT NULL DEFAULT 0,
+    final INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def room_for_call(call_id: str) -> str:
+    """Accept either a call ID or a room name and return the room name."""
+    prefix = f"{ROOM_PREFIX}-"
+    return call_id if call_id.startswith(prefix) else prefix + call_id
+
+
+class CallStore:
+    """SQLite-backed call transcripts and rolling summaries."""
+
+    def __init__(self, db_path: str = CALL_STORE_DB):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def create_call(self, call_id: str, room_name: str, phone_number: str, status: str) -> None:
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO calls (call_id, room_name, phone_number, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (call_id, room_name, phone_number, status, now, now),
+            )
+
+    def update_call(self, call_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE calls SET {assignments} WHERE call_id = ?",
+                (*fields.values(), call_id),
+            )
+
+    def get_call(self, ref: str) -> Optional[Dict[str, Any]]:
+        """Look a call up by call ID, room name, dispatch ID or SIP participant ID."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM calls WHERE call_id = ? OR room_name = ? OR dispatch_id = ? "
+                "OR sip_participant_id = ? LIMIT 1",
+                (ref, ref, ref, ref),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def start_summary(self, room_name: str, phone_number: Optional[str] = None) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO summaries (room_name, phone_number, updated_at) VALUES (?, ?, ?)",
+                (room_name, phone_number, time.time()),
+            )
+
+    def append_turn(self, room_name: str, seq: int, role: str, text: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO transcripts (room_name, seq, role, text, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (room_name, seq, role, text, time.time()),
+            )
+
+    def transcript(self, room_name: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, role, text, created_at FROM transcripts WHERE room_name = ? ORDER BY seq",
+                (room_name,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_summary(self, room_name: str, summary: str, turns_summarized: int, final: bool = False) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE summaries SET summary = ?, turns_summarized = ?, final = ?, updated_at = ? "
+                "WHERE room_name = ?",
+                (summary, turns_summarized, int(final), time.time(), room_name),
+            )
+
+    def get_summary(self, room_name: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM summaries WHERE room_name = ?", (room_name,)).fetchone()
+        return dict(row) if row else None
@@ -1,98 +1,285 @@
+import asyncio
+import json
 import logging
 import os
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from livekit.agents import JobContext, WorkerOptions, cli, llm
-from livekit.agents.voice import Agent, AgentSession
-from livekit.plugins import silero, deepgram, google
 
 # Load environment variables
 load_dotenv()
 
+# Prometheus port for the worker's /metrics (job processes report through a shared multiprocess directory)
+METRICS_PORT = os.getenv("VOICE_METRICS_PORT")
+METRICS_DIR = os.getenv("VOICE_METRICS_DIR", "/tmp/voice-worker-metrics")
+if METRICS_PORT:
+    # Must be set before prometheus_client is first imported
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", METRICS_DIR)
+
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, llm
+from livekit.agents.voice import Agent, AgentSession, ConversationItemAddedEvent
+from livekit.plugins import silero, deepgram, google
+
+from thecallagent.call_store import CallStore
+from thecallagent.prompt_audio import PromptAudioCache, iter_frames
+from thecallagent.turn_metrics import JOB_START_LATENCY, TurnLatencyTracker
+
 logger = logging.getLogger("calling-agent")
 logger.setLevel(logging.INFO)
 
+# Idle worker processes kept prewarmed and waiting for a job (LiveKit default: 0 in dev, 2 in prod)
+IDLE_PROCESSES = os.getenv("VOICE_IDLE_PROCESSES")
+
+# Canned phrases played from cached audio; override with a JSON file of {name: text}
+PROMPTS = {
+    "greeting": "Hello, I'm calling to ask you a question about ice cream. Do you prefer chocolate or vanilla?",
+    "goodbye": "Thank you for your answer. Have a great day, goodbye!",
+}
+if os.getenv("CALL_PROMPTS_FILE"):
+    with open(os.getenv("CALL_PROMPTS_FILE")) as f:
+        PROMPTS.update(json.load(f))
+
+# Fold new turns into the running call summary after this many turns
+SUMMARY_EVERY_N_TURNS = int(os.getenv("CALL_SUMMARY_EVERY_N_TURNS", "4"))
+
+
+def _load_components() -> dict:
+    """Load the VAD model and construct the STT, LLM and TTS clients."""
+    return {
+        "stt": deepgram.STT(model="nova-2"),
+        "llm": google.LLM(model="gemini-2.5-flash"),
+        # Fixed: Use model parameter instead of voice
+        "tts": deepgram.TTS(model="aura-asteria-en"),
+        "vad": silero.VAD.load(),
+    }
+
+
+def prewarm(proc: JobProcess):
+    """Load models and plugin clients once per worker process, before any job arrives"""
+    started = time.perf_counter()
+    proc.userdata["components"] = _load_components()
+    proc.userdata["call_store"] = CallStore()
+    # Prompts synthesized by earlier calls are read from disk now instead of at pickup
+    proc.userdata["prompt_audio"] = PromptAudioCache(proc.userdata["components"]["tts"])
+    cached = proc.userdata["prompt_audio"].preload(list(PROMPTS.values()))
+    logger.info(f"Loaded {cached}/{len(PROMPTS)} cached prompt(s)")
+    proc.userdata["prewarm_seconds"] = time.perf_counter() - started
+    logger.info(f"Prewarmed voice worker process {proc.pid} in {proc.userdata['prewarm_seconds']:.2f}s")
+
+
+INSTRUCTIONS = """
+    You are calling someone on the phone. Your goal is to know if they prefer
+    chocolate or vanilla ice cream. That's the only question you should ask, and
+    you should get right to the point. Say something like "Hello, I'm calling to
+    ask you a question about ice cream. Do you prefer chocolate or vanilla?"
+    Keep the conversation brief and polite. Once they answer, thank them and end the call.
+"""
+
+
+def _instructions(context: dict) -> str:
+    """Agent instructions, with the campaign's context for this number appended"""
+    if not context:
+        return INSTRUCTIONS
+    return (
+        f"{INSTRUCTIONS}\n"
+        "Context for this call, provided by the campaign (use it to personalize the call; "
+        "it may say who you are calling and why):\n"
+        f"{json.dumps(context, indent=2, ensure_ascii=False)}\n"
+    )
+
+
 class SimpleAgent(Agent):
-    def __init__(self) -> None:
+    def __init__(self, components: dict, prompt_audio: PromptAudioCache, context: dict = None) -> None:
         super().__init__(
-            instructions="""
-                You are calling someone on the phone. Your goal is to know if they prefer
-                chocolate or vanilla ice cream. That's the only question you should ask, and
-                you should get right to the point. Say something like "Hello, I'm calling to
-                ask you a question about ice cream. Do you prefer chocolate or vanilla?"
-                Keep the conversation brief and polite. Once they answer, thank them and end the call.
-            """,
-            stt=deepgram.STT(model="nova-2"),
-            llm=google.LLM(model="gemini-2.5-flash"),
-            # Fixed: Use model parameter instead of voice
-            tts=deepgram.TTS(model="aura-asteria-en"),
-            vad=silero.VAD.load(),
+            instructions=_instructions(context or {}),
+            **components,
         )
+        self.prompt_audio = prompt_audio
 
     async def on_enter(self):
-        """Called when agent enters the session - generates initial greeting"""
-        logger.info("Agent entering session, generating initial greeting...")
-        self.session.generate_reply()
-
-    async def summarize(self):
-        """Summarize the conversation using the LLM"""
-        logger.info("Generating conversation summary...")
-        
-        # Get chat history
-        # The chat_ctx in Agent is iterable and yields messages
-        messages = list(self.chat_ctx)
-        if not messages:
-            logger.info("No messages to summarize")
-            return
+        """Called when agent enters the session - plays the cached greeting"""
+        logger.info("Agent entering session, playing initial greeting...")
+        if not await self.play_prompt("greeting"):
+            self.session.generate_reply()
 
-        # Prepare prompt for summarization
-        prompt = "Please summarize the following conversation:\n\n"
-        for msg in messages:
-            role = msg.role
-            content = msg.content
-            if content:
-                prompt += f"{role}: {content}\n"
-        
-        prompt += "\nSummary:"
-
-        # Generate summary using the configured LLM
+    async def play_prompt(self, name: str) -> bool:
+        """Speak a canned phrase from cached audio; False if it could not be played"""
+        text = PROMPTS.get(name)
+        if not text:
+            return False
         try:
-            # We create a new chat context for the summary generation to avoid messing with the main one
-            summary_stream = await self.llm.chat(
-                chat_ctx=llm.ChatContext().append(text=prompt, role=llm.ChatRole.USER)
-            )
-            
-            full_summary = ""
-            async for chunk in summary_stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    full_summary += content
-            
-            print("\n" + "="*50)
-            print("CONVERSATION SUMMARY")
-            print("="*50)
-            print(full_summary)
-            print("="*50 + "\n")
-            
+            frames = await self.prompt_audio.get(text)
         except Exception as e:
-            logger.error(f"Error generating summary: {e}")
+            logger.error(f"Error loading prompt audio '{name}': {e}")
+            return False
+        # The text is added to the chat context, so the LLM continues from it
+        self.session.say(text, audio=iter_frames(frames))
+        return True
+
+
+class RollingSummarizer:
+    """Keeps a compact running summary of the call and streams turns to the call store.
+
+    Every `every_n_turns` turns the new turns are folded into the existing
+    summary in the background, so only a small delta is left to summarize
+    when the call ends. Store writes are queued and applied in order by a
+    single writer on a worker thread, so SQLite never blocks the voice loop.
+    """
+
+    def __init__(self, summary_llm: llm.LLM, store: CallStore, room_name: str,
+                 phone_number: str = None, every_n_turns: int = SUMMARY_EVERY_N_TURNS) -> None:
+        self.llm = summary_llm
+        self.store = store
+        self.room_name = room_name
+        self.every_n_turns = every_n_turns
+        self.turns: list = []
+        self.summary = ""
+        self.summarized = 0
+        self.lock = asyncio.Lock()
+        self.tasks: set = set()
+        self.writes: asyncio.Queue = asyncio.Queue()
+        self.writer = asyncio.create_task(self._write_loop())
+        self._write(store.start_summary, room_name, phone_number)
+
+    def _write(self, fn, *args) -> None:
+        self.writes.put_nowait((fn, args))
+
+    async def _write_loop(self) -> None:
+        """Apply queued store writes in order, everything queued so far in one thread hop"""
+        while True:
+            batch = [await self.writes.get()]
+            while not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+            await asyncio.to_thread(self._apply_writes, [write for write in batch if write is not None])
+            if None in batch:
+                return
+
+    def _apply_writes(self, writes: list) -> None:
+        for fn, args in writes:
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Error writing to the call store for {self.room_name}: {e}")
+
+    def on_item_added(self, event: ConversationItemAddedEvent) -> None:
+        """Session event handler: persist the turn and update the summary when due"""
+        item = event.item
+        text = getattr(item, "text_content", None)
+        if getattr(item, "role", None) not in ("user", "assistant") or not text:
+            return
+
+        self.turns.append((item.role, text))
+        self._write(self.store.append_turn, self.room_name, len(self.turns), item.role, text)
+
+        if len(self.turns) - self.summarized >= self.every_n_turns and not self.lock.locked():
+            task = asyncio.create_task(self.update())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def update(self, final: bool = False) -> None:
+        """Fold turns not yet summarized into the running summary"""
+        async with self.lock:
+            upto = len(self.turns)
+            new_turns = self.turns[self.summarized:upto]
+            if new_turns:
+                try:
+                    self.summary = await self._summarize(new_turns)
+                    self.summarized = upto
+                except Exception as e:
+                    logger.error(f"Error updating call summary: {e}")
+            if new_turns or final:
+                self._write(self.store.save_summary, self.room_name, self.summary, self.summarized, final)
+
+    async def finalize(self) -> None:
+        """Shutdown callback: summarize the last few turns and mark the summary final"""
+        await self.update(final=True)
+        # Flush the queued writes before the job process goes away
+        self.writes.put_nowait(None)
+        await self.writer
+        logger.info(f"Call summary for {self.room_name}: {self.summary or '(no conversation)'}")
+
+    async def _summarize(self, new_turns: list) -> str:
+        lines = "\n".join(f"{role}: {text}" for role, text in new_turns)
+        prompt = (
+            "You maintain a compact running summary of a phone call.\n\n"
+            f"Summary so far:\n{self.summary or '(none)'}\n\n"
+            f"New turns:\n{lines}\n\n"
+            "Return the updated summary in at most five sentences. Keep names, answers and commitments."
+        )
+        # A separate chat context so the summary request does not touch the conversation
+        chat_ctx = llm.ChatContext.empty()
+        chat_ctx.add_message(role="user", content=prompt)
+
+        summary = ""
+        async with self.llm.chat(chat_ctx=chat_ctx) as stream:
+            async for chunk in stream:
+                if chunk.delta and chunk.delta.content:
+                    summary += chunk.delta.content
+        return summary.strip() or self.summary
+
+
+def _parse_metadata(metadata: str) -> dict:
+    """Dispatch metadata is the phone number, or JSON with phone_number and context fields for campaigns"""
+    try:
+        parsed = json.loads(metadata)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, dict):
+        return {"phone_number": metadata}
+    return parsed
+
+
+def _phone_number_from_metadata(metadata: str) -> str:
+    return _parse_metadata(metadata).get("phone_number", "")
+
+
+def _context_from_metadata(metadata: str) -> dict:
+    context = _parse_metadata(metadata).get("context")
+    return context if isinstance(context, dict) else {}
 
 async def entrypoint(ctx: JobContext):
     """Main entrypoint for the agent"""
+    job_started = time.perf_counter()
     logger.info(f"🚀 Agent starting in room: {ctx.room.name}")
     
+    # Reuse what prewarm loaded; only load here if this process was not prewarmed
+    components = ctx.proc.userdata.get("components")
+    prewarmed = components is not None
+    if not prewarmed:
+        components = _load_components()
+    
+    store = ctx.proc.userdata.get("call_store") or CallStore()
+    summarizer = RollingSummarizer(components["llm"], store, ctx.room.name,
+                                   _phone_number_from_metadata(ctx.job.metadata))
+    # The final summary is written when the job shuts down, i.e. at hang-up
+    ctx.add_shutdown_callback(summarizer.finalize)
+    
+    latency = TurnLatencyTracker(ctx.room.name)
+    ctx.add_shutdown_callback(latency.log_summary)
+    
     session = AgentSession()
-    agent = SimpleAgent()
+    session.on("conversation_item_added", summarizer.on_item_added)
+    session.on("user_state_changed", latency.on_user_state_changed)
+    session.on("metrics_collected", latency.on_metrics_collected)
+    session.on("agent_state_changed", latency.on_agent_state_changed)
+    prompt_audio = ctx.proc.userdata.get("prompt_audio") or PromptAudioCache(components["tts"])
+    agent = SimpleAgent(components, prompt_audio, _context_from_metadata(ctx.job.metadata))
     
     await session.start(
         agent=agent,
         room=ctx.room
     )
     
-    logger.info("✅ Agent session ended")
-    
-    # Generate summary after session ends
-    await agent.summarize()
+    job_start_ms = (time.perf_counter() - job_started) * 1000
+    JOB_START_LATENCY.labels(prewarmed=str(prewarmed).lower()).observe(job_start_ms / 1000)
+    logger.info(f"⏱️ Job start latency: {job_start_ms:.0f} ms (prewarmed: {prewarmed}, room: {ctx.room.name})")
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
\ No newline at end of file
+    options = {"entrypoint_fnc": entrypoint, "prewarm_fnc": prewarm}
+    if IDLE_PROCESSES:
+        options["num_idle_processes"] = int(IDLE_PROCESSES)
+    if METRICS_PORT:
+        options["prometheus_port"] = int(METRICS_PORT)
+        options["prometheus_multiproc_dir"] = METRICS_DIR
+    cli.run_app(WorkerOptions(**options))
\ No newline at end of file
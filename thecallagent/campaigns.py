@@ -0,0 +1,513 @@
+"""
+Outbound call campaigns.
+
+A campaign is a list of phone numbers (each with optional context for the
+agent) that is dialed with a concurrency cap and pacing between dials. Busy
+and unanswered calls are retried with exponential backoff. Campaign and
+per-call state live in SQLite so progress can be polled from any process and
+an interrupted campaign can be resumed with:
+
+    python -m thecallagent.campaigns run <campaign_id>
+
+One runner at a time holds a campaign and checks in every few seconds. The
+API server resumes campaigns left pending or running whose runner stopped
+checking in (resumable_campaigns()), e.g. after a restart or crash.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from livekit import api
+
+# Load environment variables
+load_dotenv(dotenv_path=Path(__file__).parent / '.env')
+
+from thecallagent.livekit_client import close_livekit_api, get_livekit_api, start_outbound_call
+
+logger = logging.getLogger("call-campaigns")
+logger.setLevel(logging.INFO)
+
+# Configuration
+CAMPAIGN_DB = os.getenv("CAMPAIGN_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "campaigns.db"))
+# Runner processes import this module as thecallagent.campaigns from the repository root
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTBOUND_TRUNK_ID = os.getenv("SIP_OUTBOUND_TRUNK_ID")
+DEFAULT_CONCURRENCY = 5
+DEFAULT_PACE_SECONDS = 1.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY_SECONDS = 300.0
+MAX_CONCURRENCY = 50
+IDLE_POLL_SECONDS = 1.0
+HANGUP_POLL_SECONDS = 5.0
+MAX_CALL_SECONDS = 30 * 60
+
+# SIP status codes that are worth another attempt later
+BUSY_SIP_CODES = {"486", "600"}
+NO_ANSWER_SIP_CODES = {"408", "480", "487"}
+# classify_failure() outcomes that are retried; SIP rejections and trunk errors would fail the same way again
+RETRYABLE_OUTCOMES = {"busy", "no_answer"}
+RUNNER_HEARTBEAT_SECONDS = 10.0
+# A runner that has not checked in for this long is presumed dead
+RUNNER_STALE_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    concurrency INTEGER NOT NULL,
+    pace_seconds REAL NOT NULL,
+    max_attempts INTEGER NOT NULL,
+    retry_delay_seconds REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    runner TEXT,
+    heartbeat_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS campaign_calls (
+    campaign_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    phone_number TEXT NOT NULL,
+    context TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_outcome TEXT,
+    call_id TEXT,
+    room_name TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (campaign_id, position)
+);
+CREATE INDEX IF NOT EXISTS campaign_calls_due ON campaign_calls (campaign_id, status, next_attempt_at);
+"""
+
+# Call states: pending -> dialing -> in_progress -> completed, or failed once attempts run out
+CALL_STATUSES = ("pending", "dialing", "in_progress", "completed", "failed")
+
+
+class CampaignStore:
+    """SQLite-backed campaign and per-call state."""
+
+    def __init__(self, db_path: str = CAMPAIGN_DB):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        # Databases created before campaigns had runners
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(campaigns)")}
+        if "runner" not in columns:
+            with self.conn:
+                self.conn.execute("ALTER TABLE campaigns ADD COLUMN runner TEXT")
+                self.conn.execute("ALTER TABLE campaigns ADD COLUMN heartbeat_at REAL NOT NULL DEFAULT 0")
+
+    def create_campaign(self, calls: List[Dict[str, Any]], name: Optional[str] = None,
+                        concurrency: int = DEFAULT_CONCURRENCY,
+                        pace_seconds: float = DEFAULT_PACE_SECONDS,
+                        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                        retry_delay_seconds: float = DEFAULT_RETRY_DELAY_SECONDS) -> str:
+        """Store a new campaign and return its ID.
+
+        Args:
+            calls: [{"phone_number": "+1234567890", "context": {...}}, ...]
+
+        Raises:
+            ValueError: If the call list or settings are invalid.
+        """
+        if not calls:
+            raise ValueError("Campaign has no numbers to call")
+        if not 1 <= concurrency <= MAX_CONCURRENCY:
+            raise ValueError(f"concurrency must be between 1 and {MAX_CONCURRENCY}")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if pace_seconds < 0 or retry_delay_seconds < 0:
+            raise ValueError("pace_seconds and retry_delay_seconds cannot be negative")
+
+        for i, call in enumerate(calls):
+            phone_number = str(call.get("phone_number", "")).strip()
+            if not phone_number.startswith("+"):
+                raise ValueError(f"Entry {i}: phone number must be in international format (e.g., +1234567890)")
+
+        campaign_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO campaigns (id, name, status, concurrency, pace_seconds, max_attempts, "
+                "retry_delay_seconds, created_at, updated_at) VALUES (?, ?, 'pending', ?, ?, ?, ?, ?, ?)",
+                (campaign_id, name or f"campaign-{campaign_id}", concurrency, pace_seconds,
+                 max_attempts, retry_delay_seconds, now, now),
+            )
+            self.conn.executemany(
+                "INSERT INTO campaign_calls (campaign_id, position, phone_number, context, status, updated_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(campaign_id, i, str(call["phone_number"]).strip(), json.dumps(call.get("context") or {}), now)
+                 for i, call in enumerate(calls)],
+            )
+        logger.info(f"Created campaign {campaign_id} with {len(calls)} number(s)")
+        return campaign_id
+
+    def get_campaign(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+        return dict(row) if row else None
+
+    def set_campaign_status(self, campaign_id: str, status: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE campaigns SET status = ?, updated_at = ? WHERE id = ?",
+                (status, time.time(), campaign_id),
+            )
+
+    def claim_runner(self, campaign_id: str, runner: str) -> bool:
+        """Make `runner` the campaign's runner; False while another runner is still checking in."""
+        now = time.time()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE campaigns SET runner = ?, heartbeat_at = ? WHERE id = ? "
+                "AND (runner IS NULL OR runner = ? OR heartbeat_at < ?)",
+                (runner, now, campaign_id, runner, now - RUNNER_STALE_SECONDS),
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, campaign_id: str, runner: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE campaigns SET heartbeat_at = ? WHERE id = ? AND runner = ?",
+                (time.time(), campaign_id, runner),
+            )
+
+    def release_runner(self, campaign_id: str, runner: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE campaigns SET runner = NULL WHERE id = ? AND runner = ?",
+                (campaign_id, runner),
+            )
+
+    def resumable_campaigns(self) -> List[str]:
+        """IDs of campaigns left pending or running without a live runner, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id FROM campaigns WHERE status IN ('pending', 'running') "
+                "AND (runner IS NULL OR heartbeat_at < ?) ORDER BY created_at",
+                (time.time() - RUNNER_STALE_SECONDS,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def progress(self, campaign_id: str, include_calls: bool = False) -> Optional[Dict[str, Any]]:
+        """Return the campaign with per-status call counts (and optionally every call)."""
+        campaign = self.get_campaign(campaign_id)
+        if not campaign:
+            return None
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM campaign_calls WHERE campaign_id = ? GROUP BY status",
+                (campaign_id,),
+            ).fetchall()
+        counts = {status: 0 for status in CALL_STATUSES}
+        counts.update({row[0]: row[1] for row in rows})
+        campaign["counts"] = counts
+        campaign["total"] = sum(counts.values())
+
+        if include_calls:
+            campaign["calls"] = self.list_calls(campaign_id)
+        return campaign
+
+    def list_calls(self, campaign_id: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM campaign_calls WHERE campaign_id = ? ORDER BY position",
+                (campaign_id,),
+            ).fetchall()
+        calls = []
+        for row in rows:
+            call = dict(row)
+            call["context"] = json.loads(call["context"] or "{}")
+            calls.append(call)
+        return calls
+
+    def claim_next_call(self, campaign_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Atomically move the next due pending call to dialing and return it."""
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT * FROM campaign_calls WHERE campaign_id = ? AND status = 'pending' "
+                "AND next_attempt_at <= ? ORDER BY next_attempt_at, position LIMIT 1",
+                (campaign_id, now),
+            ).fetchone()
+            if not row:
+                return None
+            self.conn.execute(
+                "UPDATE campaign_calls SET status = 'dialing', attempts = attempts + 1, updated_at = ? "
+                "WHERE campaign_id = ? AND position = ?",
+                (now, campaign_id, row["position"]),
+            )
+        call = dict(row)
+        call["attempts"] += 1
+        call["context"] = json.loads(call["context"] or "{}")
+        return call
+
+    def next_attempt_time(self, campaign_id: str) -> Optional[float]:
+        """Earliest time a pending call becomes due, or None if nothing is pending."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM campaign_calls WHERE campaign_id = ? AND status = 'pending'",
+                (campaign_id,),
+            ).fetchone()
+        return row[0]
+
+    def update_call(self, campaign_id: str, position: int, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE campaign_calls SET {assignments} WHERE campaign_id = ? AND position = ?",
+                (*fields.values(), campaign_id, position),
+            )
+
+    def reset_interrupted(self, campaign_id: str) -> None:
+        """Recover calls left mid-flight by a runner that died.
+
+        Calls that were still dialing are dialed again; answered calls are
+        assumed to have finished.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE campaign_calls SET status = 'pending', attempts = MAX(attempts - 1, 0) "
+                "WHERE campaign_id = ? AND status = 'dialing'",
+                (campaign_id,),
+            )
+            self.conn.execute(
+                "UPDATE campaign_calls SET status = 'completed' WHERE campaign_id = ? AND status = 'in_progress'",
+                (campaign_id,),
+            )
+
+
+_store: Optional[CampaignStore] = None
+
+
+def get_store() -> CampaignStore:
+    """Return the process-wide campaign store."""
+    global _store
+    if _store is None:
+        _store = CampaignStore(CAMPAIGN_DB)
+    return _store
+
+
+def classify_failure(error: Exception) -> str:
+    """Map a dial error to busy, no_answer or error."""
+    if isinstance(error, api.TwirpError):
+        sip_code = error.metadata.get("sip_status_code", "")
+        if sip_code in BUSY_SIP_CODES:
+            return "busy"
+        if sip_code in NO_ANSWER_SIP_CODES:
+            return "no_answer"
+        return f"error: SIP {sip_code or error.code} {error.message}".strip()
+    return f"error: {error}"
+
+
+async def _wait_for_hangup(room_name: str, identity: str) -> None:
+    """Hold a concurrency slot until the callee leaves the room."""
+    lkapi = get_livekit_api()
+    deadline = time.monotonic() + MAX_CALL_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(HANGUP_POLL_SECONDS)
+        try:
+            response = await lkapi.room.list_participants(api.ListParticipantsRequest(room=room_name))
+        except api.TwirpError:
+            # The room is gone once everyone has left
+            return
+        if not any(p.identity == identity for p in response.participants):
+            return
+    logger.warning(f"Call in room {room_name} exceeded {MAX_CALL_SECONDS}s, releasing its slot")
+
+
+async def _place_call(store: CampaignStore, campaign: Dict[str, Any], call: Dict[str, Any],
+                      slots: asyncio.Semaphore, trunk_id: str) -> None:
+    campaign_id, position = campaign["id"], call["position"]
+    try:
+        metadata = json.dumps({
+            "phone_number": call["phone_number"],
+            "campaign_id": campaign_id,
+            "context": call["context"],
+        })
+        try:
+            handle = await start_outbound_call(call["phone_number"], trunk_id, metadata=metadata,
+                                               wait_until_answered=True)
+        except Exception as error:
+            outcome = classify_failure(error)
+            if outcome in RETRYABLE_OUTCOMES and call["attempts"] < campaign["max_attempts"]:
+                delay = campaign["retry_delay_seconds"] * 2 ** (call["attempts"] - 1)
+                logger.info(f"Call to {call['phone_number']} {outcome}, retrying in {delay:.0f}s")
+                store.update_call(campaign_id, position, status="pending", last_outcome=outcome,
+                                  next_attempt_at=time.time() + delay)
+            elif outcome in RETRYABLE_OUTCOMES:
+                logger.info(f"Call to {call['phone_number']} {outcome}, giving up after {call['attempts']} attempt(s)")
+                store.update_call(campaign_id, position, status="failed", last_outcome=outcome)
+            else:
+                logger.warning(f"Call to {call['phone_number']} failed: {outcome}")
+                store.update_call(campaign_id, position, status="failed", last_outcome=outcome)
+            return
+
+        store.update_call(campaign_id, position, status="in_progress", last_outcome="answered",
+                          call_id=handle.call_id, room_name=handle.room_name)
+        try:
+            await _wait_for_hangup(handle.room_name, handle.participant_identity)
+        except Exception as e:
+            # The call was answered, so it is not dialed again; record it as finished
+            logger.error(f"Lost track of call in room {handle.room_name}: {e}")
+            store.update_call(campaign_id, position, status="completed",
+                              last_outcome=f"answered, hang-up not observed: {e}")
+            return
+        store.update_call(campaign_id, position, status="completed")
+    finally:
+        slots.release()
+
+
+async def run_campaign(campaign_id: str, store: Optional[CampaignStore] = None,
+                       trunk_id: Optional[str] = None) -> None:
+    """Dial every pending number of a campaign until all are completed or failed.
+
+    At most `concurrency` calls are active at once and dials are at least
+    `pace_seconds` apart. Cancelling the campaign stops new dials; calls
+    already connected are left to finish. Returns at once if another live
+    runner holds the campaign; if dialing raises, the campaign is marked failed.
+    """
+    store = store or get_store()
+    trunk_id = trunk_id or OUTBOUND_TRUNK_ID
+    campaign = store.get_campaign(campaign_id)
+    if not campaign or campaign["status"] in ("completed", "cancelled"):
+        return
+    if not trunk_id or not trunk_id.startswith("ST_"):
+        logger.error("SIP_OUTBOUND_TRUNK_ID is not set or invalid")
+        store.set_campaign_status(campaign_id, "failed")
+        return
+
+    runner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if not store.claim_runner(campaign_id, runner):
+        logger.info(f"Campaign {campaign_id} is already being run by another runner")
+        return
+    heartbeat = asyncio.create_task(_heartbeat(store, campaign_id, runner))
+    try:
+        await _dial_campaign(store, campaign_id, trunk_id)
+    except Exception as e:
+        logger.error(f"Campaign {campaign_id} failed: {e}", exc_info=True)
+        store.set_campaign_status(campaign_id, "failed")
+    finally:
+        heartbeat.cancel()
+        store.release_runner(campaign_id, runner)
+
+
+async def _heartbeat(store: CampaignStore, campaign_id: str, runner: str) -> None:
+    """Check in regularly so no other process resumes the campaign while it runs here."""
+    while True:
+        await asyncio.sleep(RUNNER_HEARTBEAT_SECONDS)
+        try:
+            store.heartbeat(campaign_id, runner)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record heartbeat for campaign {campaign_id}: {e}")
+
+
+async def _dial_campaign(store: CampaignStore, campaign_id: str, trunk_id: str) -> None:
+    campaign = store.get_campaign(campaign_id)
+    store.reset_interrupted(campaign_id)
+    store.set_campaign_status(campaign_id, "running")
+    logger.info(f"Running campaign {campaign_id} (concurrency {campaign['concurrency']})")
+
+    slots = asyncio.Semaphore(campaign["concurrency"])
+    active = set()
+    last_dial = 0.0
+    try:
+        while True:
+            campaign = store.get_campaign(campaign_id)
+            if campaign["status"] == "cancelled":
+                break
+
+            await slots.acquire()
+            call = store.claim_next_call(campaign_id, time.time())
+            if call is None:
+                slots.release()
+                due = store.next_attempt_time(campaign_id)
+                if due is None and not active:
+                    break
+                # Wait for a retry to come due or an active call to finish
+                wait = IDLE_POLL_SECONDS if due is None else min(max(due - time.time(), 0), IDLE_POLL_SECONDS)
+                await asyncio.sleep(wait)
+                continue
+
+            pause = last_dial + campaign["pace_seconds"] - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            last_dial = time.monotonic()
+
+            task = asyncio.create_task(_place_call(store, campaign, call, slots, trunk_id))
+            active.add(task)
+            task.add_done_callback(active.discard)
+    finally:
+        if active:
+            await asyncio.gather(*active, return_exceptions=True)
+
+    if store.get_campaign(campaign_id)["status"] != "cancelled":
+        store.set_campaign_status(campaign_id, "completed")
+    logger.info(f"Campaign {campaign_id} finished")
+
+
+def spawn_campaign_runner(campaign_id: str) -> int:
+    """Run a campaign in a detached process and return its PID.
+
+    Used by the MCP server, whose process exits after each tool call.
+    """
+    log_path = os.path.join(os.path.dirname(os.path.abspath(CAMPAIGN_DB)), f"campaign-{campaign_id}.log")
+    with open(log_path, "a") as log_file:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "thecallagent.campaigns", "run", campaign_id],
+            cwd=REPO_ROOT,
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=log_file,
+            start_new_session=True,
+        )
+    logger.info(f"Started runner for campaign {campaign_id} (pid {process.pid}), logging to {log_path}")
+    return process.pid
+
+
+def format_progress(progress: Dict[str, Any]) -> str:
+    """Format campaign progress for a tool response."""
+    counts = progress["counts"]
+    done = counts["completed"] + counts["failed"]
+    lines = [
+        f"Campaign {progress['id']} ({progress['name']}): {progress['status']}",
+        f"Progress: {done}/{progress['total']} finished",
+        ", ".join(f"{status}: {counts[status]}" for status in CALL_STATUSES),
+    ]
+    for call in progress.get("calls", []):
+        outcome = f" ({call['last_outcome']})" if call["last_outcome"] else ""
+        lines.append(f"- {call['phone_number']}: {call['status']}, attempts {call['attempts']}{outcome}")
+    return "\n".join(lines)
+
+
+async def _main(campaign_id: str) -> None:
+    try:
+        await run_campaign(campaign_id)
+    finally:
+        await close_livekit_api()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if len(sys.argv) != 3 or sys.argv[1] != "run":
+        print("Usage: python -m thecallagent.campaigns run <campaign_id>")
+        sys.exit(1)
+    asyncio.run(_main(sys.argv[2]))
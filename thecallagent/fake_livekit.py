@@ -0,0 +1,201 @@
+"""
+Offline stand-in for the LiveKit server API and a SIP trunk.
+
+FakeLiveKitAPI implements the parts of api.LiveKitAPI the call agent uses
+(agent dispatch, SIP participant creation, participant lookups) with
+configurable latencies, capacity and failure rates, and simulates each call
+going dialing -> ringing -> active -> hangup. Enable it for make_calls.py,
+server.py and the API servers with LIVEKIT_FAKE=1, or inject it with
+livekit_client.set_livekit_api().
+"""
+
+import asyncio
+import os
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from livekit import api
+
+
+@dataclass
+class FakeConfig:
+    """Latencies are in seconds; rates are probabilities per dial."""
+    dispatch_latency: float = 0.05
+    sip_latency: float = 0.15
+    jitter: float = 0.3
+    ring_seconds: float = 2.0
+    talk_seconds: float = 10.0
+    busy_rate: float = 0.0
+    no_answer_rate: float = 0.0
+    error_rate: float = 0.0
+    # Simultaneous SIP setups the fake trunk accepts before queuing (0 = unlimited)
+    max_concurrent_setups: int = 0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeConfig":
+        """Read overrides from LIVEKIT_FAKE_<FIELD> environment variables."""
+        config = cls()
+        for name, value in vars(config).items():
+            env_value = os.getenv(f"LIVEKIT_FAKE_{name.upper()}")
+            if env_value is not None:
+                cast = int if name in ("max_concurrent_setups", "seed") else float
+                setattr(config, name, cast(env_value))
+        return config
+
+
+@dataclass
+class _FakeCall:
+    room_name: str
+    identity: str
+    participant_id: str
+    started_at: float
+    outcome: str
+    ring_seconds: float
+    talk_seconds: float
+
+    def status(self, now: float) -> Optional[str]:
+        """sip.callStatus at `now`, or None once the participant has left."""
+        elapsed = now - self.started_at
+        if elapsed < self.ring_seconds:
+            return "dialing" if elapsed < self.ring_seconds / 4 else "ringing"
+        if self.outcome != "answered" or elapsed >= self.ring_seconds + self.talk_seconds:
+            return None
+        return "active"
+
+
+@dataclass
+class FakeStats:
+    dispatches: int = 0
+    sip_calls: int = 0
+    failures: Dict[str, int] = field(default_factory=dict)
+    peak_concurrent_setups: int = 0
+
+
+class _FakeAgentDispatch:
+    def __init__(self, fake: "FakeLiveKitAPI"):
+        self.fake = fake
+
+    async def create_dispatch(self, req: api.CreateAgentDispatchRequest) -> api.AgentDispatch:
+        await self.fake._delay(self.fake.config.dispatch_latency)
+        self.fake.stats.dispatches += 1
+        return api.AgentDispatch(id=f"AD_{uuid.uuid4().hex[:12]}", agent_name=req.agent_name,
+                                 room=req.room, metadata=req.metadata)
+
+
+class _FakeSIP:
+    def __init__(self, fake: "FakeLiveKitAPI"):
+        self.fake = fake
+
+    async def create_sip_participant(self, req: api.CreateSIPParticipantRequest) -> api.SIPParticipantInfo:
+        fake = self.fake
+        async with fake._setup_slot():
+            await fake._delay(fake.config.sip_latency)
+        fake.stats.sip_calls += 1
+
+        roll = fake.random.random()
+        config = fake.config
+        if roll < config.error_rate:
+            fake._fail("error")
+            raise api.TwirpError("internal", "fake SIP trunk error", status=500)
+        roll -= config.error_rate
+        if roll < config.busy_rate:
+            outcome = "busy"
+        elif roll < config.busy_rate + config.no_answer_rate:
+            outcome = "no_answer"
+        else:
+            outcome = "answered"
+
+        call = _FakeCall(
+            room_name=req.room_name,
+            identity=req.participant_identity,
+            participant_id=f"PA_{uuid.uuid4().hex[:12]}",
+            started_at=time.monotonic(),
+            outcome=outcome,
+            ring_seconds=fake._jittered(config.ring_seconds),
+            talk_seconds=fake._jittered(config.talk_seconds),
+        )
+        fake.calls[(req.room_name, req.participant_identity)] = call
+
+        if req.wait_until_answered:
+            await asyncio.sleep(call.ring_seconds)
+            if outcome != "answered":
+                fake._fail(outcome)
+                sip_code = "486" if outcome == "busy" else "480"
+                raise api.TwirpError("unavailable", f"fake callee {outcome}", status=503,
+                                     metadata={"sip_status_code": sip_code})
+
+        return api.SIPParticipantInfo(participant_id=call.participant_id,
+                                      participant_identity=call.identity,
+                                      room_name=call.room_name,
+                                      sip_call_id=f"SCL_{uuid.uuid4().hex[:12]}")
+
+
+class _FakeRoom:
+    def __init__(self, fake: "FakeLiveKitAPI"):
+        self.fake = fake
+
+    def _participant(self, call: _FakeCall, status: str) -> api.ParticipantInfo:
+        return api.ParticipantInfo(sid=call.participant_id, identity=call.identity,
+                                   attributes={"sip.callStatus": status})
+
+    async def get_participant(self, req: api.RoomParticipantIdentity) -> api.ParticipantInfo:
+        call = self.fake.calls.get((req.room, req.identity))
+        status = call.status(time.monotonic()) if call else None
+        if status is None:
+            raise api.TwirpError("not_found", "participant not found", status=404)
+        return self._participant(call, status)
+
+    async def list_participants(self, req: api.ListParticipantsRequest) -> api.ListParticipantsResponse:
+        now = time.monotonic()
+        participants = []
+        for (room_name, _), call in self.fake.calls.items():
+            status = call.status(now)
+            if room_name == req.room and status is not None:
+                participants.append(self._participant(call, status))
+        return api.ListParticipantsResponse(participants=participants)
+
+
+class FakeLiveKitAPI:
+    """Drop-in replacement for api.LiveKitAPI's dispatch, SIP and room surfaces."""
+
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig.from_env()
+        self.random = random.Random(self.config.seed)
+        self.calls: Dict[tuple, _FakeCall] = {}
+        self.stats = FakeStats()
+        self._active_setups = 0
+        self._setup_semaphore = (asyncio.Semaphore(self.config.max_concurrent_setups)
+                                 if self.config.max_concurrent_setups else None)
+        self.agent_dispatch = _FakeAgentDispatch(self)
+        self.sip = _FakeSIP(self)
+        self.room = _FakeRoom(self)
+
+    def _jittered(self, seconds: float) -> float:
+        return max(seconds * self.random.uniform(1 - self.config.jitter, 1 + self.config.jitter), 0)
+
+    async def _delay(self, seconds: float) -> None:
+        await asyncio.sleep(self._jittered(seconds))
+
+    def _fail(self, outcome: str) -> None:
+        self.stats.failures[outcome] = self.stats.failures.get(outcome, 0) + 1
+
+    @asynccontextmanager
+    async def _setup_slot(self):
+        if self._setup_semaphore:
+            await self._setup_semaphore.acquire()
+        self._active_setups += 1
+        self.stats.peak_concurrent_setups = max(self.stats.peak_concurrent_setups, self._active_setups)
+        try:
+            yield
+        finally:
+            self._active_setups -= 1
+            if self._setup_semaphore:
+                self._setup_semaphore.release()
+
+    async def aclose(self) -> None:
+        self.calls.clear()
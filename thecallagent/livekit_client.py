@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+from livekit import api
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger("livekit-client")
+tracer = trace.get_tracer("officeagent.livekit")
+
+# Configuration
+AGENT_NAME = os.getenv("LIVEKIT_AGENT_NAME", "test-agent")
+ROOM_PREFIX = os.getenv("LIVEKIT_ROOM_PREFIX", "call")
+POOL_SIZE = int(os.getenv("LIVEKIT_POOL_SIZE", "20"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("LIVEKIT_TIMEOUT_SECONDS", "10"))
+# Use the offline stand-in from fake_livekit.py instead of a real server
+USE_FAKE = os.getenv("LIVEKIT_FAKE", "").lower() in ("1", "true", "yes")
+
+# One client per process, reused by every call
+_lkapi: Optional[api.LiveKitAPI] = None
+_session: Optional[aiohttp.ClientSession] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+@dataclass
+class CallHandle:
+    """Identifiers of an outbound call placed by start_outbound_call."""
+    call_id: str
+    room_name: str
+    participant_identity: str
+    phone_number: str
+    dispatch_id: str
+    sip_participant_id: str
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    """aiohttp hooks that wrap each LiveKit server API request in a client span."""
+
+    async def on_request_start(session, ctx, params):
+        # Twirp paths look like /twirp/livekit.SIP/CreateSIPParticipant
+        method = params.url.path.rsplit("/twirp/livekit.", 1)[-1]
+        ctx.span = tracer.start_span(f"livekit {method}", kind=SpanKind.CLIENT,
+                                     attributes={"http.request.method": params.method, "livekit.method": method})
+
+    async def on_request_end(session, ctx, params):
+        ctx.span.set_attribute("http.response.status_code", params.response.status)
+        if params.response.status >= 400:
+            ctx.span.set_status(Status(StatusCode.ERROR, str(params.response.status)))
+        ctx.span.end()
+
+    async def on_request_exception(session, ctx, params):
+        ctx.span.record_exception(params.exception)
+        ctx.span.set_status(Status(StatusCode.ERROR, type(params.exception).__name__))
+        ctx.span.end()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+def get_livekit_api() -> api.LiveKitAPI:
+    """Return the process-wide LiveKit API client, creating it on first use.
+
+    The client shares one aiohttp session (and its keep-alive connection pool)
+    across calls. It is bound to the running event loop and recreated if a
+    different loop asks for it.
+    """
+    global _lkapi, _session, _loop
+
+    loop = asyncio.get_running_loop()
+    if _lkapi is not None and _session is None:
+        # Injected client (see set_livekit_api)
+        return _lkapi
+    if _lkapi is not None and _loop is loop and not _session.closed:
+        return _lkapi
+
+    if USE_FAKE:
+        from thecallagent.fake_livekit import FakeLiveKitAPI
+        logger.warning("LIVEKIT_FAKE is set: calls go to the offline LiveKit stand-in")
+        _lkapi = FakeLiveKitAPI()
+        return _lkapi
+
+    connector = aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=60)
+    _session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS),
+        trace_configs=[_trace_config()],
+    )
+    _lkapi = api.LiveKitAPI(session=_session)
+    _loop = loop
+    logger.info(f"Created pooled LiveKit API client (pool size {POOL_SIZE})")
+    return _lkapi
+
+
+def set_livekit_api(client) -> None:
+    """Use the given client (e.g. a FakeLiveKitAPI) for every call in this process."""
+    global _lkapi, _session, _loop
+    _lkapi, _session, _loop = client, None, None
+
+
+async def close_livekit_api() -> None:
+    """Close the shared client and its connection pool (call at shutdown)."""
+    global _lkapi, _session, _loop
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("Closed pooled LiveKit API client")
+    elif _lkapi is not None:
+        await _lkapi.aclose()
+    _lkapi = None
+    _session = None
+    _loop = None
+
+
+def new_call_identity(phone_number: str, call_id: Optional[str] = None) -> tuple:
+    """Return a unique (call_id, room_name, participant_identity) for one call."""
+    call_id = call_id or uuid.uuid4().hex[:12]
+    digits = re.sub(r"\D", "", phone_number) or "unknown"
+    return call_id, f"{ROOM_PREFIX}-{call_id}", f"phone-{digits}-{call_id}"
+
+
+async def dispatch_agent(room_name: str, metadata: str, agent_name: str = AGENT_NAME) -> str:
+    """Dispatch the voice agent into a room and return the dispatch ID."""
+    logger.info(f"Creating dispatch for agent {agent_name} in room {room_name}")
+    dispatch = await get_livekit_api().agent_dispatch.create_dispatch(
+        api.CreateAgentDispatchRequest(agent_name=agent_name, room=room_name, metadata=metadata)
+    )
+    return dispatch.id
+
+
+async def dial_sip_participant(room_name: str, phone_number: str, trunk_id: str, identity: str,
+                               wait_until_answered: bool = False) -> str:
+    """Dial a phone number into a room and return the SIP participant ID."""
+    logger.info(f"Dialing {phone_number} to room {room_name}")
+    sip_participant = await get_livekit_api().sip.create_sip_participant(
+        api.CreateSIPParticipantRequest(
+            room_name=room_name,
+            sip_trunk_id=trunk_id,
+            sip_call_to=phone_number,
+            participant_identity=identity,
+            wait_until_answered=wait_until_answered,
+        )
+    )
+    return sip_participant.participant_id
+
+
+async def start_outbound_call(phone_number: str, trunk_id: str,
+                              agent_name: str = AGENT_NAME, metadata: Optional[str] = None,
+                              wait_until_answered: bool = False) -> CallHandle:
+    """Dispatch the voice agent into a fresh room and dial the phone number into it.
+
+    Every call gets its own room and participant identity, so calls can run
+    in parallel without sharing a room.
+
+    Args:
+        phone_number: Number to dial, in international format.
+        trunk_id: SIP outbound trunk ID.
+        agent_name: Voice agent to dispatch into the room.
+        metadata: Job metadata for the agent (default: the phone number).
+        wait_until_answered: Only return once the callee picks up. Busy and
+            unanswered calls then raise with a sip_status_code in the error metadata.
+
+    Raises:
+        api.TwirpError: If LiveKit rejects the dispatch or the SIP request.
+    """
+    call_id, room_name, identity = new_call_identity(phone_number)
+    dispatch_id = await dispatch_agent(room_name, metadata or phone_number, agent_name)
+    sip_participant_id = await dial_sip_participant(room_name, phone_number, trunk_id, identity,
+                                                    wait_until_answered)
+
+    return CallHandle(
+        call_id=call_id,
+        room_name=room_name,
+        participant_identity=identity,
+        phone_number=phone_number,
+        dispatch_id=dispatch_id,
+        sip_participant_id=sip_participant_id,
+    )
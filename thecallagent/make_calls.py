@@ -3,62 +3,44 @@ import os
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
-from livekit import api
 
 # Load environment variables
 load_dotenv(dotenv_path=Path(__file__).parent / '.env')
 
+from thecallagent.livekit_client import close_livekit_api, start_outbound_call
+
 # Set up logging
 logger = logging.getLogger("make-call")
 logger.setLevel(logging.INFO)
 
 # Configuration
-room_name = "my-room"
-agent_name = "test-agent"
 outbound_trunk_id = os.getenv("SIP_OUTBOUND_TRUNK_ID")
 
 async def make_call(phone_number):
     """Create a dispatch and add a SIP participant to call the phone number"""
-    lkapi = api.LiveKitAPI()
-    
-    # Create agent dispatch
-    logger.info(f"Creating dispatch for agent {agent_name} in room {room_name}")
-    dispatch = await lkapi.agent_dispatch.create_dispatch(
-        api.CreateAgentDispatchRequest(
-            agent_name=agent_name, room=room_name, metadata=phone_number
-        )
-    )
-    logger.info(f"Created dispatch: {dispatch}")
-    
-    # Create SIP participant to make the call
     if not outbound_trunk_id or not outbound_trunk_id.startswith("ST_"):
         logger.error("SIP_OUTBOUND_TRUNK_ID is not set or invalid")
         return
     
-    logger.info(f"Dialing {phone_number} to room {room_name}")
-    
     try:
-        # Create SIP participant to initiate the call
-        sip_participant = await lkapi.sip.create_sip_participant(
-            api.CreateSIPParticipantRequest(
-                room_name=room_name,
-                sip_trunk_id=outbound_trunk_id,
-                sip_call_to=phone_number,
-                participant_identity="phone_user",
-            )
-        )
-        logger.info(f"Created SIP participant: {sip_participant}")
+        # Each call gets its own room, so several calls can be placed at once
+        call = await start_outbound_call(phone_number, outbound_trunk_id)
+        logger.info(f"Created call {call.call_id} in room {call.room_name}")
+        return call
     except Exception as e:
+        # Let callers see the failure instead of reporting a call that never started
         logger.error(f"Error creating SIP participant: {e}")
-    
-    # Close API connection
-    await lkapi.aclose()
+        raise
 
 async def main():
     # Replace with the actual phone number including country code
     phone_number = "+917774931749"  
 
-    await make_call(phone_number)
+    try:
+        await make_call(phone_number)
+    finally:
+        # Close the shared API connection pool
+        await close_livekit_api()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
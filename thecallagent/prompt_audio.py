@@ -0,0 +1,111 @@
+"""
+Disk cache of synthesized audio for fixed call prompts.
+
+Opening lines and other canned phrases sound the same on every call, so they
+are synthesized once, stored as WAV files keyed by TTS provider, model,
+sample rate and text, and then played straight from memory. Only the first
+call that uses a phrase (across all worker processes) waits for TTS.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import wave
+from typing import AsyncIterator, Dict, List, Optional
+
+from livekit import rtc
+from livekit.agents import tts as agents_tts
+
+logger = logging.getLogger("prompt-audio")
+logger.setLevel(logging.INFO)
+
+# Configuration
+PROMPT_AUDIO_DIR = os.getenv("PROMPT_AUDIO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_audio"))
+FRAME_MS = 20
+
+
+class PromptAudioCache:
+    """Synthesize-once audio for canned phrases of one TTS voice."""
+
+    def __init__(self, tts: agents_tts.TTS, cache_dir: str = PROMPT_AUDIO_DIR):
+        self.tts = tts
+        self.cache_dir = cache_dir
+        self.memory: Dict[str, List[rtc.AudioFrame]] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, text: str) -> str:
+        voice = f"{self.tts.provider}|{self.tts.model}|{self.tts.sample_rate}|{self.tts.num_channels}"
+        return hashlib.sha256(f"{voice}|{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def load(self, text: str) -> Optional[List[rtc.AudioFrame]]:
+        """Return cached frames for text from memory or disk, or None if not synthesized yet."""
+        key = self._key(text)
+        if key in self.memory:
+            return self.memory[key]
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        with wave.open(path, "rb") as wav:
+            sample_rate = wav.getframerate()
+            num_channels = wav.getnchannels()
+            pcm = wav.readframes(wav.getnframes())
+
+        # Split into 20 ms frames, the size the audio pipeline works with
+        samples_per_frame = sample_rate * FRAME_MS // 1000
+        bytes_per_frame = samples_per_frame * num_channels * 2
+        frames = []
+        for offset in range(0, len(pcm), bytes_per_frame):
+            chunk = pcm[offset:offset + bytes_per_frame]
+            frames.append(rtc.AudioFrame(chunk, sample_rate, num_channels, len(chunk) // (2 * num_channels)))
+
+        self.memory[key] = frames
+        return frames
+
+    async def get(self, text: str) -> List[rtc.AudioFrame]:
+        """Return frames for text, synthesizing and storing them on a cache miss."""
+        frames = self.load(text)
+        if frames is not None:
+            return frames
+
+        logger.info(f"Synthesizing prompt audio: {text[:60]}")
+        frames = []
+        async with self.tts.synthesize(text) as stream:
+            async for audio in stream:
+                frames.append(audio.frame)
+        if not frames:
+            raise RuntimeError("TTS returned no audio")
+
+        # Write to a temp file first so concurrent workers never read a partial WAV
+        key = self._key(text)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp, wave.open(fp, "wb") as wav:
+                wav.setnchannels(frames[0].num_channels)
+                wav.setsampwidth(2)
+                wav.setframerate(frames[0].sample_rate)
+                for frame in frames:
+                    wav.writeframes(bytes(frame.data))
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.memory[key] = frames
+        return frames
+
+    def preload(self, texts: List[str]) -> int:
+        """Load already-synthesized prompts into memory; returns how many were found."""
+        return sum(1 for text in texts if self.load(text) is not None)
+
+
+async def iter_frames(frames: List[rtc.AudioFrame]) -> AsyncIterator[rtc.AudioFrame]:
+    """Adapt a frame list to the async iterator AgentSession.say() expects."""
+    for frame in frames:
+        yield frame
@@ -1,25 +1,59 @@
 import asyncio
 import os
 import logging
+import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
-from livekit import api
 from mcp.server.fastmcp import FastMCP
 
 # Load environment variables
 load_dotenv(dotenv_path=Path(__file__).parent / '.env')
 
+from thecallagent.livekit_client import close_livekit_api, start_outbound_call
+from thecallagent.call_store import CallStore, room_for_call
+from thecallagent.campaigns import (DEFAULT_CONCURRENCY, DEFAULT_MAX_ATTEMPTS, DEFAULT_PACE_SECONDS,
+                                    DEFAULT_RETRY_DELAY_SECONDS, format_progress, get_store,
+                                    spawn_campaign_runner)
+
+# Helpers shared by the MCP servers live in the top-level common/ directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from telemetry import setup_tracing, traced_tool_call
+from tool_metrics import timed_tool_call
+
 # Set up logging
 logger = logging.getLogger("call-agent-mcp")
 logger.setLevel(logging.INFO)
 
 # Configuration
-ROOM_NAME = "my-room"
-AGENT_NAME = "test-agent"
 OUTBOUND_TRUNK_ID = os.getenv("SIP_OUTBOUND_TRUNK_ID")
 
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Close the shared LiveKit client when the server shuts down."""
+    try:
+        yield
+    finally:
+        await close_livekit_api()
+
+
+class CallAgentMCP(FastMCP):
+    """FastMCP server that traces and records the duration and outcome of every tool call."""
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]):
+        call_tool = super().call_tool
+        meta = self.get_context().request_context.meta
+        return await traced_tool_call(
+            "call_agent", name, meta,
+            lambda: timed_tool_call("call_agent", name, lambda: call_tool(name, arguments)),
+        )
+
+
 # Initialize FastMCP server
-mcp = FastMCP("Call Agent")
+setup_tracing("mcp-call-agent", batch=False)
+mcp = CallAgentMCP("Call Agent", lifespan=lifespan)
 
 @mcp.tool()
 async def make_phone_call(phone_number: str) -> str:
@@ -36,38 +70,115 @@ async def make_phone_call(phone_number: str) -> str:
         logger.error(error_msg)
         return f"Error: {error_msg}"
 
-    lkapi = api.LiveKitAPI()
-    
     try:
-        # 1. Create agent dispatch
-        logger.info(f"Creating dispatch for agent {AGENT_NAME} in room {ROOM_NAME}")
-        dispatch = await lkapi.agent_dispatch.create_dispatch(
-            api.CreateAgentDispatchRequest(
-                agent_name=AGENT_NAME, room=ROOM_NAME, metadata=phone_number
-            )
-        )
-        logger.info(f"Created dispatch: {dispatch}")
-        
-        # 2. Create SIP participant to make the call
-        logger.info(f"Dialing {phone_number} to room {ROOM_NAME}")
+        call = await start_outbound_call(phone_number, OUTBOUND_TRUNK_ID)
+        logger.info(f"Call {call.call_id} started in room {call.room_name}")
         
-        sip_participant = await lkapi.sip.create_sip_participant(
-            api.CreateSIPParticipantRequest(
-                room_name=ROOM_NAME,
-                sip_trunk_id=OUTBOUND_TRUNK_ID,
-                sip_call_to=phone_number,
-                participant_identity="phone_user",
-            )
-        )
-        logger.info(f"Created SIP participant: {sip_participant}")
-        
-        return f"Successfully initiated call to {phone_number}. Dispatch ID: {dispatch.id}, SIP Participant: {sip_participant}"
+        return (f"Successfully initiated call to {phone_number}. Call ID: {call.call_id}, "
+                f"Room: {call.room_name}, Dispatch ID: {call.dispatch_id}, "
+                f"SIP Participant: {call.sip_participant_id}")
 
     except Exception as e:
         logger.error(f"Error making call: {e}")
         return f"Error initiating call: {str(e)}"
-    finally:
-        await lkapi.aclose()
+
+@mcp.tool()
+async def start_call_campaign(calls: List[Dict[str, Any]], name: Optional[str] = None,
+                              concurrency: int = DEFAULT_CONCURRENCY,
+                              pace_seconds: float = DEFAULT_PACE_SECONDS,
+                              max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                              retry_delay_seconds: float = DEFAULT_RETRY_DELAY_SECONDS) -> str:
+    """
+    Starts an outbound call campaign that dials a list of numbers in the background.
+    
+    Args:
+        calls: Numbers to call, each as {"phone_number": "+1234567890", "context": {...}}.
+               The optional context is passed to the voice agent for that call.
+        name: Optional campaign name.
+        concurrency: Maximum number of calls active at the same time (default: 5).
+        pace_seconds: Minimum delay between two dials (default: 1).
+        max_attempts: Attempts per number when the line is busy or unanswered (default: 3).
+        retry_delay_seconds: Delay before the first retry, doubled on each further retry (default: 300).
+    """
+    logger.info(f"Received request to start a campaign with {len(calls)} number(s)")
+    
+    if not OUTBOUND_TRUNK_ID or not OUTBOUND_TRUNK_ID.startswith("ST_"):
+        error_msg = "SIP_OUTBOUND_TRUNK_ID is not set or invalid"
+        logger.error(error_msg)
+        return f"Error: {error_msg}"
+
+    try:
+        campaign_id = get_store().create_campaign(calls, name, concurrency, pace_seconds,
+                                                  max_attempts, retry_delay_seconds)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return f"Error: invalid campaign: {e}"
+
+    # This server process only lives for one tool call, so the campaign runs detached
+    spawn_campaign_runner(campaign_id)
+    return (f"Started campaign {campaign_id} with {len(calls)} number(s). "
+            f"Use get_campaign_status to follow its progress.")
+
+
+@mcp.tool()
+async def get_campaign_status(campaign_id: str, include_calls: bool = False) -> str:
+    """
+    Reports the progress of an outbound call campaign.
+    
+    Args:
+        campaign_id: ID returned by start_call_campaign.
+        include_calls: Also list the state of every number (default: False).
+    """
+    progress = get_store().progress(campaign_id, include_calls)
+    if not progress:
+        return f"Error: campaign {campaign_id} not found"
+    return format_progress(progress)
+
+
+@mcp.tool()
+async def cancel_call_campaign(campaign_id: str) -> str:
+    """
+    Stops dialing new numbers for a campaign. Calls already connected are not hung up.
+    
+    Args:
+        campaign_id: ID returned by start_call_campaign.
+    """
+    store = get_store()
+    campaign = store.get_campaign(campaign_id)
+    if not campaign:
+        return f"Error: campaign {campaign_id} not found"
+    if campaign["status"] in ("completed", "failed", "cancelled"):
+        return f"Campaign {campaign_id} is already {campaign['status']}"
+    store.set_campaign_status(campaign_id, "cancelled")
+    return f"Cancelled campaign {campaign_id}"
+
+@mcp.tool()
+async def get_call_summary(call_id: str, include_transcript: bool = False) -> str:
+    """
+    Returns the summary of a call placed by make_phone_call or a campaign.
+    
+    The summary is updated every few turns while the call is running and is
+    final once the callee hangs up.
+    
+    Args:
+        call_id: Call ID or room name returned when the call was started.
+        include_transcript: Also return the full transcript (default: False).
+    """
+    store = CallStore()
+    room_name = room_for_call(call_id)
+    record = store.get_summary(room_name)
+    if not record:
+        return f"Error: no call found for {call_id}"
+    
+    state = "final" if record["final"] else "in progress"
+    lines = [
+        f"Call {room_name} ({record['phone_number'] or 'unknown number'}), summary {state}:",
+        record["summary"] or "No summary yet.",
+    ]
+    if include_transcript:
+        lines.append("\nTranscript:")
+        for turn in store.transcript(room_name):
+            lines.append(f"{turn['role']}: {turn['text']}")
+    return "\n".join(lines)
 
 if __name__ == "__main__":
     mcp.run()
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import sys
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
@@ -6,8 +7,9 @@ from mcp.client.stdio import stdio_client
 async def run():
     server_params = StdioServerParameters(
         command="uv",
-        args=["run", "server.py"],
-        env=None
+        args=["run", "python", "-m", "thecallagent.server"],
+        env=None,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     )
 
     async with stdio_client(server_params) as (read, write):
@@ -0,0 +1,117 @@
+"""
+Per-turn latency instrumentation for the voice pipeline.
+
+For every agent turn the tracker records how long each stage took, measured
+from the moment the user stopped speaking where the pipeline allows it:
+
+- stt_final: end of user speech -> final transcript
+- end_of_turn: end of user speech -> turn committed (VAD/endpointing delay)
+- llm_first_token: LLM request -> first token
+- tts_first_audio: TTS request -> first audio frame
+- playout_start: end of user speech -> agent audio starts playing
+
+Each sample is observed in a Prometheus histogram (aggregated per worker and
+served on the worker's metrics port) and the per-call p50/p95/p99 are logged
+when the call ends. Job start latency is exported alongside.
+"""
+
+import logging
+import math
+from typing import Dict, List, Optional
+
+from livekit.agents.metrics import EOUMetrics, LLMMetrics, TTSMetrics
+from livekit.agents.voice import AgentStateChangedEvent, MetricsCollectedEvent, UserStateChangedEvent
+from prometheus_client import Histogram
+
+logger = logging.getLogger("turn-metrics")
+logger.setLevel(logging.INFO)
+
+STAGES = ("stt_final", "end_of_turn", "llm_first_token", "tts_first_audio", "playout_start")
+PERCENTILES = (50, 95, 99)
+
+TURN_LATENCY = Histogram(
+    "voice_turn_stage_latency_seconds",
+    "Latency of each voice pipeline stage per agent turn",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+
+JOB_START_LATENCY = Histogram(
+    "voice_job_start_latency_seconds",
+    "Time from job entrypoint to agent session started",
+    ["prewarmed"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0),
+)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class TurnLatencyTracker:
+    """Collects stage latencies for one call from AgentSession events."""
+
+    def __init__(self, room_name: str) -> None:
+        self.room_name = room_name
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.turn: Dict[str, float] = {}
+        self.turns = 0
+        self.user_speech_ended: Optional[float] = None
+
+    def _record(self, stage: str, seconds: float) -> None:
+        if seconds is None or seconds < 0:
+            return
+        self.turn[stage] = seconds
+        self.samples[stage].append(seconds)
+        TURN_LATENCY.labels(stage=stage).observe(seconds)
+
+    def on_user_state_changed(self, event: UserStateChangedEvent) -> None:
+        if event.old_state == "speaking" and event.new_state != "speaking":
+            self.user_speech_ended = event.created_at
+
+    def on_metrics_collected(self, event: MetricsCollectedEvent) -> None:
+        m = event.metrics
+        if isinstance(m, EOUMetrics):
+            self._record("stt_final", m.transcription_delay)
+            self._record("end_of_turn", m.end_of_utterance_delay)
+        elif isinstance(m, LLMMetrics) and not m.cancelled:
+            self._record("llm_first_token", m.ttft)
+        elif isinstance(m, TTSMetrics) and not m.cancelled:
+            self._record("tts_first_audio", m.ttfb)
+
+    def on_agent_state_changed(self, event: AgentStateChangedEvent) -> None:
+        if event.new_state != "speaking":
+            return
+        if self.user_speech_ended is not None:
+            self._record("playout_start", event.created_at - self.user_speech_ended)
+            self.user_speech_ended = None
+
+        if self.turn:
+            self.turns += 1
+            stages = ", ".join(f"{stage}={self.turn[stage] * 1000:.0f}ms" for stage in STAGES if stage in self.turn)
+            logger.info(f"Turn {self.turns} latency in {self.room_name}: {stages}")
+            self.turn = {}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage p50/p95/p99 (seconds) and sample counts for this call."""
+        result = {}
+        for stage, samples in self.samples.items():
+            if samples:
+                result[stage] = {f"p{pct}": percentile(samples, pct) for pct in PERCENTILES}
+                result[stage]["count"] = len(samples)
+        return result
+
+    async def log_summary(self) -> None:
+        """Shutdown callback: log the call's latency percentiles."""
+        summary = self.summary()
+        if not summary:
+            logger.info(f"No turn latencies recorded for {self.room_name}")
+            return
+        for stage, values in summary.items():
+            logger.info(
+                f"Call {self.room_name} {stage}: p50={values['p50'] * 1000:.0f}ms "
+                f"p95={values['p95'] * 1000:.0f}ms p99={values['p99'] * 1000:.0f}ms (n={values['count']})"
+            )